@@ -1,130 +1,856 @@
 import os
 import logging
 import math
-from dotenv import load_dotenv
-from flask import Flask, render_template, request, redirect, url_for, flash
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import UserMixin, LoginManager, login_user, logout_user, login_required, current_user
+import time
+import threading
+import csv
+import io
+import click
+import re
+import hmac
+import bisect
+import functools
+from collections import Counter
+from flask import Flask, Blueprint, render_template, request, redirect, url_for, flash, abort, Response, stream_with_context, has_request_context, g, session, current_app
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_bcrypt import Bcrypt
-from datetime import datetime, date, timedelta
-from sqlalchemy import func, or_
-from flask_migrate import Migrate
+from datetime import datetime, date, timedelta, timezone
+from sqlalchemy import func, or_, and_, insert, update, delete, case, event, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import joinedload, Session as SessionBase
 from werkzeug.utils import secure_filename
+# modelos carga el .env antes de definir las tablas
+from modelos import (db, configurar_base, Usuario, Cliente, Prestamo, Cuota, ResumenPrestamo, Recordatorio,
+                     Configuracion, config_cache)
 
 
-load_dotenv()
-
 # --- CONFIGURACIÓN INICIAL ---
-app = Flask(__name__)
-
-# --- Clave Secreta Fija (para que no te desloguee) ---
-# Recuerda generar la tuya con: python -c 'import secrets; print(secrets.token_hex(16))'
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'una_clave_por_defecto_para_desarrollo')
-app.config['UPLOAD_FOLDER'] = 'static/uploads'
-app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif', 'svg'}
+# crear_app() la lee del entorno y la copia en app.config. La conexión a la base de datos (DB_*)
+# la lee configurar_base, en modelos/base.py.
+def configuracion_desde_entorno():
+    return {
+        # --- Clave Secreta Fija (para que no te desloguee) ---
+        # Recuerda generar la tuya con: python -c 'import secrets; print(secrets.token_hex(16))'
+        'SECRET_KEY': os.environ.get('SECRET_KEY', 'una_clave_por_defecto_para_desarrollo'),
+        'UPLOAD_FOLDER': 'static/uploads',
+        'ALLOWED_EXTENSIONS': {'png', 'jpg', 'jpeg', 'gif', 'svg'},
+        # Segundos que un usuario sigue leyendo de la principal después de escribir, para que vea su
+        # propio pago aunque la réplica vaya atrasada
+        'DB_REPLICA_RETRASO_MAXIMO': int(os.environ.get('DB_REPLICA_RETRASO_MAXIMO', 10)),
+        # Segundos que cada proceso confía en el usuario autenticado que Flask-Login carga en cada
+        # petición antes de revisar si cambió (el de Configuracion es CONFIG_CACHE_TTL, en modelos).
+        'USER_CACHE_TTL': int(os.environ.get('USER_CACHE_TTL', 30)),
+        # Consulta pública /estado: caché de la página y límite de consultas por IP
+        'ESTADO_CACHE_TTL': int(os.environ.get('ESTADO_CACHE_TTL', 300)),
+        'ESTADO_CONSULTAS_POR_MINUTO': int(os.environ.get('ESTADO_CONSULTAS_POR_MINUTO', 6)),
+        'ESTADO_RAFAGA': int(os.environ.get('ESTADO_RAFAGA', 5)),
+        # Cuántos proxies (Vercel, nginx) agregan X-Forwarded-For delante de la app; 0 = usar la IP directa
+        'PROXIES_DE_CONFIANZA': int(os.environ.get('PROXIES_DE_CONFIANZA', 0)),
+        # Instrumentación SQL por petición: consultas máximas por ruta antes de avisar en el log y cuántas
+        # veces puede repetirse la misma sentencia (N+1). En modo estricto (pruebas) se lanza una excepción.
+        'SQL_PRESUPUESTO_CONSULTAS': int(os.environ.get('SQL_PRESUPUESTO_CONSULTAS', 15)),
+        'SQL_MAX_REPETICIONES': int(os.environ.get('SQL_MAX_REPETICIONES', 5)),
+        'SQL_MODO_ESTRICTO': os.environ.get('SQL_MODO_ESTRICTO', '').lower() in ('1', 'true', 'si'),
+        # Token para que Prometheus lea /admin/metrics sin sesión (Authorization: Bearer <token>)
+        'METRICS_TOKEN': os.environ.get('METRICS_TOKEN'),
+    }
 
 def allowed_file(filename):
     return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+           filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
+
+
+# --- MÉTRICAS (FORMATO PROMETHEUS) ---
+# Contadores e histogramas en memoria de cada proceso, expuestos en /admin/metrics. Registrar
+# un valor es un incremento con un lock; los acumulados de los histogramas se calculan al leer.
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_ESPERA_POOL = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._definiciones = {} # nombre -> (tipo, ayuda, buckets)
+        self._valores = {} # (nombre, etiquetas) -> número o [conteos por bucket, suma, total]
+        self._lock = threading.Lock()
+
+    def declarar(self, nombre, tipo, ayuda, buckets=None):
+        self._definiciones[nombre] = (tipo, ayuda, buckets)
+
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def observar(self, nombre, valor, **etiquetas):
+        buckets = self._definiciones[nombre][2]
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        posicion = bisect.bisect_left(buckets, valor)
+        with self._lock:
+            serie = self._valores.get(clave)
+            if serie is None:
+                serie = self._valores[clave] = [[0] * (len(buckets) + 1), 0.0, 0]
+            serie[0][posicion] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exponer(self, adicionales=()):
+        """ Texto en formato de exposición de Prometheus; `adicionales` son (nombre, tipo, ayuda, valor) ya calculados. """
+        with self._lock:
+            valores = {clave: (list(v[0]), v[1], v[2]) if isinstance(v, list) else v for clave, v in self._valores.items()}
+        lineas = []
+        for nombre, (tipo, ayuda, buckets) in self._definiciones.items():
+            lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+            for (serie, etiquetas), valor in sorted(valores.items()):
+                if serie != nombre:
+                    continue
+                if tipo != 'histogram':
+                    lineas.append(f"{nombre}{_etiquetas_prometheus(etiquetas)} {valor}")
+                    continue
+                conteos, suma, total = valor
+                acumulado = 0
+                for limite, conteo in zip(list(buckets) + ['+Inf'], conteos):
+                    acumulado += conteo
+                    lineas.append(f"{nombre}_bucket{_etiquetas_prometheus(etiquetas + (('le', limite),))} {acumulado}")
+                lineas.append(f"{nombre}_sum{_etiquetas_prometheus(etiquetas)} {suma}")
+                lineas.append(f"{nombre}_count{_etiquetas_prometheus(etiquetas)} {total}")
+        for nombre, tipo, ayuda, series in adicionales:
+            lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+            lineas += [f"{nombre}{_etiquetas_prometheus(tuple(etiquetas.items()))} {valor}" for etiquetas, valor in series]
+        return "\n".join(lineas) + "\n"
+
+
+def _etiquetas_prometheus(etiquetas):
+    if not etiquetas:
+        return ''
+    texto = ','.join('{}="{}"'.format(clave, str(valor).replace('\\', '\\\\').replace('"', '\\"')) for clave, valor in etiquetas)
+    return '{' + texto + '}'
+
+
+registro_metricas = RegistroMetricas()
+registro_metricas.declarar('prestapp_http_peticiones_segundos', 'histogram',
+                  'Duración de las peticiones por endpoint de Flask.', BUCKETS_LATENCIA)
+registro_metricas.declarar('prestapp_http_respuestas_total', 'counter', 'Respuestas por endpoint y código HTTP.')
+registro_metricas.declarar('prestapp_db_pool_espera_segundos', 'histogram',
+                  'Tiempo para obtener una conexión del pool (incluye abrir una nueva).', BUCKETS_ESPERA_POOL)
+registro_metricas.declarar('prestapp_pagos_registrados_total', 'counter', 'Cuotas marcadas como pagadas (confirmadas en la BD).')
+registro_metricas.declarar('prestapp_prestamos_creados_total', 'counter', 'Préstamos creados (confirmados en la BD).')
+registro_metricas.declarar('prestapp_peticiones_replica_total', 'counter', 'Peticiones atendidas leyendo de la réplica.')
+
+
+class PoolMedido(QueuePool):
+    """ QueuePool que mide cuánto espera cada petición por una conexión. """
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            registro_metricas.observar('prestapp_db_pool_espera_segundos', time.perf_counter() - inicio)
 
 
-# --- Conexión a la Base de Datos de Hostinger ---
-DB_USER = os.environ.get('DB_USER')
-DB_PASS = os.environ.get('DB_PASS')
-DB_HOST = os.environ.get('DB_HOST')
-DB_NAME = os.environ.get('DB_NAME')
+# --- INICIALIZACIÓN DE COMPONENTES ---
+# Se crean sin app; crear_app() los inicializa. Flask-Migrate (y con él alembic) solo se carga
+# cuando la app la levanta la CLI de Flask (ver crear_app).
+bcrypt = Bcrypt()
+login_manager = LoginManager()
+login_manager.login_view = 'login'
+login_manager.login_message = 'Por favor, inicia sesión para acceder a esta página.'
+login_manager.login_message_category = 'warning'
 
-# Construimos la cadena de conexión solo si todas las variables existen
-if not all([DB_USER, DB_PASS, DB_HOST, DB_NAME]):
-    raise ValueError("Faltan variables de entorno para la base de datos. Asegúrate de configurar el archivo .env")
 
-app.config['SQLALCHEMY_DATABASE_URI'] = f"mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME}"
+class RutasPrestApp(Blueprint):
+    """
+    Blueprint que registra las rutas con su nombre simple ('login' y no 'prestapp.login'),
+    así url_for, las plantillas y request.endpoint siguen igual que con @app.route.
+    """
 
-# Evita el "MySQL server has gone away" (Internal Server Error que se soluciona al refrescar):
-# pool_pre_ping verifica la conexión antes de usarla y reconecta si el servidor la cerró;
-# pool_recycle la renueva antes de que Hostinger la cierre por inactividad.
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    'pool_pre_ping': True,
-    'pool_recycle': 280,
-}
+    def add_url_rule(self, rule, endpoint=None, view_func=None, provide_automatic_options=None, **options):
+        endpoint = endpoint or view_func.__name__
+        self.record(lambda estado: estado.app.add_url_rule(
+            rule, endpoint, view_func, provide_automatic_options=provide_automatic_options, **options))
 
 
-# --- INICIALIZACIÓN DE COMPONENTES ---
-db = SQLAlchemy(app)
-migrate = Migrate(app, db) # Objeto para las migraciones
-bcrypt = Bcrypt(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
-login_manager.login_message = 'Por favor, inicia sesión para acceder a esta página.'
-login_manager.login_message_category = 'warning'
-logging.basicConfig(level=logging.INFO)
+# Rutas, hooks de petición y comandos de la CLI (cli_group=None: "flask crear-base", sin prefijo)
+rutas = RutasPrestApp('prestapp', __name__, cli_group=None)
+
+
+@rutas.cli.command('crear-base')
+def crear_base_comando():
+    """ Crea todas las tablas en una base vacía y la marca como migrada: flask crear-base """
+    from flask_migrate import stamp
+    db.create_all()
+    stamp() # Las migraciones existentes asumen tablas creadas antes; la base nueva ya está al día
+    print(f"Base de datos lista en {db.engine.url.render_as_string(hide_password=True)}.")
+
+
+@rutas.cli.command('copiar-replica')
+def copiar_replica_comando():
+    """ Copia la base SQLite principal sobre la réplica (hace las veces de replicación en local): flask copiar-replica """
+    import sqlite3
+    if current_app.config['DB_ENGINE'] != 'sqlite' or not current_app.config['DB_REPLICA_CONFIGURADA']:
+        raise click.ClickException("Solo aplica con DB_ENGINE=sqlite y DB_REPLICA_SQLITE_PATH configurado.")
+    destino_ruta = current_app.config['DB_REPLICA_SQLITE_PATH']
+    origen, destino = sqlite3.connect(current_app.config['DB_SQLITE_PATH']), sqlite3.connect(destino_ruta)
+    try:
+        origen.backup(destino) # Copia consistente aunque la app esté escribiendo
+    finally:
+        origen.close()
+        destino.close()
+    print(f"Réplica actualizada: {destino_ruta}")
+
 
-# --- MODELOS DE BASE DE DATOS ---
 @login_manager.user_loader
 def load_user(user_id):
-    return Usuario.query.get(int(user_id))
+    return usuarios_cache.obtener(int(user_id))
+
+
+# --- MOTOR DE CUOTAS (CRONOGRAMA COMPARTIDO) ---
+# Todas las rutas que generan cuotas (crear, prestamo_para_cliente, reestructurar, importar)
+# calculan fechas y montos aquí, en una sola pasada, y las guardan con un único
+# INSERT masivo en lugar de un objeto Cuota + db.session.add por cada cuota.
+
+CUOTAS_POR_MES = {'diaria': 26, 'semanal': 4, 'quincenal': 2, 'mensual': 1}
+DIAS_ENTRE_CUOTAS = {'semanal': 7, 'quincenal': 15, 'mensual': 30} # 'mensual' es una aproximación simple
+
+
+def dias_de_cobro(cobrar_sabado, cobrar_domingo):
+    """ Días de la semana (0=lunes) en los que se cobra una cuota diaria. """
+    dias = [0, 1, 2, 3, 4]
+    if cobrar_sabado: dias.append(5)
+    if cobrar_domingo: dias.append(6)
+    return dias
+
+
+# --- CALENDARIO DE COBRO ---
+# Los días de cobro de cada política (sábado, domingo, festivos) se precalculan una vez como
+# una lista ordenada de ordinales; "el n-ésimo día de cobro desde X" y "cuántos días de cobro
+# hay entre A y B" son búsquedas binarias sobre esa lista.
+
+def _domingo_de_pascua(anio):
+    """ Algoritmo de Meeus/Jones/Butcher (calendario gregoriano). """
+    a, b, c = anio % 19, anio // 100, anio % 100
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes, dia = divmod(h + l - 7 * m + 114, 31)
+    return date(anio, mes, dia + 1)
+
+
+def _al_lunes(fecha):
+    """ Ley Emiliani: el festivo se traslada al lunes siguiente si no cae en lunes. """
+    return fecha + timedelta(days=(7 - fecha.weekday()) % 7)
+
+
+@functools.lru_cache(maxsize=None)
+def festivos_colombia(anio):
+    """ Festivos nacionales de Colombia (Ley 51 de 1983) del año. """
+    pascua = _domingo_de_pascua(anio)
+    fijos = [date(anio, 1, 1), date(anio, 5, 1), date(anio, 7, 20), date(anio, 8, 7),
+             date(anio, 12, 8), date(anio, 12, 25),
+             pascua - timedelta(days=3), pascua - timedelta(days=2)] # Jueves y Viernes Santo
+    trasladables = [date(anio, 1, 6), date(anio, 3, 19), date(anio, 6, 29), date(anio, 8, 15),
+                    date(anio, 10, 12), date(anio, 11, 1), date(anio, 11, 11),
+                    pascua + timedelta(days=39), pascua + timedelta(days=60), pascua + timedelta(days=68)] # Ascensión, Corpus, Sagrado Corazón
+    return frozenset(fijos + [_al_lunes(fecha) for fecha in trasladables])
+
+
+def es_festivo(fecha):
+    return fecha in festivos_colombia(fecha.year)
+
+
+class CalendarioCobro:
+    MARGEN_ANIOS = 10 # cuánto se extiende la lista cuando una consulta se sale del rango calculado
+
+    def __init__(self, cobrar_sabado, cobrar_domingo, saltar_festivos):
+        self.dias_semana = frozenset(dias_de_cobro(cobrar_sabado, cobrar_domingo))
+        self.saltar_festivos = saltar_festivos
+        self._tabla = (0, 0, []) # (primer ordinal, último ordinal, ordinales de los días de cobro)
+        self._lock = threading.Lock()
+
+    def _cubrir(self, desde, hasta):
+        """ Devuelve la tabla asegurando que cubra [desde, hasta] (ordinales). """
+        tabla = self._tabla
+        if tabla[0] <= desde and hasta <= tabla[1]:
+            return tabla
+        with self._lock:
+            inicio, fin, _ = self._tabla
+            if not (inicio <= desde and hasta <= fin):
+                anio_inicio = date.fromordinal(min(desde, inicio) if inicio else desde).year - 1
+                anio_fin = date.fromordinal(max(hasta, fin)).year + self.MARGEN_ANIOS
+                inicio, fin = date(anio_inicio, 1, 1).toordinal(), date(anio_fin, 12, 31).toordinal()
+                dias = [ordinal for ordinal in range(inicio, fin + 1) if self._es_dia_de_cobro(date.fromordinal(ordinal))]
+                self._tabla = (inicio, fin, dias)
+            return self._tabla
+
+    def _es_dia_de_cobro(self, fecha):
+        return fecha.weekday() in self.dias_semana and not (self.saltar_festivos and es_festivo(fecha))
+
+    def es_dia_de_cobro(self, fecha):
+        return self._es_dia_de_cobro(fecha)
+
+    def siguientes(self, desde, cantidad):
+        """ Los `cantidad` días de cobro a partir de `desde` (incluido si es día de cobro). """
+        if cantidad <= 0:
+            return []
+        ordinal = desde.toordinal()
+        # Al menos 5 días de cobro por semana, menos ~18 festivos al año: 7 días de margen por cada 4 de cobro
+        _, _, dias = self._cubrir(ordinal, ordinal + cantidad * 7 // 4 + 30)
+        posicion = bisect.bisect_left(dias, ordinal)
+        return [date.fromordinal(o) for o in dias[posicion:posicion + cantidad]]
+
+    def contar(self, desde, hasta):
+        """ Días de cobro en el rango (desde, hasta]. """
+        if hasta <= desde:
+            return 0
+        _, _, dias = self._cubrir(desde.toordinal(), hasta.toordinal())
+        return bisect.bisect_right(dias, hasta.toordinal()) - bisect.bisect_right(dias, desde.toordinal())
+
+
+_calendarios = {}
+
+
+def calendario_cobro(cobrar_sabado, cobrar_domingo, saltar_festivos=False):
+    """ Calendario compartido (uno por política) que usan todos los generadores de cronogramas. """
+    politica = (bool(cobrar_sabado), bool(cobrar_domingo), bool(saltar_festivos))
+    calendario = _calendarios.get(politica)
+    if calendario is None:
+        calendario = _calendarios.setdefault(politica, CalendarioCobro(*politica))
+    return calendario
+
+
+def contar_dias_cobro(desde, hasta, cobrar_sabado, cobrar_domingo, saltar_festivos=False):
+    """ Cuenta los días de cobro en el rango (desde, hasta]. """
+    return calendario_cobro(cobrar_sabado, cobrar_domingo, saltar_festivos).contar(desde, hasta)
+
+
+def calcular_fechas_cuotas(fecha_primera, numero_cuotas, frecuencia, cobrar_sabado, cobrar_domingo,
+                           saltar_festivos=False):
+    """
+    Devuelve las fechas de vencimiento de `numero_cuotas` cuotas a partir de `fecha_primera`.
+    Las cuotas diarias caen en días de cobro consecutivos (saltando sábado/domingo y festivos
+    según el préstamo); las demás frecuencias avanzan un número fijo de días y, si se saltan
+    festivos, una cuota que cae en festivo pasa al siguiente día de cobro.
+    """
+    if numero_cuotas <= 0:
+        return []
+
+    calendario = calendario_cobro(cobrar_sabado, cobrar_domingo, saltar_festivos)
+    if frecuencia != 'diaria':
+        paso = timedelta(days=DIAS_ENTRE_CUOTAS.get(frecuencia, 1))
+        fechas = [fecha_primera + paso * i for i in range(numero_cuotas)]
+        if saltar_festivos:
+            fechas = [calendario.siguientes(fecha, 1)[0] if es_festivo(fecha) else fecha for fecha in fechas]
+        return fechas
+
+    return calendario.siguientes(fecha_primera, numero_cuotas)
+
+
+def calcular_montos_cuotas(total_a_pagar, numero_cuotas, valor_cuota):
+    """
+    N-1 cuotas de `valor_cuota` y una última cuota de ajuste con el saldo restante.
+    Si el ajuste no es positivo, la última cuota se omite.
+    """
+    if numero_cuotas <= 0 or valor_cuota <= 0:
+        return []
+    montos = [valor_cuota] * (numero_cuotas - 1)
+    ultima_cuota_valor = total_a_pagar - valor_cuota * (numero_cuotas - 1)
+    if ultima_cuota_valor > 0:
+        montos.append(ultima_cuota_valor)
+    return montos
+
+
+def generar_cronograma(total_a_pagar, numero_cuotas, valor_cuota, fecha_primera, frecuencia,
+                       cobrar_sabado, cobrar_domingo, saltar_festivos=False):
+    """
+    Lista de (fecha_vencimiento, monto_cuota) del plan de pagos completo. La última cuota
+    es de ajuste (ver calcular_montos_cuotas), así que las cuotas suman exactamente el total;
+    antes de este motor crear_prestamo repetía el valor redondeado y el total podía quedar
+    unos centavos por encima o por debajo.
+    """
+    numero_cuotas = int(numero_cuotas)
+    montos = calcular_montos_cuotas(total_a_pagar, numero_cuotas, valor_cuota)
+    fechas = calcular_fechas_cuotas(fecha_primera, len(montos), frecuencia, cobrar_sabado, cobrar_domingo,
+                                    saltar_festivos)
+    return list(zip(fechas, montos))
+
+
+def planificar_cuotas(total_a_pagar, plazo, frecuencia, fecha_inicio, cobrar_sabado, cobrar_domingo, cuota_manual=0,
+                      saltar_festivos=False):
+    """
+    Cronograma de un préstamo nuevo: con `cuota_manual` el número de cuotas sale del valor
+    de la cuota; si no, se sugiere una cuota redondeada a miles según el plazo y la frecuencia.
+    La primera cuota vence un periodo después de la fecha de inicio.
+    """
+    numero_cuotas = 0
+    if frecuencia == 'diaria':
+        numero_cuotas = contar_dias_cobro(fecha_inicio, fecha_inicio + timedelta(days=plazo * 30),
+                                          cobrar_sabado, cobrar_domingo, saltar_festivos)
+    elif frecuencia in CUOTAS_POR_MES:
+        numero_cuotas = plazo * CUOTAS_POR_MES[frecuencia]
+
+    valor_cuota_final = 0
+    if cuota_manual and cuota_manual > 0:
+        valor_cuota_final = cuota_manual
+        numero_cuotas = math.ceil(total_a_pagar / valor_cuota_final)
+    elif numero_cuotas > 0:
+        valor_cuota_sugerida = total_a_pagar / numero_cuotas
+        valor_cuota_final = math.ceil(valor_cuota_sugerida / 1000) * 1000
+
+    if numero_cuotas <= 0 or valor_cuota_final <= 0:
+        return []
+    fecha_primera_cuota = fecha_inicio + timedelta(days=DIAS_ENTRE_CUOTAS.get(frecuencia, 1))
+    return generar_cronograma(total_a_pagar, numero_cuotas, valor_cuota_final,
+                              fecha_primera_cuota, frecuencia, cobrar_sabado, cobrar_domingo, saltar_festivos)
+
+
+MAX_PLAZO_SIMULADOR = 60 # meses
+MAX_CUOTAS_SIMULADOR = 2000
+MAX_MONTO_SIMULADOR = 10 ** 12 # pesos; muy por encima de cualquier préstamo real
+# Cuántas cotizaciones distintas guarda cada proceso (LRU); el tamaño se fija al definir la función
+SIMULADOR_CACHE_ENTRADAS = int(os.environ.get('SIMULADOR_CACHE_ENTRADAS', 1024))
+
+
+@functools.lru_cache(maxsize=SIMULADOR_CACHE_ENTRADAS)
+def cotizar_prestamo(monto, interes, plazo, frecuencia, cobrar_sabado, cobrar_domingo, saltar_festivos,
+                     fecha_inicio, cuota_manual=0):
+    """
+    (total_a_pagar, cronograma) que generaría prestamo_para_cliente, sin guardar nada.
+    El resultado solo depende de los argumentos, así que se memoriza con ellos como clave;
+    el cronograma es una tupla para que nadie modifique la copia en caché.
+    """
+    total_a_pagar = monto * (1 + (interes / 100) * plazo)
+    cronograma = planificar_cuotas(total_a_pagar, plazo, frecuencia, fecha_inicio,
+                                   cobrar_sabado, cobrar_domingo, cuota_manual, saltar_festivos)
+    return total_a_pagar, tuple(cronograma)
+
+
+def guardar_cronograma(prestamo_id, cronograma):
+    """ Inserta todas las cuotas del cronograma con un solo INSERT masivo (executemany). """
+    if not cronograma:
+        return
+    db.session.execute(insert(Cuota), [
+        {'prestamo_id': prestamo_id, 'monto_cuota': monto, 'fecha_vencimiento': fecha, 'estado': 'pendiente'}
+        for fecha, monto in cronograma
+    ])
+
+
+# --- RESUMEN POR PRÉSTAMO ---
+# Cada ruta que cambia cuotas llama a actualizar_resumen_prestamo antes de su commit,
+# así los dashboards leen una fila por préstamo en lugar de recorrer todas sus cuotas.
+
+ESTADOS_PAGADOS = ['pagada', 'pagada_tarde']
+
+
+def _columnas_resumen():
+    """ Agregados de cuota que alimentan ResumenPrestamo (usados por préstamo y en la reconstrucción). """
+    return (
+        func.coalesce(func.sum(case((Cuota.estado.in_(ESTADOS_PAGADOS), Cuota.monto_cuota), else_=0)), 0),
+        func.count(case((Cuota.estado.in_(ESTADOS_PAGADOS), Cuota.id), else_=None)),
+        func.count(case((Cuota.estado == 'pendiente', Cuota.id), else_=None)),
+        func.min(case((Cuota.estado == 'pendiente', Cuota.fecha_vencimiento), else_=None), type_=db.Date),
+    )
+
+
+def totales_prestamo(prestamo_id):
+    """ (total_pagado, cuotas_pagadas, cuotas_pendientes, proxima_fecha) desde las cuotas. Solo lee. """
+    return db.session.query(*_columnas_resumen()).filter(Cuota.prestamo_id == prestamo_id).one()
+
+
+def actualizar_resumen_prestamo(prestamo_id):
+    """ Recalcula el resumen de un préstamo con un solo agregado. No hace commit. """
+    marcar_prestamo_modificado(prestamo_id)
+    db.session.flush()
+    total_pagado, cuotas_pagadas, cuotas_pendientes, proxima_fecha = totales_prestamo(prestamo_id)
+    monto_total = db.session.query(Prestamo.monto_total_a_pagar).filter_by(id=prestamo_id).scalar() or 0
+
+    resumen = db.session.get(ResumenPrestamo, prestamo_id)
+    if not resumen:
+        resumen = ResumenPrestamo(prestamo_id=prestamo_id)
+        db.session.add(resumen)
+    resumen.total_pagado = total_pagado
+    resumen.saldo_pendiente = monto_total - total_pagado
+    resumen.cuotas_pagadas = cuotas_pagadas
+    resumen.cuotas_pendientes = cuotas_pendientes
+    resumen.proxima_fecha_vencimiento = proxima_fecha
+    resumen.fecha_actualizacion = datetime.utcnow()
+    return resumen
+
+
+def reconstruir_resumenes():
+    """ Borra y recalcula todos los resúmenes desde las cuotas con un INSERT ... SELECT. No hace commit. """
+    total_pagado, cuotas_pagadas, cuotas_pendientes, proxima_fecha = _columnas_resumen()
+    seleccion = db.session.query(
+        Prestamo.id,
+        total_pagado,
+        Prestamo.monto_total_a_pagar - total_pagado,
+        cuotas_pagadas,
+        cuotas_pendientes,
+        proxima_fecha,
+        func.now(),
+    ).outerjoin(Cuota, Cuota.prestamo_id == Prestamo.id).group_by(Prestamo.id, Prestamo.monto_total_a_pagar)
+
+    db.session.execute(ResumenPrestamo.__table__.delete())
+    db.session.execute(insert(ResumenPrestamo).from_select(
+        ['prestamo_id', 'total_pagado', 'saldo_pendiente', 'cuotas_pagadas',
+         'cuotas_pendientes', 'proxima_fecha_vencimiento', 'fecha_actualizacion'],
+        seleccion.statement))
+    return db.session.query(func.count(ResumenPrestamo.prestamo_id)).scalar()
+
+
+@rutas.cli.command('reconstruir-resumenes')
+def reconstruir_resumenes_comando():
+    """ Recalcula la tabla resumen_prestamo desde las cuotas: flask reconstruir-resumenes """
+    total = reconstruir_resumenes()
+    db.session.commit()
+    print(f"Resúmenes reconstruidos para {total} préstamos.")
+
+
+# --- CACHÉ DE USUARIOS (load_user) ---
+# Flask-Login carga el usuario en cada petición autenticada. Guardamos una copia
+# desconectada de la sesión por id; al vencer el TTL solo consultamos su columna
+# 'version' y lo recargamos completo si cambió (o lo descartamos si ya no existe).
+# Las rutas que modifican usuarios llaman a invalidar(), que sube la versión; la copia local
+# se borra al hacer commit (si se borrara antes, otra petición podría recargar la fila vieja y
+# servirla todo el TTL). Los demás procesos lo notan en su siguiente revisión.
+
+class CacheUsuarios:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._usuarios = {} # id -> (usuario, version, vence)
+        self._lock = threading.Lock()
+
+    def _cargar(self, usuario_id):
+        usuario = db.session.get(Usuario, usuario_id)
+        if usuario is None:
+            return None
+        db.session.expunge(usuario) # La copia sobrevive a la sesión de esta petición
+        with self._lock:
+            self._usuarios[usuario_id] = (usuario, usuario.version, time.monotonic() + self.ttl)
+        return usuario
+
+    def obtener(self, usuario_id):
+        with self._lock:
+            entrada = self._usuarios.get(usuario_id)
+        if entrada is None:
+            return self._cargar(usuario_id)
+
+        usuario, version, vence = entrada
+        if time.monotonic() < vence:
+            return usuario
+
+        version_actual = db.session.query(Usuario.version).filter_by(id=usuario_id).scalar()
+        if version_actual is None:
+            self.descartar(usuario_id)
+            return None
+        if version_actual != version:
+            return self._cargar(usuario_id)
+        with self._lock:
+            self._usuarios[usuario_id] = (usuario, version, time.monotonic() + self.ttl)
+        return usuario
+
+    def descartar(self, usuario_id):
+        with self._lock:
+            self._usuarios.pop(usuario_id, None)
+
+    def invalidar(self, usuario):
+        """ Sube la versión del usuario en la transacción actual; la copia local se descarta al hacer commit. """
+        usuario.version = (usuario.version or 0) + 1
+        db.session.info.setdefault('usuarios_modificados', set()).add(usuario.id)
+
+
+usuarios_cache = CacheUsuarios(ttl=0) # crear_app() pone USER_CACHE_TTL
+
+
+# --- CACHÉ Y LÍMITE DE LA CONSULTA PÚBLICA (/estado) ---
+# La página de estado se guarda ya renderizada por cédula. Cuando una transacción que tocó
+# cuotas de un préstamo (o los datos de su cliente) hace commit, se borra su entrada (ver
+# marcar_prestamo_modificado); en otros procesos la entrada dura como máximo ESTADO_CACHE_TTL segundos.
+
+class CacheEstado:
+    def __init__(self, ttl, max_entradas=5000):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._paginas = {} # (cedula, fecha) -> (prestamo_id, html, vence)
+        self._claves_por_prestamo = {} # prestamo_id -> set de claves
+        self._lock = threading.Lock()
+
+    def obtener(self, cedula):
+        clave = (cedula, date.today()) # "Atrasada" depende del día
+        with self._lock:
+            entrada = self._paginas.get(clave)
+            if entrada and time.monotonic() < entrada[2]:
+                return entrada[1]
+        return None
+
+    def guardar(self, cedula, prestamo_id, html):
+        clave = (cedula, date.today())
+        with self._lock:
+            if len(self._paginas) >= self.max_entradas:
+                self._paginas.clear()
+                self._claves_por_prestamo.clear()
+            self._paginas[clave] = (prestamo_id, html, time.monotonic() + self.ttl)
+            self._claves_por_prestamo.setdefault(prestamo_id, set()).add(clave)
+
+    def invalidar_prestamos(self, prestamo_ids):
+        with self._lock:
+            for prestamo_id in prestamo_ids:
+                for clave in self._claves_por_prestamo.pop(prestamo_id, ()):
+                    self._paginas.pop(clave, None)
+
+    def invalidar_cedulas(self, cedulas):
+        """ Para los UPDATE masivos de clientes, que no pasan por before_flush. """
+        cedulas = set(cedulas)
+        with self._lock:
+            for clave in [clave for clave in self._paginas if clave[0] in cedulas]:
+                self._paginas.pop(clave)
+
+
+class LimitadorPorIP:
+    """ Cubeta de fichas por IP: `rafaga` consultas seguidas y luego `por_minuto` sostenidas. """
+
+    def __init__(self, por_minuto, rafaga, max_ips=10000):
+        self.tasa = por_minuto / 60.0
+        self.rafaga = rafaga
+        self.max_ips = max_ips
+        self._cubetas = {} # ip -> (fichas, ultimo)
+        self._lock = threading.Lock()
+
+    def permitir(self, ip):
+        ahora = time.monotonic()
+        with self._lock:
+            if len(self._cubetas) >= self.max_ips:
+                # Olvidamos las IPs que ya recuperaron todas sus fichas
+                self._cubetas = {k: v for k, v in self._cubetas.items()
+                                 if v[0] + (ahora - v[1]) * self.tasa < self.rafaga}
+            fichas, ultimo = self._cubetas.get(ip, (self.rafaga, ahora))
+            fichas = min(self.rafaga, fichas + (ahora - ultimo) * self.tasa)
+            permitido = fichas >= 1
+            self._cubetas[ip] = (fichas - 1 if permitido else fichas, ahora)
+            return permitido
+
+
+def ip_cliente():
+    """ IP del visitante; detrás de N proxies de confianza (Vercel, nginx) se toma de X-Forwarded-For. """
+    proxies = current_app.config['PROXIES_DE_CONFIANZA']
+    if proxies and len(request.access_route) >= proxies:
+        return request.access_route[-proxies]
+    return request.remote_addr
+
+
+def marcar_prestamo_modificado(prestamo_id):
+    """ Anota el préstamo en la sesión; al hacer commit se invalidan sus cachés. """
+    db.session.info.setdefault('prestamos_modificados', set()).add(prestamo_id)
+
+
+@event.listens_for(SessionBase, 'before_flush')
+def _marcar_prestamos_de_clientes_modificados(session, flush_context, instancias):
+    """ La página de estado muestra nombre y cédula del cliente: editarlo invalida las de sus préstamos. """
+    clientes = [c.id for c in session.dirty if isinstance(c, Cliente) and session.is_modified(c)]
+    if clientes:
+        prestamos = session.query(Prestamo.id).filter(Prestamo.cliente_id.in_(clientes))
+        session.info.setdefault('prestamos_modificados', set()).update(p for (p,) in prestamos)
+
+
+@event.listens_for(SessionBase, 'after_commit')
+def _invalidar_caches_tras_commit(session):
+    modificados = session.info.pop('prestamos_modificados', None)
+    if modificados:
+        cache_estado.invalidar_prestamos(modificados)
+    for usuario_id in session.info.pop('usuarios_modificados', ()):
+        usuarios_cache.descartar(usuario_id)
+
+
+@event.listens_for(SessionBase, 'after_soft_rollback')
+def _descartar_modificados_tras_rollback(session, previous_transaction):
+    session.info.pop('prestamos_modificados', None)
+    session.info.pop('usuarios_modificados', None)
+
+
+# crear_app() pone ESTADO_CACHE_TTL, ESTADO_CONSULTAS_POR_MINUTO y ESTADO_RAFAGA
+cache_estado = CacheEstado(ttl=0)
+limitador_estado = LimitadorPorIP(por_minuto=0, rafaga=0)
+
+
+# --- INSTRUMENTACIÓN SQL POR PETICIÓN ---
+# Cada sentencia que llega a un motor se cuenta en `g` (cantidad, tiempo y repeticiones de la
+# misma sentencia). Al final de la petición se agrega a las estadísticas del proceso, se envía
+# en las cabeceras X-SQL-* y se avisa en el log si la ruta pasó su presupuesto o tiene un N+1.
+# Las respuestas en streaming (CSV) solo cuentan las consultas hechas antes de empezar a enviar.
+
+# Rutas que necesitan un presupuesto distinto al general (SQL_PRESUPUESTO_CONSULTAS)
+PRESUPUESTO_CONSULTAS = {
+    'admin_dashboard': 6,
+    'cobrador_dashboard': 5,
+    'detalle_prestamo': 4,
+    'api_cuotas_prestamo': 4,
+    'reporte_mora': 4,
+}
 
-class Usuario(db.Model, UserMixin):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
-    rol = db.Column(db.String(50), nullable=False, default='cobrador')
-    
-    prestamos_asignados = db.relationship('Prestamo', backref='cobrador', lazy=True)
-
-
-class Cliente(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    cedula = db.Column(db.String(20), unique=True, nullable=False)
-    nombre_completo = db.Column(db.String(120), nullable=False)
-    direccion = db.Column(db.String(200), nullable=True)
-    telefono = db.Column(db.String(20), nullable=True)
-    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
-    prestamos = db.relationship('Prestamo', backref='cliente', lazy=True)
-
-class Prestamo(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    monto_prestado = db.Column(db.Float, nullable=False)
-    tasa_interes_mensual = db.Column(db.Float, nullable=False)
-    plazo_meses = db.Column(db.Integer, nullable=False)
-    monto_total_a_pagar = db.Column(db.Float, nullable=False)
-    frecuencia = db.Column(db.String(20), default='diaria', nullable=False)
-    fecha_inicio = db.Column(db.DateTime, default=datetime.utcnow)
-    estado = db.Column(db.String(20), default='activo')
-    cobrar_sabado = db.Column(db.Boolean, default=True)
-    cobrar_domingo = db.Column(db.Boolean, default=False)
-    cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id'), nullable=False)
-    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
-    cuotas = db.relationship('Cuota', backref='prestamo', lazy=True, cascade="all, delete-orphan")
-
-    valor_articulo = db.Column(db.Float, nullable=True) # El valor total del bien
-    abono_inicial = db.Column(db.Float, nullable=True, default=0) # El downpayment
-    monto_prestado = db.Column(db.Float, nullable=False) # Este será el monto a financiar
-
-
-class Cuota(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    monto_cuota = db.Column(db.Float, nullable=False)
-    fecha_vencimiento = db.Column(db.Date, nullable=False)
-    estado = db.Column(db.String(20), default='pendiente')
-    fecha_de_pago = db.Column(db.DateTime, nullable=True)
-    notas = db.Column(db.Text, nullable=True)
-    prestamo_id = db.Column(db.Integer, db.ForeignKey('prestamo.id'), nullable=False)
-
-class Configuracion(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    clave = db.Column(db.String(50), unique=True, nullable=False)
-    valor = db.Column(db.Text, nullable=True)
-
-
-@app.context_processor
+
+class PresupuestoConsultasExcedido(Exception):
+    """ Solo en SQL_MODO_ESTRICTO: la ruta hizo más consultas de las permitidas o repite una sentencia. """
+
+
+class EstadisticasSQL:
+    """ Acumulado por ruta en este proceso, para la página /admin/sql. """
+
+    def __init__(self):
+        self._rutas = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, ruta, consultas, tiempo, repetida, url):
+        with self._lock:
+            datos = self._rutas.setdefault(ruta, {'ruta': ruta, 'peticiones': 0, 'consultas': 0, 'consultas_max': 0,
+                                                   'tiempo': 0.0, 'tiempo_max': 0.0, 'con_n_mas_1': 0,
+                                                   'ultimo_n_mas_1': None, 'url_max': None})
+            datos['peticiones'] += 1
+            datos['consultas'] += consultas
+            datos['tiempo'] += tiempo
+            datos['tiempo_max'] = max(datos['tiempo_max'], tiempo)
+            if consultas >= datos['consultas_max']:
+                datos['consultas_max'], datos['url_max'] = consultas, url
+            if repetida:
+                datos['con_n_mas_1'] += 1
+                datos['ultimo_n_mas_1'] = repetida
+
+    def peores(self, limite=30):
+        """ Rutas ordenadas por el máximo de consultas en una petición (y luego por tiempo en BD). """
+        with self._lock:
+            filas = [dict(datos) for datos in self._rutas.values()]
+        for fila in filas:
+            fila['consultas_promedio'] = fila['consultas'] / fila['peticiones']
+            fila['tiempo_promedio_ms'] = fila['tiempo'] * 1000 / fila['peticiones']
+            fila['presupuesto'] = PRESUPUESTO_CONSULTAS.get(fila['ruta'], current_app.config['SQL_PRESUPUESTO_CONSULTAS'])
+        return sorted(filas, key=lambda f: (-f['consultas_max'], -f['tiempo_max']))[:limite]
+
+    def reiniciar(self):
+        with self._lock:
+            self._rutas.clear()
+
+
+estadisticas_sql = EstadisticasSQL()
+# Las listas IN (?, ?, ?) cambian de largo; las colapsamos para que cuenten como la misma sentencia
+_LISTA_PARAMETROS = re.compile(r"\((?:\s*(?:\?|%s|%\(\w+\)s)\s*,)+\s*(?:\?|%s|%\(\w+\)s)\s*\)")
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _inicio_sentencia(conexion, cursor, sentencia, parametros, contexto, executemany):
+    if contexto is not None:
+        contexto._inicio_sql = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _fin_sentencia(conexion, cursor, sentencia, parametros, contexto, executemany):
+    if not has_request_context() or 'sql' not in g or sentencia.startswith('BEGIN'):
+        return
+    g.sql['consultas'] += 1
+    g.sql['tiempo'] += time.perf_counter() - getattr(contexto, '_inicio_sql', time.perf_counter())
+    g.sql['sentencias'][_LISTA_PARAMETROS.sub('(?)', sentencia)] += 1
+
+
+@rutas.before_app_request
+def _iniciar_medicion_sql():
+    g.sql = {'consultas': 0, 'tiempo': 0.0, 'sentencias': Counter()}
+
+
+@rutas.after_app_request
+def _cerrar_medicion_sql(respuesta):
+    medicion = g.pop('sql', None)
+    if medicion is None or request.endpoint == 'static':
+        return respuesta
+    ruta = request.endpoint or 'desconocida'
+    consultas, tiempo = medicion['consultas'], medicion['tiempo']
+    sentencia, veces = (medicion['sentencias'].most_common(1) or [(None, 0)])[0]
+    repetida = f"{veces}x {sentencia[:200]}" if veces > current_app.config['SQL_MAX_REPETICIONES'] else None
+    presupuesto = PRESUPUESTO_CONSULTAS.get(ruta, current_app.config['SQL_PRESUPUESTO_CONSULTAS'])
+
+    estadisticas_sql.registrar(ruta, consultas, tiempo, repetida, request.full_path)
+    respuesta.headers['X-SQL-Consultas'] = str(consultas)
+    respuesta.headers['X-SQL-Tiempo-ms'] = f"{tiempo * 1000:.1f}"
+
+    problemas = []
+    if consultas > presupuesto:
+        problemas.append(f"{consultas} consultas (presupuesto {presupuesto})")
+    if repetida:
+        problemas.append(f"posible N+1: {repetida}")
+    if problemas:
+        mensaje = f"SQL {request.method} {request.path} [{ruta}]: {'; '.join(problemas)}"
+        if current_app.config['SQL_MODO_ESTRICTO']:
+            raise PresupuestoConsultasExcedido(mensaje)
+        current_app.logger.warning(mensaje)
+    return respuesta
+
+
+@rutas.before_app_request
+def _iniciar_cronometro():
+    g.inicio_peticion = time.perf_counter()
+
+
+@rutas.after_app_request
+def _registrar_latencia(respuesta):
+    inicio = g.pop('inicio_peticion', None)
+    if inicio is not None and request.endpoint != 'static':
+        endpoint = request.endpoint or 'sin_ruta' # 404: no usamos la URL para no crear una serie por cada una
+        registro_metricas.observar('prestapp_http_peticiones_segundos', time.perf_counter() - inicio,
+                          endpoint=endpoint, metodo=request.method)
+        registro_metricas.incrementar('prestapp_http_respuestas_total', endpoint=endpoint, codigo=respuesta.status_code)
+    return respuesta
+
+
+def contar_al_confirmar(metrica, cantidad=1):
+    """ Suma a un contador de negocio solo si la transacción actual llega a hacer commit. """
+    pendientes = db.session.info.setdefault('metricas_pendientes', Counter())
+    pendientes[metrica] += cantidad
+
+
+@event.listens_for(SessionBase, 'after_commit')
+def _publicar_metricas_tras_commit(session):
+    for metrica, cantidad in session.info.pop('metricas_pendientes', {}).items():
+        registro_metricas.incrementar(metrica, cantidad)
+
+
+# --- ENRUTAMIENTO A LA RÉPLICA ---
+# Solo los reportes GET marcados con @leer_de_replica leen de la réplica (ver SesionConReplica).
+# Después de cualquier escritura el usuario queda "pegado" a la principal unos segundos
+# (DB_REPLICA_RETRASO_MAXIMO): así ve su propio pago aunque la réplica vaya atrasada.
+
+def leer_de_replica(vista):
+    @functools.wraps(vista)
+    def envoltura(*args, **kwargs):
+        if current_app.config['DB_REPLICA_CONFIGURADA'] and request.method == 'GET' and time.time() >= session.get('leer_principal_hasta', 0):
+            g.leer_de_replica = True
+            registro_metricas.incrementar('prestapp_peticiones_replica_total', endpoint=request.endpoint)
+        return vista(*args, **kwargs)
+    return envoltura
+
+
+@rutas.after_app_request
+def _leer_principal_tras_escribir(respuesta):
+    if (current_app.config['DB_REPLICA_CONFIGURADA'] and request.method not in ('GET', 'HEAD', 'OPTIONS')
+            and respuesta.status_code < 400 and current_user.is_authenticated):
+        session['leer_principal_hasta'] = time.time() + current_app.config['DB_REPLICA_RETRASO_MAXIMO']
+    return respuesta
+
+
+@event.listens_for(SessionBase, 'after_soft_rollback')
+def _descartar_metricas_tras_rollback(session, previous_transaction):
+    session.info.pop('metricas_pendientes', None)
+
+
+@rutas.app_context_processor
 def inject_logo():
-    logo_config = Configuracion.query.filter_by(clave='logo_filename').first()
-    logo_url = url_for('static', filename=f'uploads/{logo_config.valor}') if logo_config else None
+    logo_filename = config_cache.obtener('logo_filename')
+    logo_url = url_for('static', filename=f'uploads/{logo_filename}') if logo_filename else None
     return dict(logo_url=logo_url)
 
 
-@app.route('/')
+@rutas.route('/')
 def index():
     if current_user.is_authenticated:
         if current_user.rol == 'admin':
@@ -134,7 +860,7 @@ def index():
     return redirect(url_for('login'))
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@rutas.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('index'))
@@ -155,7 +881,7 @@ def login():
     return render_template('login.html')
 
 
-@app.route('/logout')
+@rutas.route('/logout')
 @login_required
 def logout():
     logout_user()
@@ -164,48 +890,94 @@ def logout():
 
 # --- RUTAS PÚBLICAS Y SIMULADOR ---
 
-@app.route('/simulador')
+@rutas.route('/simulador')
 def simulador():
     return render_template('simulador.html')
 
+
+@rutas.route('/api/simulador')
+def api_simulador():
+    """ Plan de pagos calculado con el mismo motor que prestamo_para_cliente. No toca la base de datos. """
+    monto = request.args.get('monto', 0, type=float)
+    interes = request.args.get('interes', 0, type=float)
+    plazo = request.args.get('plazo', 0, type=int)
+    frecuencia = request.args.get('frecuencia', 'diaria')
+    cuota_manual = request.args.get('cuota_manual', 0, type=float)
+    try:
+        fecha_inicio_str = request.args.get('fecha_inicio')
+        fecha_inicio = date.fromisoformat(fecha_inicio_str) if fecha_inicio_str else date.today()
+    except ValueError:
+        return {"error": "Fecha de inicio inválida."}, 400
+
+    if frecuencia not in CUOTAS_POR_MES:
+        return {"error": "Frecuencia inválida."}, 400
+    # float() acepta "nan" e "inf", y un monto enorme desborda el total: sin esto llegan a
+    # math.ceil en planificar_cuotas (500) y quedan como claves en la caché de cotizar_prestamo
+    if not all(math.isfinite(valor) for valor in (monto, interes, cuota_manual)):
+        return {"error": "Monto, interés o cuota inválidos."}, 400
+    if monto > MAX_MONTO_SIMULADOR or interes > 100 * MAX_PLAZO_SIMULADOR:
+        return {"error": "El monto o el interés son demasiado altos."}, 400
+    if monto <= 0 or interes < 0 or not 0 < plazo <= MAX_PLAZO_SIMULADOR:
+        return {"error": f"El monto debe ser positivo y el plazo de 1 a {MAX_PLAZO_SIMULADOR} meses."}, 400
+    if cuota_manual > 0 and monto * (1 + (interes / 100) * plazo) / cuota_manual > MAX_CUOTAS_SIMULADOR:
+        return {"error": f"La cuota es muy baja: el plan pasaría de {MAX_CUOTAS_SIMULADOR} cuotas."}, 400
+
+    # Los checkboxes llegan igual que en el formulario: presentes si están marcados
+    total_a_pagar, cronograma = cotizar_prestamo(
+        monto, interes, plazo, frecuencia, 'cobrarSabado' in request.args, 'cobrarDomingo' in request.args,
+        'saltarFestivos' in request.args, fecha_inicio, max(cuota_manual, 0))
+    return {
+        "total_a_pagar": total_a_pagar,
+        "numero_cuotas": len(cronograma),
+        "valor_cuota": cronograma[0][1] if cronograma else 0,
+        "ultima_cuota": cronograma[-1][1] if cronograma else 0,
+        "primera_fecha": cronograma[0][0].isoformat() if cronograma else None,
+        "ultima_fecha": cronograma[-1][0].isoformat() if cronograma else None,
+        "cuotas": [{"numero": numero, "fecha_vencimiento": fecha.isoformat(), "monto_cuota": monto_cuota}
+                   for numero, (fecha, monto_cuota) in enumerate(cronograma, start=1)],
+    }
+
 # --- RUTAS DE ADMINISTRADOR ---
 
+def calcular_estado_visual(frecuencia, proxima_fecha_pendiente, today, limite_proximo_vencer):
+    """ 'en_mora', 'proximo_vencer' o 'al_dia' según la próxima cuota pendiente del préstamo. """
+    if proxima_fecha_pendiente:
+        if proxima_fecha_pendiente < today:
+            return 'en_mora'
+        # El estado "Próximo a Vencer" solo aplica si NO es diario
+        if frecuencia != 'diaria' and proxima_fecha_pendiente <= limite_proximo_vencer:
+            return 'proximo_vencer'
+    return 'al_dia'
+
+
 # En app.py, reemplaza esta función completa
-@app.route('/admin/dashboard')
+@rutas.route('/admin/dashboard')
 @login_required
+@leer_de_replica
 def admin_dashboard():
     if current_user.rol != 'admin':
         return redirect(url_for('cobrador_dashboard'))
 
-    prestamos_activos = Prestamo.query.filter_by(estado='activo').all()
     today = date.today()
     limite_proximo_vencer = today + timedelta(days=3)
 
+    # Consulta 1: préstamos activos con su cliente, cobrador y resumen (total pagado, próxima cuota)
+    prestamos_activos = Prestamo.query.filter_by(estado='activo')\
+        .options(joinedload(Prestamo.cliente), joinedload(Prestamo.cobrador), joinedload(Prestamo.resumen)).all()
+
     total_prestado = 0
     total_recaudado = 0
 
     for prestamo in prestamos_activos:
+        resumen = prestamo.resumen
+        pagado = resumen.total_pagado if resumen else 0
         total_prestado += prestamo.monto_prestado
-        pagado = sum(c.monto_cuota for c in prestamo.cuotas if c.estado in ['pagada', 'pagada_tarde'])
         total_recaudado += pagado
         progreso = (pagado / prestamo.monto_total_a_pagar) * 100 if prestamo.monto_total_a_pagar > 0 else 0
         prestamo.progreso = int(progreso)
-        
-        prestamo.estado_visual = 'al_dia'
-        
-        proxima_cuota_pendiente = None
-        for cuota in sorted(prestamo.cuotas, key=lambda c: c.fecha_vencimiento):
-            if cuota.estado == 'pendiente':
-                proxima_cuota_pendiente = cuota
-                break
-        
-        if proxima_cuota_pendiente:
-            # LÓGICA DE ESTADO CORREGIDA
-            if proxima_cuota_pendiente.fecha_vencimiento < today:
-                prestamo.estado_visual = 'en_mora'
-            # El estado "Próximo a Vencer" solo aplica si NO es diario
-            elif prestamo.frecuencia != 'diaria' and proxima_cuota_pendiente.fecha_vencimiento <= limite_proximo_vencer:
-                prestamo.estado_visual = 'proximo_vencer'
+        prestamo.estado_visual = calcular_estado_visual(prestamo.frecuencia,
+                                                        resumen.proxima_fecha_vencimiento if resumen else None,
+                                                        today, limite_proximo_vencer)
 
     cartera_pendiente = total_prestado - total_recaudado
     metricas = {
@@ -215,46 +987,502 @@ def admin_dashboard():
         "clientes_activos": len(prestamos_activos)
     }
 
-    # --- NUEVA LÓGICA: MÉTRICAS POR COBRADOR ---
+    # --- MÉTRICAS POR COBRADOR (agrupadas, sin consultas por cada cobrador) ---
+    # Consulta 2: prestado, recaudado y clientes activos por cobrador, desde los resúmenes
+    prestamos_por_cobrador = db.session.query(
+        Prestamo.usuario_id,
+        func.sum(Prestamo.monto_prestado),
+        func.coalesce(func.sum(ResumenPrestamo.total_pagado), 0),
+        func.count(case((Prestamo.estado == 'activo', Prestamo.cliente_id), else_=None).distinct())
+    ).outerjoin(ResumenPrestamo, ResumenPrestamo.prestamo_id == Prestamo.id)\
+        .group_by(Prestamo.usuario_id).all()
+    totales_por_cobrador = {fila[0]: fila[1:] for fila in prestamos_por_cobrador}
+
     stats_cobradores = []
     cobradores = Usuario.query.filter(or_(Usuario.rol == 'cobrador', Usuario.rol == 'admin')).all()
 
     for cobrador in cobradores:
-        prestamos_cobrador = Prestamo.query.filter_by(usuario_id=cobrador.id).all()
-        if not prestamos_cobrador:
+        if cobrador.id not in totales_por_cobrador:
             continue # Si no tiene préstamos, lo saltamos
 
-        total_prestado_cobrador = sum(p.monto_prestado for p in prestamos_cobrador)
-        total_recaudado_cobrador = db.session.query(func.sum(Cuota.monto_cuota))\
-            .join(Prestamo).filter(Prestamo.usuario_id == cobrador.id, Cuota.estado.in_(['pagada', 'pagada_tarde'])).scalar() or 0
+        total_prestado_cobrador, total_recaudado_cobrador, clientes_activos_cobrador = totales_por_cobrador[cobrador.id]
 
         stats = {
             'username': cobrador.username,
             'prestado': f"{total_prestado_cobrador:,.0f}",
             'recaudado': f"{total_recaudado_cobrador:,.0f}",
-            'clientes_activos': db.session.query(func.count(Cliente.id.distinct()))\
-                .join(Prestamo).filter(Prestamo.usuario_id == cobrador.id, Prestamo.estado == 'activo').scalar() or 0
+            'clientes_activos': clientes_activos_cobrador or 0
         }
         stats_cobradores.append(stats)
 
-    return render_template('admin.html', metricas=metricas, prestamos=prestamos_activos, stats_cobradores=stats_cobradores)
+    return render_template('admin.html', metricas=metricas, prestamos=prestamos_activos, stats_cobradores=stats_cobradores,
+                           cobradores=cobradores)
     
 
+# --- REPORTE DE MORA POR ANTIGÜEDAD ---
+# Los días de atraso se convierten en fechas de corte, así el agregado es un rango sobre el
+# índice (estado, fecha_vencimiento) y no una resta de fechas por cada cuota.
+
+RANGOS_MORA = [('1-7', 1, 7), ('8-30', 8, 30), ('31-60', 31, 60), ('61-90', 61, 90), ('90+', 91, None)]
+
+
+def calcular_mora_por_antiguedad(hoy=None):
+    """
+    Saldo vencido (cuotas pendientes) por rango de días de atraso, por cobrador y de toda la cartera.
+    Dos consultas agrupadas sin importar cuántas cuotas haya.
+    """
+    hoy = hoy or date.today()
+    condiciones = [(Cuota.fecha_vencimiento >= hoy - timedelta(days=hasta), indice)
+                   for indice, (_, _, hasta) in enumerate(RANGOS_MORA) if hasta]
+    rango = case(*condiciones, else_=len(RANGOS_MORA) - 1).label('rango')
+    vencidas = [Cuota.estado == 'pendiente', Cuota.fecha_vencimiento < hoy, Prestamo.estado == 'activo']
+
+    # Consulta 1: saldo, cuotas y préstamos por cobrador y rango
+    filas = db.session.query(
+        Usuario.id, Usuario.username, rango,
+        func.sum(Cuota.monto_cuota), func.count(Cuota.id), func.count(Prestamo.id.distinct()),
+    ).join(Prestamo, Cuota.prestamo_id == Prestamo.id).join(Usuario, Prestamo.usuario_id == Usuario.id)\
+        .filter(*vencidas).group_by(Usuario.id, Usuario.username, 'rango').all()
+
+    # Consulta 2: préstamos distintos en mora por cobrador (un préstamo puede caer en varios rangos)
+    prestamos_en_mora = dict(db.session.query(Prestamo.usuario_id, func.count(Prestamo.id.distinct()))
+                             .join(Cuota, Cuota.prestamo_id == Prestamo.id).filter(*vencidas)
+                             .group_by(Prestamo.usuario_id).all())
+
+    def fila_vacia(nombre):
+        return {'nombre': nombre, 'saldo': 0, 'cuotas': 0, 'prestamos': 0,
+                'rangos': [{'saldo': 0, 'cuotas': 0, 'prestamos': 0} for _ in RANGOS_MORA]}
+
+    cartera = fila_vacia('Toda la cartera')
+    cobradores = {}
+    for usuario_id, username, indice, saldo, cuotas, prestamos in filas:
+        fila = cobradores.setdefault(usuario_id, fila_vacia(username))
+        for destino in (fila, cartera):
+            destino['rangos'][indice]['saldo'] += saldo or 0
+            destino['rangos'][indice]['cuotas'] += cuotas
+            destino['rangos'][indice]['prestamos'] += prestamos
+            destino['saldo'] += saldo or 0
+            destino['cuotas'] += cuotas
+    for usuario_id, fila in cobradores.items():
+        fila['prestamos'] = prestamos_en_mora.get(usuario_id, 0)
+    cartera['prestamos'] = sum(prestamos_en_mora.values())
+
+    return {
+        'fecha': hoy,
+        'rangos': [nombre for nombre, _, _ in RANGOS_MORA],
+        'cobradores': sorted(cobradores.values(), key=lambda fila: -fila['saldo']),
+        'cartera': cartera,
+    }
+
+
+@rutas.route('/admin/reportes/mora')
+@login_required
+@leer_de_replica
+def reporte_mora():
+    if current_user.rol != 'admin':
+        return redirect(url_for('cobrador_dashboard'))
+    return render_template('reporte_mora.html', reporte=calcular_mora_por_antiguedad())
+
+
+@rutas.route('/admin/sql', methods=['GET', 'POST'])
+@login_required
+def estadisticas_sql_admin():
+    """ Rutas con más consultas por petición desde que arrancó este proceso. """
+    if current_user.rol != 'admin':
+        return redirect(url_for('cobrador_dashboard'))
+    if request.method == 'POST':
+        estadisticas_sql.reiniciar()
+        flash('Estadísticas reiniciadas.', 'success')
+        return redirect(url_for('estadisticas_sql_admin'))
+    return render_template('estadisticas_sql.html', rutas=estadisticas_sql.peores(),
+                           presupuesto_general=current_app.config['SQL_PRESUPUESTO_CONSULTAS'])
+
+
+@rutas.route('/admin/metrics')
+def metricas_prometheus():
+    """ Métricas en formato Prometheus. Acceso con sesión de admin o con el token METRICS_TOKEN. """
+    token = current_app.config['METRICS_TOKEN']
+    autorizacion = request.headers.get('Authorization', '')
+    con_token = bool(token) and hmac.compare_digest(autorizacion.encode(), f"Bearer {token}".encode())
+    if not con_token and not (current_user.is_authenticated and current_user.rol == 'admin'):
+        return "No autorizado\n", 401, {'Content-Type': 'text/plain; charset=utf-8'}
+
+    # Valores que se leen al momento: el pool de este proceso y la bandeja de recordatorios,
+    # que llena scheduler.py desde otro proceso (una consulta agrupada sobre un índice)
+    pool = db.engine.pool
+    adicionales = []
+    if isinstance(pool, QueuePool):
+        adicionales.append(('prestapp_db_pool_conexiones', 'gauge', 'Conexiones del pool por estado.', [
+            ({'estado': 'en_uso'}, pool.checkedout()), ({'estado': 'libres'}, pool.checkedin()),
+            ({'estado': 'tamano'}, pool.size())]))
+    cache_simulador = cotizar_prestamo.cache_info()
+    adicionales.append(('prestapp_simulador_cache_total', 'counter', 'Cotizaciones del simulador por resultado de la caché.', [
+        ({'resultado': 'acierto'}, cache_simulador.hits), ({'resultado': 'fallo'}, cache_simulador.misses)]))
+    recordatorios = db.session.query(Recordatorio.estado, func.count(Recordatorio.id)).group_by(Recordatorio.estado).all()
+    adicionales.append(('prestapp_recordatorios', 'gauge', 'Recordatorios de la bandeja de salida por estado.',
+                        [({'estado': estado}, total) for estado, total in recordatorios]))
+    return registro_metricas.exponer(adicionales), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+# --- EXPORTACIÓN CSV ---
+# Las filas se leen por lotes con un cursor del lado del servidor (yield_per) y se envían
+# apenas se escriben, así la descarga empieza de inmediato y en memoria solo vive un lote.
+
+FILAS_POR_LOTE_EXPORTACION = 1000
+
+
+def _consulta_exportacion(tabla, desde, hasta, cobrador_id):
+    """ (encabezados, select) de la tabla a exportar con los filtros de fecha y cobrador aplicados. """
+    if tabla == 'clientes':
+        encabezados = ['id', 'cedula', 'nombre_completo', 'direccion', 'telefono', 'fecha_creacion']
+        consulta = select(Cliente.id, Cliente.cedula, Cliente.nombre_completo, Cliente.direccion,
+                          Cliente.telefono, Cliente.fecha_creacion).order_by(Cliente.id)
+        columna_fecha = Cliente.fecha_creacion
+        if cobrador_id:
+            consulta = consulta.where(select(Prestamo.id).where(
+                Prestamo.cliente_id == Cliente.id, Prestamo.usuario_id == cobrador_id).exists())
+    elif tabla == 'prestamos':
+        encabezados = ['id', 'cedula', 'cliente', 'cobrador', 'monto_prestado', 'tasa_interes_mensual',
+                       'plazo_meses', 'monto_total_a_pagar', 'frecuencia', 'fecha_inicio', 'estado',
+                       'total_pagado', 'saldo_pendiente']
+        consulta = select(Prestamo.id, Cliente.cedula, Cliente.nombre_completo, Usuario.username,
+                          Prestamo.monto_prestado, Prestamo.tasa_interes_mensual, Prestamo.plazo_meses,
+                          Prestamo.monto_total_a_pagar, Prestamo.frecuencia, Prestamo.fecha_inicio, Prestamo.estado,
+                          ResumenPrestamo.total_pagado, ResumenPrestamo.saldo_pendiente)\
+            .join(Cliente, Prestamo.cliente_id == Cliente.id).join(Usuario, Prestamo.usuario_id == Usuario.id)\
+            .outerjoin(ResumenPrestamo, ResumenPrestamo.prestamo_id == Prestamo.id).order_by(Prestamo.id)
+        columna_fecha = Prestamo.fecha_inicio
+    else: # cuotas
+        encabezados = ['id', 'prestamo_id', 'cedula', 'cobrador', 'fecha_vencimiento', 'monto_cuota',
+                       'estado', 'fecha_de_pago', 'notas']
+        consulta = select(Cuota.id, Cuota.prestamo_id, Cliente.cedula, Usuario.username, Cuota.fecha_vencimiento,
+                          Cuota.monto_cuota, Cuota.estado, Cuota.fecha_de_pago, Cuota.notas)\
+            .join(Prestamo, Cuota.prestamo_id == Prestamo.id).join(Cliente, Prestamo.cliente_id == Cliente.id)\
+            .join(Usuario, Prestamo.usuario_id == Usuario.id).order_by(Cuota.id)
+        columna_fecha = Cuota.fecha_vencimiento
+
+    if cobrador_id and tabla != 'clientes':
+        consulta = consulta.where(Prestamo.usuario_id == cobrador_id)
+    # 'hasta' es inclusivo; en columnas DateTime comparamos contra el día siguiente
+    if desde:
+        consulta = consulta.where(columna_fecha >= desde)
+    if hasta:
+        consulta = consulta.where(columna_fecha < hasta + timedelta(days=1)) if tabla != 'cuotas' \
+            else consulta.where(columna_fecha <= hasta)
+    return encabezados, consulta
+
+
+_NUMERO_CSV = re.compile(r"[+-]?\d+(?:[.,]\d+)?")
+
+
+def _celda_csv(valor):
+    """
+    Evita que Excel o LibreOffice interpreten como fórmula un texto escrito por el usuario (notas,
+    nombres, direcciones). Los números con signo (un teléfono +57..., un ajuste -5000) se dejan igual.
+    """
+    if isinstance(valor, str) and valor[:1] in ('=', '@', '+', '-', '\t', '\r') and not _NUMERO_CSV.fullmatch(valor):
+        return "'" + valor
+    return valor
+
+
+def generar_csv(encabezados, consulta):
+    """ Generador de trozos CSV: uno con los encabezados y uno por cada lote de filas. """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(encabezados)
+    yield buffer.getvalue()
+
+    resultado = db.session.execute(consulta.execution_options(yield_per=FILAS_POR_LOTE_EXPORTACION))
+    for lote in resultado.partitions():
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows([_celda_csv(valor) for valor in fila] for fila in lote)
+        yield buffer.getvalue()
+
+
+@rutas.route('/admin/exportar')
+@login_required
+@leer_de_replica
+def exportar_csv():
+    """ Descarga clientes, préstamos o cuotas en CSV, filtrando por rango de fechas y cobrador. """
+    if current_user.rol != 'admin':
+        return redirect(url_for('cobrador_dashboard'))
+
+    tabla = request.args.get('tabla', 'cuotas')
+    if tabla not in ('clientes', 'prestamos', 'cuotas'):
+        flash('Tipo de exportación no válido.', 'danger')
+        return redirect(url_for('admin_dashboard'))
+    try:
+        desde = date.fromisoformat(request.args['desde']) if request.args.get('desde') else None
+        hasta = date.fromisoformat(request.args['hasta']) if request.args.get('hasta') else None
+    except ValueError:
+        flash('Las fechas deben tener el formato AAAA-MM-DD.', 'danger')
+        return redirect(url_for('admin_dashboard'))
+    cobrador_id = request.args.get('cobrador_id', type=int)
+
+    encabezados, consulta = _consulta_exportacion(tabla, desde, hasta, cobrador_id)
+    nombre = f"{tabla}_{date.today().isoformat()}.csv"
+    return Response(stream_with_context(generar_csv(encabezados, consulta)), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename="{nombre}"'})
+
+
+# --- IMPORTACIÓN MASIVA (CSV) ---
+# Columnas: cedula, nombre_completo, telefono, direccion y, si la fila trae préstamo,
+# monto, interes, plazo, frecuencia, cobrador (username), fecha_inicio, cuota,
+# cobrar_sabado, cobrar_domingo, saltar_festivos. El archivo se lee por lotes: en cada lote los clientes
+# se insertan o actualizan por cédula con sentencias masivas, los préstamos se crean con
+# sus cuotas y resúmenes en INSERTs masivos, y se hace un commit.
+
+TAMANO_LOTE_IMPORTACION = 500
+VALORES_SI = {'si', 'sí', 's', 'x', '1', 'true'}
+
+
+def _numero_importado(fila, columna, tipo=float):
+    valor = (fila.get(columna) or '').replace('$', '').replace(' ', '')
+    try:
+        numero = tipo(valor)
+    except ValueError:
+        numero = math.nan
+    if not math.isfinite(numero): # float() acepta "nan" e "inf"
+        raise ValueError(f"'{columna}' no es un número válido: {fila.get(columna)!r}")
+    return numero
+
+
+def _fecha_importada(valor):
+    for formato in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(valor, formato).date()
+        except ValueError:
+            pass
+    raise ValueError(f"'fecha_inicio' no es una fecha válida (AAAA-MM-DD o DD/MM/AAAA): {valor!r}")
+
+
+def validar_fila_importacion(fila, cobradores):
+    """ Convierte una fila del CSV en (datos del cliente, datos del préstamo o None). Lanza ValueError. """
+    fila = {(clave or '').strip().lower(): (valor or '').strip() for clave, valor in fila.items()}
+    cedula = fila.get('cedula', '')
+    if not cedula:
+        raise ValueError("Falta la cédula.")
+    cliente = {'cedula': cedula}
+    for columna in ('nombre_completo', 'telefono', 'direccion'):
+        if fila.get(columna):
+            cliente[columna] = fila[columna]
+    for columna, valor in cliente.items():
+        if len(valor) > Cliente.__table__.c[columna].type.length:
+            raise ValueError(f"'{columna}' supera los {Cliente.__table__.c[columna].type.length} caracteres.")
+
+    if not fila.get('monto'):
+        return cliente, None
+
+    frecuencia = fila.get('frecuencia', '').lower() or 'diaria'
+    if frecuencia not in CUOTAS_POR_MES:
+        raise ValueError(f"Frecuencia no válida: {frecuencia!r}.")
+    cobrador = fila.get('cobrador', '')
+    if cobrador not in cobradores:
+        raise ValueError(f"No existe el cobrador {cobrador!r}.")
+    prestamo = {
+        'monto': _numero_importado(fila, 'monto'),
+        'interes': _numero_importado(fila, 'interes'),
+        'plazo': _numero_importado(fila, 'plazo', int),
+        'frecuencia': frecuencia,
+        'usuario_id': cobradores[cobrador],
+        'fecha_inicio': _fecha_importada(fila['fecha_inicio']) if fila.get('fecha_inicio') else date.today(),
+        'cuota': _numero_importado(fila, 'cuota') if fila.get('cuota') else 0,
+        'cobrar_sabado': fila.get('cobrar_sabado', 'si').lower() in VALORES_SI,
+        'cobrar_domingo': fila.get('cobrar_domingo', 'no').lower() in VALORES_SI,
+        'saltar_festivos': fila.get('saltar_festivos', 'no').lower() in VALORES_SI,
+    }
+    if prestamo['monto'] <= 0 or prestamo['plazo'] <= 0 or prestamo['interes'] < 0:
+        raise ValueError("Monto y plazo deben ser mayores que cero y el interés no puede ser negativo.")
+    # Mismos límites que el simulador: el cronograma completo se arma en memoria antes del INSERT
+    if prestamo['plazo'] > MAX_PLAZO_SIMULADOR:
+        raise ValueError(f"El plazo no puede pasar de {MAX_PLAZO_SIMULADOR} meses.")
+    if prestamo['cuota'] < 0:
+        raise ValueError("La cuota no puede ser negativa.")
+    total_a_pagar = prestamo['monto'] * (1 + (prestamo['interes'] / 100) * prestamo['plazo'])
+    if prestamo['cuota'] > 0 and total_a_pagar / prestamo['cuota'] > MAX_CUOTAS_SIMULADOR:
+        raise ValueError(f"La cuota es muy baja: el plan pasaría de {MAX_CUOTAS_SIMULADOR} cuotas.")
+    return cliente, prestamo
+
+
+def _guardar_lote_importacion(lote, errores):
+    """
+    Guarda un lote de (numero_fila, cliente, prestamo) ya validado. Hace commit y devuelve los
+    totales guardados; las filas que no se pueden guardar se anotan en `errores`.
+    """
+    ahora = datetime.utcnow()
+
+    # 1. Clientes: un SELECT por cédula, un UPDATE masivo para los existentes y un INSERT para los nuevos
+    clientes = {}
+    for _, cliente, _ in lote:
+        clientes.setdefault(cliente['cedula'], {}).update(cliente)
+    existentes = dict(db.session.query(Cliente.cedula, Cliente.id).filter(Cliente.cedula.in_(clientes)).all())
+    sin_nombre = {cedula for cedula, datos in clientes.items()
+                  if cedula not in existentes and not datos.get('nombre_completo')}
+    if sin_nombre:
+        errores.extend((numero, cliente['cedula'], "Cliente nuevo sin nombre_completo.")
+                                    for numero, cliente, _ in lote if cliente['cedula'] in sin_nombre)
+        lote = [fila for fila in lote if fila[1]['cedula'] not in sin_nombre]
+    nuevos = [datos for cedula, datos in clientes.items() if cedula not in existentes and cedula not in sin_nombre]
+    actualizados = [cedula for cedula, datos in clientes.items() if cedula in existentes and len(datos) > 1]
+    cambios = [dict(clientes[cedula], id=existentes[cedula], fecha_actualizacion=ahora) for cedula in actualizados]
+    if cambios:
+        db.session.execute(update(Cliente), cambios)
+    if nuevos:
+        db.session.execute(insert(Cliente), nuevos)
+        existentes.update(db.session.query(Cliente.cedula, Cliente.id)
+                          .filter(Cliente.cedula.in_([datos['cedula'] for datos in nuevos])).all())
+
+    # 2. Préstamos: como en la app, un solo préstamo activo por cliente
+    con_prestamo = [(numero, cliente, prestamo) for numero, cliente, prestamo in lote if prestamo]
+    ocupados = {cliente_id for (cliente_id,) in db.session.query(Prestamo.cliente_id).filter(
+        Prestamo.estado == 'activo',
+        Prestamo.cliente_id.in_([existentes[cliente['cedula']] for _, cliente, _ in con_prestamo]))}
+    prestamos = []
+    for numero, cliente, datos in con_prestamo:
+        cliente_id = existentes[cliente['cedula']]
+        if cliente_id in ocupados:
+            errores.append((numero, cliente['cedula'], "El cliente ya tiene un préstamo activo."))
+            continue
+        ocupados.add(cliente_id)
+        total_a_pagar = datos['monto'] * (1 + (datos['interes'] / 100) * datos['plazo'])
+        cronograma = planificar_cuotas(total_a_pagar, datos['plazo'], datos['frecuencia'], datos['fecha_inicio'],
+                                       datos['cobrar_sabado'], datos['cobrar_domingo'], datos['cuota'],
+                                       datos['saltar_festivos'])
+        prestamo = Prestamo(
+            valor_articulo=datos['monto'], abono_inicial=0, monto_prestado=datos['monto'],
+            tasa_interes_mensual=datos['interes'], plazo_meses=datos['plazo'], monto_total_a_pagar=total_a_pagar,
+            frecuencia=datos['frecuencia'], cobrar_sabado=datos['cobrar_sabado'],
+            cobrar_domingo=datos['cobrar_domingo'], saltar_festivos=datos['saltar_festivos'], cliente_id=cliente_id, usuario_id=datos['usuario_id'],
+            fecha_inicio=datetime.combine(datos['fecha_inicio'], datetime.min.time()),
+        )
+        prestamos.append((prestamo, cronograma))
+    db.session.add_all([prestamo for prestamo, _ in prestamos])
+    db.session.flush() # ids de los préstamos para sus cuotas
+
+    # 3. Cuotas y resúmenes del lote completo en dos INSERTs masivos
+    cuotas = [{'prestamo_id': prestamo.id, 'monto_cuota': monto, 'fecha_vencimiento': fecha, 'estado': 'pendiente'}
+              for prestamo, cronograma in prestamos for fecha, monto in cronograma]
+    if cuotas:
+        db.session.execute(insert(Cuota), cuotas)
+    if prestamos:
+        db.session.execute(insert(ResumenPrestamo), [{
+            'prestamo_id': prestamo.id, 'total_pagado': 0, 'saldo_pendiente': prestamo.monto_total_a_pagar,
+            'cuotas_pagadas': 0, 'cuotas_pendientes': len(cronograma),
+            'proxima_fecha_vencimiento': cronograma[0][0] if cronograma else None, 'fecha_actualizacion': ahora,
+        } for prestamo, cronograma in prestamos])
+    contar_al_confirmar('prestapp_prestamos_creados_total', len(prestamos))
+    db.session.commit()
+    # El UPDATE masivo no pasa por el ORM (ni por _marcar_prestamos_de_clientes_modificados)
+    cache_estado.invalidar_cedulas(actualizados)
+    return {'clientes_creados': len(nuevos), 'clientes_actualizados': len(cambios),
+            'prestamos_creados': len(prestamos), 'cuotas_creadas': len(cuotas)}
+
+
+def importar_cartera(archivo_texto):
+    """
+    Importa clientes y préstamos desde un archivo CSV de texto (separado por comas o punto y coma).
+    Devuelve los totales y la lista de errores (fila, cedula, mensaje); un lote que falla al
+    guardarse se revierte completo y sus filas se reportan como error.
+    """
+    resultado = {'filas': 0, 'clientes_creados': 0, 'clientes_actualizados': 0,
+                 'prestamos_creados': 0, 'cuotas_creadas': 0, 'errores': []}
+    encabezado = archivo_texto.readline()
+    delimitador = ';' if encabezado.count(';') > encabezado.count(',') else ','
+    columnas = next(csv.reader([encabezado], delimiter=delimitador), [])
+    cobradores = dict(db.session.query(Usuario.username, Usuario.id).all())
+
+    def guardar(lote):
+        # Totales y errores del lote se suman al resultado solo si llega a hacer commit
+        errores = []
+        try:
+            totales = _guardar_lote_importacion(lote, errores)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Error importando un lote: {e}")
+            con_error = {numero for numero, _, _ in errores}
+            errores.extend((numero, cliente['cedula'], f"Lote no guardado: {e}")
+                           for numero, cliente, _ in lote if numero not in con_error)
+            totales = {}
+        for clave, cantidad in totales.items():
+            resultado[clave] += cantidad
+        resultado['errores'].extend(errores)
+
+    lote = []
+    for numero, fila in enumerate(csv.DictReader(archivo_texto, fieldnames=columnas, delimiter=delimitador), start=2):
+        resultado['filas'] += 1
+        try:
+            cliente, prestamo = validar_fila_importacion(fila, cobradores)
+        except ValueError as e:
+            resultado['errores'].append((numero, (fila.get('cedula') or '').strip(), str(e)))
+            continue
+        lote.append((numero, cliente, prestamo))
+        if len(lote) >= TAMANO_LOTE_IMPORTACION:
+            guardar(lote)
+            lote = []
+    if lote:
+        guardar(lote)
+    resultado['errores'].sort()
+    return resultado
+
+
+@rutas.route('/admin/importar', methods=['GET', 'POST'])
+@login_required
+def importar_csv():
+    """ Carga masiva de clientes y préstamos desde un CSV. """
+    if current_user.rol != 'admin':
+        return redirect(url_for('index'))
+
+    resultado = None
+    if request.method == 'POST':
+        archivo = request.files.get('archivo')
+        if not archivo or not archivo.filename:
+            flash('Selecciona un archivo CSV.', 'warning')
+            return redirect(url_for('importar_csv'))
+        try:
+            # utf-8-sig quita el BOM que agrega Excel al guardar como CSV
+            resultado = importar_cartera(io.TextIOWrapper(archivo.stream, encoding='utf-8-sig'))
+        except UnicodeDecodeError:
+            db.session.rollback()
+            flash('El archivo debe estar guardado como CSV UTF-8.', 'danger')
+            return redirect(url_for('importar_csv'))
+        flash(f"Importación terminada: {resultado['clientes_creados']} clientes creados, "
+              f"{resultado['clientes_actualizados']} actualizados y {resultado['prestamos_creados']} préstamos creados.",
+              'success' if not resultado['errores'] else 'warning')
+
+    return render_template('importar.html', resultado=resultado,
+                           max_plazo=MAX_PLAZO_SIMULADOR, max_cuotas=MAX_CUOTAS_SIMULADOR)
+
+
+@rutas.cli.command('importar-cartera')
+@click.argument('ruta')
+def importar_cartera_comando(ruta):
+    """ Importa un CSV grande sin pasar por el navegador: flask importar-cartera archivo.csv """
+    with open(ruta, encoding='utf-8-sig', newline='') as archivo:
+        resultado = importar_cartera(archivo)
+    for numero, cedula, mensaje in resultado['errores']:
+        print(f"Fila {numero} ({cedula}): {mensaje}")
+    print(f"{resultado['filas']} filas: {resultado['clientes_creados']} clientes creados, "
+          f"{resultado['clientes_actualizados']} actualizados, {resultado['prestamos_creados']} préstamos "
+          f"y {resultado['cuotas_creadas']} cuotas; {len(resultado['errores'])} errores.")
+
+
 # dashboard inicial del cobrador o llamar al admin
 # En app.py
-@app.route('/dashboard')
+@rutas.route('/dashboard')
 @login_required
+@leer_de_replica
 def cobrador_dashboard():
     if current_user.rol != 'cobrador':
         return redirect(url_for('admin_dashboard'))
 
     # Buscamos los préstamos del cobrador actual
-    prestamos_asignados = Prestamo.query.filter_by(usuario_id=current_user.id).all()
+    prestamos_asignados = Prestamo.query.filter_by(usuario_id=current_user.id)\
+        .options(joinedload(Prestamo.cliente), joinedload(Prestamo.resumen)).all()
 
-    # Calculamos sus métricas
+    # Calculamos sus métricas (lo pagado sale del resumen de cada préstamo)
     total_prestado = sum(p.monto_prestado for p in prestamos_asignados)
-    total_recaudado = db.session.query(func.sum(Cuota.monto_cuota))\
-        .join(Prestamo).filter(Prestamo.usuario_id == current_user.id, Cuota.estado.in_(['pagada', 'pagada_tarde'])).scalar() or 0
+    total_recaudado = sum(p.resumen.total_pagado for p in prestamos_asignados if p.resumen)
 
     cartera_pendiente = total_prestado - total_recaudado
 
@@ -275,7 +1503,7 @@ def cobrador_dashboard():
 
 
 # busqueda de cliente por cédula (API)
-@app.route('/api/buscar_cliente/<cedula>')
+@rutas.route('/api/buscar_cliente/<cedula>')
 @login_required
 def buscar_cliente(cedula):
     cliente = Cliente.query.filter_by(cedula=cedula).first()
@@ -292,7 +1520,7 @@ def buscar_cliente(cedula):
         return {"encontrado": False}
 
 
-@app.route('/prestamo/crear', methods=['GET', 'POST'])
+@rutas.route('/prestamo/crear', methods=['GET', 'POST'])
 @login_required
 def crear_prestamo():
     if request.method == 'POST':
@@ -308,6 +1536,7 @@ def crear_prestamo():
         cobrador_id = request.form.get('cobrador_id', current_user.id)
         cobrar_sabado = 'cobrarSabado' in request.form
         cobrar_domingo = 'cobrarDomingo' in request.form
+        saltar_festivos = 'saltarFestivos' in request.form
 
         # --- Parte 2: Gestión del cliente y préstamo (sin cambios) ---
         cliente = Cliente.query.filter_by(cedula=cedula).first()
@@ -320,46 +1549,27 @@ def crear_prestamo():
         nuevo_prestamo = Prestamo(
             monto_prestado=monto, tasa_interes_mensual=interes, plazo_meses=plazo,
             monto_total_a_pagar=total_a_pagar, frecuencia=frecuencia,
-            cobrar_sabado=cobrar_sabado, cobrar_domingo=cobrar_domingo,
+            cobrar_sabado=cobrar_sabado, cobrar_domingo=cobrar_domingo, saltar_festivos=saltar_festivos,
             cliente=cliente, usuario_id=cobrador_id
         )
 
-        # --- Parte 3: GENERACIÓN DE CUOTAS (LÓGICA CORREGIDA) ---
-        numero_cuotas = 0
-        if frecuencia == 'diaria': numero_cuotas = plazo * 26
-        elif frecuencia == 'semanal': numero_cuotas = plazo * 4
-        elif frecuencia == 'quincenal': numero_cuotas = plazo * 2
-        elif frecuencia == 'mensual': numero_cuotas = plazo
-        
+        # --- Parte 3: GENERACIÓN DE CUOTAS (motor compartido) ---
+        # La primera cuota vence mañana. Todas valen total / número de cuotas (redondeado a
+        # centavos) menos la última, que lleva la diferencia del redondeo.
+        numero_cuotas = plazo * CUOTAS_POR_MES.get(frecuencia, 0)
+        cronograma = []
         if numero_cuotas > 0:
             valor_cuota = round(total_a_pagar / numero_cuotas, 2)
-            # CORRECCIÓN 1: La fecha inicial ahora es mañana
-            fecha_actual = date.today() + timedelta(days=1)
-
-            for _ in range(numero_cuotas):
-                if frecuencia == 'diaria':
-                    # Avanza hasta encontrar un día de pago válido
-                    while True:
-                        dia_semana = fecha_actual.weekday()
-                        if (dia_semana == 6 and not cobrar_domingo) or (dia_semana == 5 and not cobrar_sabado):
-                            fecha_actual += timedelta(days=1)
-                        else:
-                            break
-                
-                # CORRECCIÓN 2: Lógica iterativa para todas las frecuencias
-                cuota_vencimiento = fecha_actual
-                
-                cuota = Cuota(monto_cuota=valor_cuota, fecha_vencimiento=cuota_vencimiento, prestamo=nuevo_prestamo)
-                db.session.add(cuota)
-
-                # Avanzamos la fecha para la SIGUIENTE cuota
-                if frecuencia == 'diaria': fecha_actual += timedelta(days=1)
-                elif frecuencia == 'semanal': fecha_actual += timedelta(weeks=1)
-                elif frecuencia == 'quincenal': fecha_actual += timedelta(days=15)
-                elif frecuencia == 'mensual': fecha_actual += timedelta(days=30) # Aproximación simple
+            cronograma = generar_cronograma(total_a_pagar, numero_cuotas, valor_cuota,
+                                            date.today() + timedelta(days=1), frecuencia,
+                                            cobrar_sabado, cobrar_domingo, saltar_festivos)
 
         try:
             db.session.add(nuevo_prestamo)
+            db.session.flush() # Obtenemos el id del préstamo para las cuotas
+            guardar_cronograma(nuevo_prestamo.id, cronograma)
+            actualizar_resumen_prestamo(nuevo_prestamo.id)
+            contar_al_confirmar('prestapp_prestamos_creados_total')
             db.session.commit()
             flash('Préstamo creado exitosamente.', 'success')
             return redirect(url_for('admin_dashboard'))
@@ -372,7 +1582,7 @@ def crear_prestamo():
 
 
 # verificacion del cliente si existe en la base de datos
-@app.route('/prestamo/verificar-cliente', methods=['POST'])
+@rutas.route('/prestamo/verificar-cliente', methods=['POST'])
 @login_required
 def buscar_o_crear_cliente():
     cedula = request.form.get('cedula')
@@ -388,15 +1598,54 @@ def buscar_o_crear_cliente():
 
 
 
-@app.route('/prestamo/<int:prestamo_id>')
+@rutas.route('/prestamo/<int:prestamo_id>')
 @login_required
 def detalle_prestamo(prestamo_id):
-    prestamo = Prestamo.query.get_or_404(prestamo_id)
-    today = date.today()
-    return render_template('detalle_prestamo.html', prestamo=prestamo, today=today)
+    # La tabla de cuotas se carga por páginas desde api_cuotas_prestamo:
+    # el primer render cuesta lo mismo sin importar cuántas cuotas tenga el préstamo.
+    prestamo = Prestamo.query.options(joinedload(Prestamo.cliente)).get_or_404(prestamo_id)
+    total_cuotas = db.session.query(func.count(Cuota.id)).filter_by(prestamo_id=prestamo.id).scalar()
+    return render_template('detalle_prestamo.html', prestamo=prestamo, total_cuotas=total_cuotas,
+                           cuotas_por_pagina=CUOTAS_POR_PAGINA)
 
 
-@app.route('/prestamo/<int:prestamo_id>/editar', methods=['GET', 'POST'])
+CUOTAS_POR_PAGINA = 30
+
+@rutas.route('/api/prestamo/<int:prestamo_id>/cuotas')
+@login_required
+def api_cuotas_prestamo(prestamo_id):
+    """ Página de cuotas de un préstamo en JSON, en orden de vencimiento. """
+    if not db.session.query(Prestamo.id).filter_by(id=prestamo_id).first():
+        return {"error": "Préstamo no encontrado"}, 404
+
+    pagina = max(request.args.get('pagina', 1, type=int), 1)
+    por_pagina = min(max(request.args.get('por_pagina', CUOTAS_POR_PAGINA, type=int), 1), 200)
+    desde = (pagina - 1) * por_pagina
+
+    cuotas = Cuota.query.filter_by(prestamo_id=prestamo_id)\
+        .order_by(Cuota.fecha_vencimiento, Cuota.id)\
+        .offset(desde).limit(por_pagina + 1).all()
+    hay_mas = len(cuotas) > por_pagina
+
+    today = date.today()
+    resultado = []
+    for numero, cuota in enumerate(cuotas[:por_pagina], start=desde + 1):
+        pendiente = cuota.estado == 'pendiente'
+        resultado.append({
+            "id": cuota.id,
+            "numero": numero,
+            "fecha_vencimiento": cuota.fecha_vencimiento.isoformat(),
+            "monto_cuota": cuota.monto_cuota,
+            "estado": cuota.estado,
+            "atrasada": pendiente and cuota.fecha_vencimiento < today,
+            "vence_hoy": pendiente and cuota.fecha_vencimiento == today,
+            "notas": cuota.notas,
+        })
+
+    return {"pagina": pagina, "por_pagina": por_pagina, "hay_mas": hay_mas, "cuotas": resultado}
+
+
+@rutas.route('/prestamo/<int:prestamo_id>/editar', methods=['GET', 'POST'])
 @login_required
 def editar_prestamo(prestamo_id):
     # Solo el admin puede editar
@@ -424,32 +1673,65 @@ def editar_prestamo(prestamo_id):
     return render_template('editar_prestamo.html', prestamo=prestamo, cobradores=cobradores)
 
 
-@app.route('/prestamo/<int:prestamo_id>/eliminar', methods=['POST'])
+@rutas.route('/prestamo/<int:prestamo_id>/eliminar', methods=['POST'])
 @login_required
 def eliminar_prestamo(prestamo_id):
     if current_user.rol != 'admin':
         flash('No tienes permiso para realizar esta acción.', 'danger')
         return redirect(url_for('index'))
 
-    prestamo_a_eliminar = Prestamo.query.get_or_404(prestamo_id)
-    
+    if not db.session.query(Prestamo.id).filter_by(id=prestamo_id).first():
+        abort(404)
+
     try:
-        # Gracias a la configuración 'cascade' en el modelo,
-        # al borrar el préstamo, se borran automáticamente todas sus cuotas.
-        db.session.delete(prestamo_a_eliminar)
+        # Un solo DELETE: la base de datos borra en cascada las cuotas, el resumen y los
+        # recordatorios (ON DELETE CASCADE) sin que pasen por Python.
+        db.session.execute(delete(Prestamo).where(Prestamo.id == prestamo_id)
+                           .execution_options(synchronize_session=False))
+        marcar_prestamo_modificado(prestamo_id)
         db.session.commit()
         flash(f'El préstamo #{prestamo_id} y todas sus cuotas han sido eliminados.', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Error al eliminar el préstamo: {e}', 'danger')
-        app.logger.error(f"Error al eliminar préstamo {prestamo_id}: {e}")
+        current_app.logger.error(f"Error al eliminar préstamo {prestamo_id}: {e}")
         
     return redirect(url_for('admin_dashboard'))
 
 # BLOQUE DE CUOTAS
 # en esta parte se ve todo el tema de las cuotas
 
-@app.route('/cuota/<int:cuota_id>/pagar', methods=['POST'])
+def ajustar_monto_cuota(cuota_a_editar, nuevo_monto, pendientes=None):
+    """
+    Cambia el monto de una cuota pendiente y compensa la diferencia en la última cuota pendiente. No hace commit.
+    `pendientes`: las últimas cuotas pendientes del préstamo ya cargadas (ver ultimas_cuotas_pendientes);
+    sin ellas se consulta la base.
+    """
+    # --- LÓGICA DE AJUSTE AUTOMÁTICO ---
+    # 1. Calcular la diferencia
+    diferencia = nuevo_monto - cuota_a_editar.monto_cuota
+
+    # 2. Actualizar la cuota actual
+    cuota_a_editar.monto_cuota = nuevo_monto
+
+    # 3. Encontrar la ÚLTIMA cuota pendiente del préstamo
+    if pendientes is not None:
+        ultima_cuota = next((c for c in pendientes if c.estado == 'pendiente' and c.id != cuota_a_editar.id), None)
+    else:
+        ultima_cuota = Cuota.query.filter(
+            Cuota.prestamo_id == cuota_a_editar.prestamo_id,
+            Cuota.estado == 'pendiente',
+            Cuota.id != cuota_a_editar.id # Excluimos la que estamos editando si es la última
+        ).order_by(Cuota.fecha_vencimiento.desc(), Cuota.id.desc()).first()
+
+    if ultima_cuota:
+        # 4. Ajustar la última cuota para balancear el total
+        ultima_cuota.monto_cuota -= diferencia
+    # Si la cuota que editamos ES la última, no hay dónde compensar
+    # (En un caso real, aquí se podría manejar la lógica de si el préstamo se paga por completo)
+
+
+@rutas.route('/cuota/<int:cuota_id>/pagar', methods=['POST'])
 @login_required
 def pagar_cuota(cuota_id):
     cuota = Cuota.query.get_or_404(cuota_id)
@@ -462,18 +1744,20 @@ def pagar_cuota(cuota_id):
     cuota.fecha_de_pago = datetime.utcnow()
     
     try:
+        actualizar_resumen_prestamo(cuota.prestamo_id)
+        contar_al_confirmar('prestapp_pagos_registrados_total')
         db.session.commit()
         flash(f'Pago de la cuota #{cuota.id} registrado exitosamente.', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Error al registrar el pago: {e}', 'danger')
-        app.logger.error(f"Error al pagar cuota {cuota_id}: {e}")
+        current_app.logger.error(f"Error al pagar cuota {cuota_id}: {e}")
 
     return redirect(url_for('detalle_prestamo', prestamo_id=cuota.prestamo_id))
 
 
 # En la ruta pagar_cuota, y una nueva ruta para las notas
-@app.route('/cuota/<int:cuota_id>/nota', methods=['POST'])
+@rutas.route('/cuota/<int:cuota_id>/nota', methods=['POST'])
 @login_required
 def guardar_nota(cuota_id):
     cuota = Cuota.query.get_or_404(cuota_id)
@@ -484,7 +1768,7 @@ def guardar_nota(cuota_id):
 
 
 
-@app.route('/cuota/<int:cuota_id>/revertir', methods=['POST'])
+@rutas.route('/cuota/<int:cuota_id>/revertir', methods=['POST'])
 @login_required
 def revertir_pago_cuota(cuota_id):
     if current_user.rol != 'admin':
@@ -492,12 +1776,13 @@ def revertir_pago_cuota(cuota_id):
     cuota = Cuota.query.get_or_404(cuota_id)
     cuota.estado = 'pendiente'
     cuota.fecha_de_pago = None
+    actualizar_resumen_prestamo(cuota.prestamo_id)
     db.session.commit()
     flash(f'Pago de la cuota #{cuota.id} revertido.', 'success')
     return redirect(url_for('detalle_prestamo', prestamo_id=cuota.prestamo_id))
 
 
-@app.route('/cuota/<int:cuota_id>/editar', methods=['POST'])
+@rutas.route('/cuota/<int:cuota_id>/editar', methods=['POST'])
 @login_required
 def editar_cuota(cuota_id):
     cuota_a_editar = Cuota.query.get_or_404(cuota_id)
@@ -509,28 +1794,8 @@ def editar_cuota(cuota_id):
         return redirect(url_for('detalle_prestamo', prestamo_id=prestamo.id))
 
     try:
-        # --- LÓGICA DE AJUSTE AUTOMÁTICO ---
-        # 1. Calcular la diferencia
-        diferencia = nuevo_monto - cuota_a_editar.monto_cuota
-        
-        # 2. Actualizar la cuota actual
-        cuota_a_editar.monto_cuota = nuevo_monto
-        
-        # 3. Encontrar la ÚLTIMA cuota pendiente del préstamo
-        ultima_cuota = Cuota.query.filter(
-            Cuota.prestamo_id == prestamo.id,
-            Cuota.estado == 'pendiente',
-            Cuota.id != cuota_a_editar.id # Excluimos la que estamos editando si es la última
-        ).order_by(Cuota.fecha_vencimiento.desc()).first()
-
-        if ultima_cuota:
-            # 4. Ajustar la última cuota para balancear el total
-            ultima_cuota.monto_cuota -= diferencia
-        else:
-            # Si la cuota que editamos ES la última, verificamos que el saldo no quede negativo
-            # (En un caso real, aquí se podría manejar la lógica de si el préstamo se paga por completo)
-             pass
-
+        ajustar_monto_cuota(cuota_a_editar, nuevo_monto)
+        actualizar_resumen_prestamo(prestamo.id)
         db.session.commit()
         flash('Cuota actualizada y saldo ajustado en la última cuota.', 'success')
 
@@ -542,7 +1807,260 @@ def editar_cuota(cuota_id):
 
 
 
-@app.route('/admin/cliente/<int:cliente_id>/editar', methods=['GET', 'POST'])
+def _fecha_pago(valor):
+    """ Fecha de pago enviada por el dispositivo (ISO 8601, UTC); si falta o no es válida, ahora. """
+    if valor:
+        try:
+            fecha = datetime.fromisoformat(str(valor).replace('Z', '+00:00'))
+        except ValueError:
+            return datetime.utcnow()
+        if fecha.tzinfo:
+            fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+        return min(fecha, datetime.utcnow()) # Un reloj adelantado no registra pagos en el futuro
+    return datetime.utcnow()
+
+
+def ultimas_cuotas_pendientes(pagos_por_prestamo):
+    """
+    {prestamo_id: cuotas pendientes de la última a la primera} con una sola consulta. De cada
+    préstamo bastan sus pagos del lote + 1: es lo más que un lote puede dejar de tener pendiente.
+    """
+    if not pagos_por_prestamo:
+        return {}
+    orden = func.row_number().over(partition_by=Cuota.prestamo_id,
+                                   order_by=(Cuota.fecha_vencimiento.desc(), Cuota.id.desc())).label('orden')
+    ultimas = db.session.query(Cuota.id, orden)\
+        .filter(Cuota.prestamo_id.in_(pagos_por_prestamo), Cuota.estado == 'pendiente').subquery()
+    filas = db.session.query(Cuota).join(ultimas, ultimas.c.id == Cuota.id)\
+        .filter(ultimas.c.orden <= max(pagos_por_prestamo.values()) + 1)\
+        .order_by(Cuota.prestamo_id, ultimas.c.orden)
+    pendientes = {}
+    for cuota in filas:
+        pendientes.setdefault(cuota.prestamo_id, []).append(cuota)
+    return pendientes
+
+
+def aplicar_pagos(pagos):
+    """
+    Valida y aplica una lista de pagos [{"cuota_id", "monto"?, "fecha_pago"?}, ...] del usuario actual.
+    Devuelve (resultados por pago, ids de préstamos afectados). No hace commit ni actualiza resúmenes.
+    """
+    # isinstance(True, int) también es cierto: los booleanos de JSON no son ids de cuota
+    ids = [p.get('cuota_id') for p in pagos if isinstance(p, dict) and isinstance(p.get('cuota_id'), int)
+           and not isinstance(p.get('cuota_id'), bool)]
+    # Una sola consulta trae todas las cuotas junto con el cobrador de su préstamo
+    filas = db.session.query(Cuota, Prestamo.usuario_id).join(Prestamo)\
+        .filter(Cuota.id.in_(ids)).all() if ids else []
+    cuotas = {cuota.id: (cuota, usuario_id) for cuota, usuario_id in filas}
+    # Y otra las últimas cuotas pendientes de los préstamos con pagos de otro monto (ajustar_monto_cuota)
+    pagos_por_prestamo = Counter(cuotas[p['cuota_id']][0].prestamo_id for p in pagos
+                                 if isinstance(p, dict) and p.get('monto') is not None and p.get('cuota_id') in cuotas)
+    pendientes = ultimas_cuotas_pendientes(pagos_por_prestamo)
+
+    resultados = []
+    prestamos_afectados = set()
+    for pago in pagos:
+        cuota_id = pago.get('cuota_id') if isinstance(pago, dict) else None
+        resultado = {"cuota_id": cuota_id, "ok": False}
+        resultados.append(resultado)
+
+        if isinstance(cuota_id, bool) or cuota_id not in cuotas: # True == 1 como llave del diccionario
+            resultado["error"] = "Cuota no encontrada."
+            continue
+        cuota, usuario_id = cuotas[cuota_id]
+        if current_user.rol != 'admin' and usuario_id != current_user.id:
+            resultado["error"] = "La cuota no pertenece a un préstamo asignado a este cobrador."
+            continue
+        if cuota.estado != 'pendiente':
+            resultado["error"] = f"La cuota no está pendiente (estado: {cuota.estado})."
+            continue
+
+        monto = pago.get('monto')
+        if monto is not None:
+            try:
+                monto = float(monto)
+            except (TypeError, ValueError):
+                monto = 0
+            if not math.isfinite(monto) or monto <= 0: # float() acepta "nan" e "inf"
+                resultado["error"] = "Monto inválido."
+                continue
+            if monto != cuota.monto_cuota:
+                ajustar_monto_cuota(cuota, monto, pendientes.get(cuota.prestamo_id, []))
+
+        cuota.estado = 'pagada'
+        cuota.fecha_de_pago = _fecha_pago(pago.get('fecha_pago'))
+        prestamos_afectados.add(cuota.prestamo_id)
+        contar_al_confirmar('prestapp_pagos_registrados_total')
+        resultado.update(ok=True, monto=cuota.monto_cuota)
+
+    return resultados, prestamos_afectados
+
+
+MAX_PAGOS_POR_LOTE = 500
+
+@rutas.route('/api/cuotas/pagar', methods=['POST'])
+@login_required
+def pagar_cuotas_lote():
+    """
+    Registra varios pagos de la ruta de un cobrador en una sola transacción.
+    Recibe JSON {"pagos": [{"cuota_id": 1, "monto": 25000}, ...]} ("monto" es opcional: sin él
+    se paga el valor de la cuota; con otro valor se ajusta la última cuota, como en "Pago manual").
+    Responde con el resultado de cada pago; los que fallan la validación no impiden los demás.
+    """
+    datos = request.get_json(silent=True) or {}
+    if not isinstance(datos, dict):
+        return {"error": "El cuerpo debe ser un objeto JSON."}, 400
+    pagos = datos.get('pagos')
+    if not isinstance(pagos, list) or not pagos:
+        return {"error": "Envía una lista 'pagos' con al menos un elemento."}, 400
+    if len(pagos) > MAX_PAGOS_POR_LOTE:
+        return {"error": f"Máximo {MAX_PAGOS_POR_LOTE} pagos por lote."}, 400
+
+    resultados, prestamos_afectados = aplicar_pagos(pagos)
+
+    try:
+        for prestamo_id in prestamos_afectados:
+            actualizar_resumen_prestamo(prestamo_id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error en pago por lote: {e}")
+        return {"error": f"Error al registrar los pagos: {e}"}, 500
+
+    return {"aplicados": sum(1 for r in resultados if r["ok"]), "resultados": resultados}
+
+
+# --- SINCRONIZACIÓN PARA LA APP DEL COBRADOR ---
+# El teléfono guarda un cursor (una fecha) y en cada sincronización recibe solo las filas
+# de Prestamo/Cuota/Cliente con fecha_actualizacion >= cursor. El cursor nuevo queda un
+# margen atrás del momento de la consulta, para no perder transacciones que confirmaron
+# tarde con una fecha anterior; el teléfono aplica las filas por id, así que repetirlas no daña.
+
+MARGEN_SYNC = timedelta(seconds=60)
+
+
+def _prestamo_sync(prestamo):
+    resumen = prestamo.resumen
+    return {
+        "id": prestamo.id,
+        "cliente_id": prestamo.cliente_id,
+        "monto_prestado": prestamo.monto_prestado,
+        "monto_total_a_pagar": prestamo.monto_total_a_pagar,
+        "frecuencia": prestamo.frecuencia,
+        "estado": prestamo.estado,
+        "total_pagado": resumen.total_pagado if resumen else 0,
+        "saldo_pendiente": resumen.saldo_pendiente if resumen else prestamo.monto_total_a_pagar,
+    }
+
+
+def _cuota_sync(cuota):
+    return {
+        "id": cuota.id,
+        "prestamo_id": cuota.prestamo_id,
+        "monto_cuota": cuota.monto_cuota,
+        "fecha_vencimiento": cuota.fecha_vencimiento.isoformat(),
+        "estado": cuota.estado,
+        "fecha_de_pago": cuota.fecha_de_pago.isoformat() if cuota.fecha_de_pago else None,
+        "notas": cuota.notas,
+    }
+
+
+def _cliente_sync(cliente):
+    return {
+        "id": cliente.id,
+        "cedula": cliente.cedula,
+        "nombre_completo": cliente.nombre_completo,
+        "telefono": cliente.telefono,
+        "direccion": cliente.direccion,
+    }
+
+
+@rutas.route('/api/sync', methods=['GET', 'POST'])
+@login_required
+def api_sync():
+    """
+    Cambios desde `cursor` (ISO 8601, parámetro o campo JSON) para los préstamos del cobrador.
+    Con POST, primero aplica los pagos registrados sin conexión ({"cursor", "pagos": [...]},
+    mismo formato que /api/cuotas/pagar más "fecha_pago") en una sola transacción.
+
+    Respuesta: "prestamos", "cuotas" y "clientes" cambiados; "prestamo_ids" con TODOS los
+    préstamos asignados (el teléfono borra los que no estén); y el "cursor" para la próxima vez.
+    Si un préstamo viene en "prestamos", vienen también todas sus cuotas: el teléfono debe
+    reemplazar las que tenga (así se reflejan las cuotas borradas al reestructurar).
+    """
+    datos = request.get_json(silent=True) or {}
+    if not isinstance(datos, dict):
+        return {"error": "El cuerpo debe ser un objeto JSON."}, 400
+    cursor_texto = datos.get('cursor') or request.args.get('cursor')
+    cursor = None
+    if cursor_texto:
+        try:
+            cursor = datetime.fromisoformat(cursor_texto)
+        except (TypeError, ValueError):
+            return {"error": "Cursor inválido."}, 400
+        if cursor.tzinfo is not None: # las fechas de la base son UTC sin zona
+            cursor = cursor.astimezone(timezone.utc).replace(tzinfo=None)
+
+    resultados_pagos = []
+    pagos = datos.get('pagos') or []
+    if pagos:
+        if not isinstance(pagos, list) or len(pagos) > MAX_PAGOS_POR_LOTE:
+            return {"error": f"'pagos' debe ser una lista de máximo {MAX_PAGOS_POR_LOTE} elementos."}, 400
+        resultados_pagos, prestamos_afectados = aplicar_pagos(pagos)
+        try:
+            for prestamo_id in prestamos_afectados:
+                actualizar_resumen_prestamo(prestamo_id)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Error aplicando pagos sin conexión: {e}")
+            return {"error": f"Error al registrar los pagos: {e}"}, 500
+
+    inicio_consulta = datetime.utcnow()
+
+    # Alcance: los préstamos del cobrador (el admin ve toda la cartera)
+    alcance = Prestamo.query
+    if current_user.rol != 'admin':
+        alcance = alcance.filter(Prestamo.usuario_id == current_user.id)
+    prestamo_ids = [pid for (pid,) in alcance.with_entities(Prestamo.id)]
+
+    prestamos_q = alcance.options(joinedload(Prestamo.resumen))
+    cuotas_q = Cuota.query.join(Prestamo)
+    if current_user.rol != 'admin':
+        cuotas_q = cuotas_q.filter(Prestamo.usuario_id == current_user.id)
+
+    if cursor:
+        # Un pago cambia una cuota y el resumen del préstamo: el préstamo se reenvía aunque no
+        # cambió, y con TODAS sus cuotas, porque el teléfono reemplaza las que tiene
+        con_cuotas_cambiadas = cuotas_q.filter(Cuota.fecha_actualizacion >= cursor)\
+            .with_entities(Cuota.prestamo_id).distinct()
+        prestamos = prestamos_q.filter(or_(Prestamo.fecha_actualizacion >= cursor,
+                                           Prestamo.id.in_(con_cuotas_cambiadas))).all()
+        cuotas = Cuota.query.filter(Cuota.prestamo_id.in_([p.id for p in prestamos])).all() if prestamos else []
+        cliente_ids = {p.cliente_id for p in prestamos}
+        clientes = Cliente.query.filter(
+            Cliente.id.in_(alcance.with_entities(Prestamo.cliente_id)),
+            or_(Cliente.fecha_actualizacion >= cursor, Cliente.id.in_(cliente_ids))).all()
+    else:
+        prestamos = prestamos_q.all()
+        cuotas = cuotas_q.all()
+        clientes = Cliente.query.filter(Cliente.id.in_(alcance.with_entities(Prestamo.cliente_id))).all()
+
+    nuevo_cursor = inicio_consulta - MARGEN_SYNC
+    if cursor and nuevo_cursor < cursor:
+        nuevo_cursor = cursor
+
+    return {
+        "cursor": nuevo_cursor.isoformat(),
+        "pagos": resultados_pagos,
+        "prestamo_ids": prestamo_ids,
+        "prestamos": [_prestamo_sync(p) for p in prestamos],
+        "cuotas": [_cuota_sync(c) for c in cuotas],
+        "clientes": [_cliente_sync(c) for c in clientes],
+    }
+
+
+@rutas.route('/admin/cliente/<int:cliente_id>/editar', methods=['GET', 'POST'])
 @login_required
 def editar_cliente(cliente_id):
     if current_user.rol != 'admin':
@@ -567,20 +2085,70 @@ def editar_cliente(cliente_id):
     return render_template('editar_cliente.html', cliente=cliente)
 
 
-@app.route('/admin/clientes')
+CLIENTES_POR_PAGINA = 50
+
+@rutas.route('/admin/clientes')
 @login_required
+@leer_de_replica
 def gestion_clientes():
     if current_user.rol != 'admin':
         return redirect(url_for('index'))
 
-    # Consultamos todos los clientes ordenados por nombre
-    todos_los_clientes = Cliente.query.order_by(Cliente.nombre_completo).all()
+    # Paginación por llave (nombre, id): cada página es un rango del índice ix_cliente_nombre_id,
+    # sin OFFSET, así que cuesta lo mismo en la primera página que en la número mil.
+    busqueda = request.args.get('q', '').strip()
+    direccion = request.args.get('dir', 'sig')
+    cursor_nombre = request.args.get('nombre')
+    cursor_id = request.args.get('id', type=int)
+
+    consulta = Cliente.query
+    if busqueda:
+        # Búsqueda por prefijo: usa los índices de nombre, cédula y teléfono (un '%texto%' no podría)
+        prefijo = busqueda.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        consulta = consulta.filter(or_(
+            Cliente.nombre_completo.like(prefijo, escape='\\'),
+            Cliente.cedula.like(prefijo, escape='\\'),
+            Cliente.telefono.like(prefijo, escape='\\'),
+        ))
+
+    if cursor_nombre is not None and cursor_id is not None:
+        if direccion == 'ant':
+            consulta = consulta.filter(or_(
+                Cliente.nombre_completo < cursor_nombre,
+                and_(Cliente.nombre_completo == cursor_nombre, Cliente.id < cursor_id)))
+        else:
+            consulta = consulta.filter(or_(
+                Cliente.nombre_completo > cursor_nombre,
+                and_(Cliente.nombre_completo == cursor_nombre, Cliente.id > cursor_id)))
+
+    if direccion == 'ant':
+        consulta = consulta.order_by(Cliente.nombre_completo.desc(), Cliente.id.desc())
+    else:
+        consulta = consulta.order_by(Cliente.nombre_completo, Cliente.id)
+
+    # Pedimos uno de más para saber si hay otra página en esa dirección
+    clientes = consulta.limit(CLIENTES_POR_PAGINA + 1).all()
+    hay_mas = len(clientes) > CLIENTES_POR_PAGINA
+    clientes = clientes[:CLIENTES_POR_PAGINA]
+    if direccion == 'ant':
+        clientes.reverse()
+
+    hay_cursor = cursor_nombre is not None and cursor_id is not None
+    hay_siguiente = hay_mas if direccion != 'ant' else hay_cursor
+    hay_anterior = hay_mas if direccion == 'ant' else hay_cursor
+
+    siguiente = anterior = None
+    if clientes and hay_siguiente:
+        siguiente = dict(q=busqueda or None, dir='sig', nombre=clientes[-1].nombre_completo, id=clientes[-1].id)
+    if clientes and hay_anterior:
+        anterior = dict(q=busqueda or None, dir='ant', nombre=clientes[0].nombre_completo, id=clientes[0].id)
 
-    return render_template('clientes.html', clientes=todos_los_clientes)
+    return render_template('clientes.html', clientes=clientes, busqueda=busqueda,
+                           siguiente=siguiente, anterior=anterior)
 
 
 # En app.py
-@app.route('/admin/cliente/crear', methods=['GET', 'POST'])
+@rutas.route('/admin/cliente/crear', methods=['GET', 'POST'])
 @login_required
 def crear_cliente():
     if current_user.rol != 'admin':
@@ -608,7 +2176,7 @@ def crear_cliente():
     return render_template('crear_cliente.html')
 
 
-@app.route('/prestamo/cliente/<int:cliente_id>', methods=['GET', 'POST'])
+@rutas.route('/prestamo/cliente/<int:cliente_id>', methods=['GET', 'POST'])
 @login_required
 def prestamo_para_cliente(cliente_id):
     cliente = Cliente.query.get_or_404(cliente_id)
@@ -622,6 +2190,7 @@ def prestamo_para_cliente(cliente_id):
         cobrador_id = request.form.get('cobrador_id', current_user.id)
         cobrar_sabado = 'cobrarSabado' in request.form
         cobrar_domingo = 'cobrarDomingo' in request.form
+        saltar_festivos = 'saltarFestivos' in request.form
         fecha_inicio_str = request.form.get('fecha_inicio')
         cuota_manual_str = request.form.get('cuota_manual')
         valor_articulo = float(request.form.get('valor_articulo', monto)) # Get article value
@@ -643,103 +2212,32 @@ def prestamo_para_cliente(cliente_id):
             frecuencia=frecuencia,
             cobrar_sabado=cobrar_sabado,
             cobrar_domingo=cobrar_domingo,
+            saltar_festivos=saltar_festivos,
             cliente=cliente,
             usuario_id=cobrador_id,
             fecha_inicio=datetime.combine(fecha_inicio, datetime.min.time())
         )
         
-        # --- 3. Lógica de Cuotas: Decidir si es manual o sugerida ---
-        numero_cuotas = 0
-        if frecuencia == 'diaria':
-            dias_pago_aprox = 0
-            for i in range(plazo * 30):
-                dia_semana = (fecha_inicio + timedelta(days=i+1)).weekday()
-                if (dia_semana == 6 and not cobrar_domingo) or (dia_semana == 5 and not cobrar_sabado):
-                    continue
-                dias_pago_aprox += 1
-            numero_cuotas = dias_pago_aprox
-        elif frecuencia == 'semanal': numero_cuotas = plazo * 4
-        elif frecuencia == 'quincenal': numero_cuotas = plazo * 2
-        elif frecuencia == 'mensual': numero_cuotas = plazo
-
-        valor_cuota_final = 0
-        if cuota_manual_str and float(cuota_manual_str) > 0:
-            valor_cuota_final = float(cuota_manual_str)
-            if valor_cuota_final > 0:
-                numero_cuotas = math.ceil(total_a_pagar / valor_cuota_final)
-        else:
-            if numero_cuotas > 0:
-                valor_cuota_sugerida = total_a_pagar / numero_cuotas
-                valor_cuota_final = math.ceil(valor_cuota_sugerida / 1000) * 1000
-
-# --- 4. Generar las cuotas (THE CORE FIX IS HERE) ---
-        if numero_cuotas > 0 and valor_cuota_final > 0:
-            # Set the correct START date for the FIRST installment based on frequency
-            if frecuencia == 'diaria':
-                 fecha_proxima_cuota = fecha_inicio + timedelta(days=1)
-            elif frecuencia == 'semanal':
-                 fecha_proxima_cuota = fecha_inicio + timedelta(weeks=1)
-            elif frecuencia == 'quincenal':
-                 fecha_proxima_cuota = fecha_inicio + timedelta(days=15)
-            elif frecuencia == 'mensual':
-                 fecha_proxima_cuota = fecha_inicio + timedelta(days=30) # Simplified
+        # --- 3. Cuotas con el motor compartido: manual o sugerida ---
+        # La última es la cuota de ajuste con el saldo restante.
+        cuota_manual = float(cuota_manual_str) if cuota_manual_str else 0
+        cronograma = planificar_cuotas(total_a_pagar, plazo, frecuencia, fecha_inicio,
+                                       cobrar_sabado, cobrar_domingo, cuota_manual, saltar_festivos)
 
-            
-# Generate N-1 installments
-            for i in range(int(numero_cuotas) - 1):
-                # Always use fecha_proxima_cuota for the current installment's due date
-                cuota_vencimiento = fecha_proxima_cuota
-
-                # Specific logic for DAILY (skip weekends) - apply to the calculated date
-                if frecuencia == 'diaria':
-                    while True:
-                        dia_semana = cuota_vencimiento.weekday()
-                        if (dia_semana == 6 and not cobrar_domingo) or (dia_semana == 5 and not cobrar_sabado):
-                            cuota_vencimiento += timedelta(days=1) # If it lands on a weekend, push it
-                        else:
-                            break # Found a valid day
-
-                # Create the installment with the determined due date
-                cuota = Cuota(monto_cuota=valor_cuota_final, fecha_vencimiento=cuota_vencimiento, prestamo=nuevo_prestamo)
-                db.session.add(cuota)
-
-                # ** THE FIX: ** Calculate the NEXT due date based on the CURRENT valid due date
-                if frecuencia == 'diaria':
-                    # Start from the valid due date and add 1 day
-                    fecha_proxima_cuota = cuota_vencimiento + timedelta(days=1)
-                elif frecuencia == 'semanal':
-                    fecha_proxima_cuota += timedelta(weeks=1)
-                elif frecuencia == 'quincenal':
-                    fecha_proxima_cuota += timedelta(days=15)
-                elif frecuencia == 'mensual':
-                    fecha_proxima_cuota += timedelta(days=30) # Simplified
-
-            # Generate the final adjustment installment
-            total_parcial = valor_cuota_final * (numero_cuotas - 1)
-            ultima_cuota_valor = total_a_pagar - total_parcial
-            if ultima_cuota_valor > 0:
-                # Find the last due date (same logic as finding the next one)
-                ultima_fecha_vencimiento = fecha_proxima_cuota
-                if frecuencia == 'diaria':
-                     while True:
-                        dia_semana = ultima_fecha_vencimiento.weekday()
-                        if (dia_semana == 6 and not cobrar_domingo) or (dia_semana == 5 and not cobrar_sabado):
-                            ultima_fecha_vencimiento += timedelta(days=1)
-                        else: break
-
-                ultima_cuota = Cuota(monto_cuota=ultima_cuota_valor, fecha_vencimiento=ultima_fecha_vencimiento, prestamo=nuevo_prestamo)
-                db.session.add(ultima_cuota)
-
-        # --- 5. Save to DB (No changes here) ---
+        # --- 4. Save to DB: el préstamo y luego todas sus cuotas en un solo INSERT ---
         try:
             db.session.add(nuevo_prestamo)
+            db.session.flush()
+            guardar_cronograma(nuevo_prestamo.id, cronograma)
+            actualizar_resumen_prestamo(nuevo_prestamo.id)
+            contar_al_confirmar('prestapp_prestamos_creados_total')
             db.session.commit()
             flash('Préstamo creado exitosamente.', 'success')
             return redirect(url_for('admin_dashboard'))
         except Exception as e:
             db.session.rollback()
             flash(f'Error al crear el préstamo: {e}', 'danger')
-            app.logger.error(f"Error en creación de préstamo: {e}")
+            current_app.logger.error(f"Error en creación de préstamo: {e}")
 
     # --- GET request logic (No changes here) ---
     cobradores = Usuario.query.filter(or_(Usuario.rol == 'admin', Usuario.rol == 'cobrador')).all()
@@ -747,21 +2245,23 @@ def prestamo_para_cliente(cliente_id):
     return render_template('prestamo_final.html', cliente=cliente, cobradores=cobradores, fecha_hoy=fecha_hoy_str)
 
 
-@app.route('/admin/cliente/<int:cliente_id>/eliminar', methods=['POST'])
+@rutas.route('/admin/cliente/<int:cliente_id>/eliminar', methods=['POST'])
 @login_required
 def eliminar_cliente(cliente_id):
     if current_user.rol != 'admin':
         return redirect(url_for('index'))
     
-    cliente_a_eliminar = Cliente.query.get_or_404(cliente_id)
-    
-    # Lógica de seguridad: no permitir borrar si tiene préstamos
-    if cliente_a_eliminar.prestamos:
+    if not db.session.query(Cliente.id).filter_by(id=cliente_id).first():
+        abort(404)
+
+    # Lógica de seguridad: no permitir borrar si tiene préstamos (sin cargarlos)
+    if db.session.query(Prestamo.id).filter_by(cliente_id=cliente_id).first():
         flash('No se puede eliminar un cliente que tiene préstamos asociados.', 'danger')
         return redirect(url_for('gestion_clientes'))
     
     try:
-        db.session.delete(cliente_a_eliminar)
+        db.session.execute(delete(Cliente).where(Cliente.id == cliente_id)
+                           .execution_options(synchronize_session=False))
         db.session.commit()
         flash('Cliente eliminado correctamente.', 'success')
     except Exception as e:
@@ -771,7 +2271,7 @@ def eliminar_cliente(cliente_id):
     return redirect(url_for('gestion_clientes'))
 
 
-@app.route('/admin/usuarios')
+@rutas.route('/admin/usuarios')
 @login_required
 def gestion_usuarios():
     if current_user.rol != 'admin':
@@ -783,7 +2283,7 @@ def gestion_usuarios():
     return render_template('usuarios.html', usuarios=usuarios)
 
 
-@app.route('/admin/usuario/crear', methods=['GET', 'POST'])
+@rutas.route('/admin/usuario/crear', methods=['GET', 'POST'])
 @login_required
 def crear_usuario():
     if current_user.rol != 'admin':
@@ -802,13 +2302,15 @@ def crear_usuario():
             nuevo_usuario = Usuario(username=username, password_hash=password_hasheado, rol=rol)
             db.session.add(nuevo_usuario)
             db.session.commit()
+            # Por si el id se reutiliza tras borrar un usuario, no servimos una copia vieja
+            usuarios_cache.descartar(nuevo_usuario.id)
             flash('Usuario creado exitosamente.', 'success')
             return redirect(url_for('gestion_usuarios'))
 
     return render_template('crear_usuario.html')
 
 
-@app.route('/admin/usuario/<int:usuario_id>/editar', methods=['GET', 'POST'])
+@rutas.route('/admin/usuario/<int:usuario_id>/editar', methods=['GET', 'POST'])
 @login_required
 def editar_usuario(usuario_id):
     if current_user.rol != 'admin':
@@ -826,6 +2328,7 @@ def editar_usuario(usuario_id):
         if nueva_password:
             usuario_a_editar.password_hash = bcrypt.generate_password_hash(nueva_password).decode('utf-8')
         
+        usuarios_cache.invalidar(usuario_a_editar)
         db.session.commit()
         flash('Usuario actualizado correctamente.', 'success')
         return redirect(url_for('gestion_usuarios'))
@@ -833,7 +2336,7 @@ def editar_usuario(usuario_id):
     return render_template('editar_usuario.html', usuario=usuario_a_editar)
 
 
-@app.route('/admin/usuario/<int:usuario_id>/eliminar', methods=['POST'])
+@rutas.route('/admin/usuario/<int:usuario_id>/eliminar', methods=['POST'])
 @login_required
 def eliminar_usuario(usuario_id):
     if current_user.rol != 'admin':
@@ -853,23 +2356,22 @@ def eliminar_usuario(usuario_id):
     
     db.session.delete(usuario_a_eliminar)
     db.session.commit()
+    usuarios_cache.descartar(usuario_id)
     flash('Usuario eliminado correctamente.', 'success')
     return redirect(url_for('gestion_usuarios'))
 
 
-@app.route('/configuracion', methods=['GET', 'POST'])
+@rutas.route('/configuracion', methods=['GET', 'POST'])
 @login_required
 def configuracion():
     if current_user.rol != 'admin':
         flash('Acceso no autorizado.', 'danger')
         return redirect(url_for('index'))
     
-    # Buscamos la plantilla en la base de datos
-    template_obj = Configuracion.query.filter_by(clave='whatsapp_template').first()
-
     if request.method == 'POST':
         # Si el admin guarda el formulario
         nuevo_template = request.form.get('whatsapp_template')
+        template_obj = Configuracion.query.filter_by(clave='whatsapp_template').first()
         if template_obj:
             # Si ya existía, la actualizamos
             template_obj.valor = nuevo_template
@@ -877,6 +2379,7 @@ def configuracion():
             # Si no existía, la creamos
             template_obj = Configuracion(clave='whatsapp_template', valor=nuevo_template)
             db.session.add(template_obj)
+        config_cache.invalidar()
         db.session.commit()
         flash('Plantilla de WhatsApp guardada correctamente.', 'success')
         return redirect(url_for('configuracion'))
@@ -888,27 +2391,28 @@ def configuracion():
             if file and allowed_file(file.filename):
                 filename = "logo." + file.filename.rsplit('.', 1)[1].lower()
                 # Borramos el logo anterior si existe para no acumular archivos
-                for ext in app.config['ALLOWED_EXTENSIONS']:
-                    if os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], f"logo.{ext}")):
-                        os.remove(os.path.join(app.config['UPLOAD_FOLDER'], f"logo.{ext}"))
+                for ext in current_app.config['ALLOWED_EXTENSIONS']:
+                    if os.path.exists(os.path.join(current_app.config['UPLOAD_FOLDER'], f"logo.{ext}")):
+                        os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], f"logo.{ext}"))
 
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+                file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
 
                 logo_config = Configuracion.query.filter_by(clave='logo_filename').first()
                 if logo_config:
                     logo_config.valor = filename
                 else:
                     db.session.add(Configuracion(clave='logo_filename', valor=filename))
+                config_cache.invalidar()
                 db.session.commit()
                 flash('Logo actualizado correctamente.', 'success')
 
 
     # Si se carga la página, mostramos la plantilla actual o una por defecto
-    template_actual = template_obj.valor if template_obj else "Hola [cliente], te recordamos que tu cuota de $[monto_cuota] que vencía el [fecha_vencimiento] se encuentra pendiente. ¡Gracias!"
+    template_actual = config_cache.obtener('whatsapp_template') or "Hola [cliente], te recordamos que tu cuota de $[monto_cuota] que vencía el [fecha_vencimiento] se encuentra pendiente. ¡Gracias!"
     return render_template('configuracion.html', template_actual=template_actual)
 
 
-@app.route('/prestamo/<int:prestamo_id>/reestructurar', methods=['GET', 'POST'])
+@rutas.route('/prestamo/<int:prestamo_id>/reestructurar', methods=['GET', 'POST'])
 @login_required
 def reestructurar_prestamo(prestamo_id):
     if current_user.rol != 'admin':
@@ -917,10 +2421,14 @@ def reestructurar_prestamo(prestamo_id):
 
     prestamo = Prestamo.query.get_or_404(prestamo_id)
 
-    # 1. Calcular el estado actual del préstamo
-    cuotas_pagadas = [c for c in prestamo.cuotas if c.estado in ['pagada', 'pagada_tarde']]
-    total_pagado = sum(c.monto_cuota for c in cuotas_pagadas)
-    saldo_pendiente = prestamo.monto_total_a_pagar - total_pagado
+    # 1. Estado actual del préstamo, desde su resumen. Si aún no tiene (préstamos anteriores a la
+    # tabla resumen) se calcula desde las cuotas sin escribir nada: el GET no debe modificar la base.
+    if prestamo.resumen:
+        total_pagado = prestamo.resumen.total_pagado
+        saldo_pendiente = prestamo.resumen.saldo_pendiente
+    else:
+        total_pagado = totales_prestamo(prestamo.id)[0]
+        saldo_pendiente = prestamo.monto_total_a_pagar - total_pagado
 
     if request.method == 'POST':
         nuevo_valor_cuota_str = request.form.get('nueva_cuota')
@@ -932,25 +2440,21 @@ def reestructurar_prestamo(prestamo_id):
 
         try:
             # --- INICIO DE LA TRANSACCIÓN SEGURA ---
-            # 2. Borrar SOLO las cuotas pendientes
-            Cuota.query.filter_by(prestamo_id=prestamo.id, estado='pendiente').delete()
+            # 2. Borrar SOLO las cuotas pendientes, con un DELETE por conjunto. Ninguna cuota está
+            # cargada en la sesión, así que no hay objetos que sincronizar.
+            db.session.execute(delete(Cuota).where(Cuota.prestamo_id == prestamo.id, Cuota.estado == 'pendiente')
+                               .execution_options(synchronize_session=False))
             
-            # 3. Calcular y generar el nuevo plan de pagos
+            # 3. Calcular y generar el nuevo plan de pagos (motor compartido),
+            # respetando la frecuencia y los días de cobro del préstamo
             nuevo_numero_cuotas = math.ceil(saldo_pendiente / nuevo_valor_cuota)
-            fecha_actual = date.today() + timedelta(days=1)
-            
-            for _ in range(int(nuevo_numero_cuotas) - 1):
-                # (Aquí va tu lógica para encontrar la próxima fecha de pago válida)
-                cuota = Cuota(monto_cuota=nuevo_valor_cuota, fecha_vencimiento=fecha_actual, prestamo_id=prestamo.id)
-                db.session.add(cuota)
-                fecha_actual += timedelta(days=1) # O la frecuencia que corresponda
-
-            # Última cuota de ajuste
-            total_parcial = nuevo_valor_cuota * (nuevo_numero_cuotas - 1)
-            ultima_cuota_valor = saldo_pendiente - total_parcial
-            if ultima_cuota_valor > 0:
-                ultima_cuota = Cuota(monto_cuota=ultima_cuota_valor, fecha_vencimiento=fecha_actual, prestamo_id=prestamo.id)
-                db.session.add(ultima_cuota)
+            cronograma = generar_cronograma(saldo_pendiente, nuevo_numero_cuotas, nuevo_valor_cuota,
+                                            date.today() + timedelta(days=1), prestamo.frecuencia,
+                                            prestamo.cobrar_sabado, prestamo.cobrar_domingo, prestamo.saltar_festivos)
+            guardar_cronograma(prestamo.id, cronograma)
+            actualizar_resumen_prestamo(prestamo.id)
+            # Las cuotas borradas no dejan rastro: marcamos el préstamo para que /api/sync lo reenvíe completo
+            prestamo.fecha_actualizacion = datetime.utcnow()
 
             db.session.commit()
             # --- FIN DE LA TRANSACCIÓN ---
@@ -960,7 +2464,7 @@ def reestructurar_prestamo(prestamo_id):
         except Exception as e:
             db.session.rollback()
             flash(f'Error al reestructurar el préstamo: {e}', 'danger')
-            app.logger.error(f"Error reestructurando préstamo {prestamo_id}: {e}")
+            current_app.logger.error(f"Error reestructurando préstamo {prestamo_id}: {e}")
             return redirect(url_for('detalle_prestamo', prestamo_id=prestamo.id))
 
     # Si es GET, solo mostramos la página de resumen
@@ -970,19 +2474,28 @@ def reestructurar_prestamo(prestamo_id):
                            saldo_pendiente=saldo_pendiente)
 
 
-@app.route('/consulta')
+@rutas.route('/consulta')
 def consulta_cliente():
     """ Muestra el formulario para que el cliente ingrese su cédula. """
     return render_template('consulta_cliente.html')
 
-@app.route('/estado', methods=['POST'])
+@rutas.route('/estado', methods=['POST'])
 def ver_estado_prestamo():
     """ Busca el préstamo del cliente y muestra su estado. """
-    cedula = request.form.get('cedula')
+    if not limitador_estado.permitir(ip_cliente()):
+        flash('Has hecho demasiadas consultas seguidas. Espera un momento e inténtalo de nuevo.', 'warning')
+        return render_template('consulta_cliente.html'), 429
+
+    cedula = (request.form.get('cedula') or '').strip()
     if not cedula:
         flash('Debes ingresar un número de cédula.', 'warning')
         return redirect(url_for('consulta_cliente'))
 
+    # Página ya renderizada: cero consultas a la base de datos
+    html = cache_estado.obtener(cedula)
+    if html is not None:
+        return html
+
     cliente = Cliente.query.filter_by(cedula=cedula).first()
     
     # Buscamos un préstamo activo para este cliente
@@ -995,9 +2508,70 @@ def ver_estado_prestamo():
         return redirect(url_for('consulta_cliente'))
 
     today = date.today()
-    return render_template('estado_prestamo.html', prestamo=prestamo_activo, today=today)
+    html = render_template('estado_prestamo.html', prestamo=prestamo_activo, resumen=prestamo_activo.resumen, today=today)
+    cache_estado.guardar(cedula, prestamo_activo.id, html)
+    return html
+
+
+# --- FÁBRICA DE LA APLICACIÓN ---
+# Importar este módulo no crea la app ni abre el motor de la base de datos: eso lo hace
+# crear_app(), la primera vez que llega una petición (Vercel) o cuando la pide la CLI de Flask.
+
+def crear_app(cli=False):
+    """
+    App web completa: configuración, base de datos, login y todas las rutas. Con `cli=True`
+    registra también Flask-Migrate (flask db ...), que importa alembic y la web no necesita.
+    """
+    app = Flask(__name__)
+    app.config.update(configuracion_desde_entorno())
+    configurar_base(app, poolclass=PoolMedido)
+    bcrypt.init_app(app)
+    login_manager.init_app(app)
+    if cli:
+        from flask_migrate import Migrate
+        Migrate(app, db, render_as_batch=True) # batch para que SQLite pueda alterar tablas
+    usuarios_cache.ttl = app.config['USER_CACHE_TTL']
+    cache_estado.ttl = app.config['ESTADO_CACHE_TTL']
+    limitador_estado.tasa = app.config['ESTADO_CONSULTAS_POR_MINUTO'] / 60.0
+    limitador_estado.rafaga = app.config['ESTADO_RAFAGA']
+    app.register_blueprint(rutas)
+    logging.basicConfig(level=logging.INFO)
+    return app
+
+
+def create_app():
+    """ Punto de entrada de la CLI: "flask --app app ..." busca una fábrica con este nombre. """
+    return crear_app(cli=True)
+
+
+class AppPerezosa:
+    """
+    Aplicación WSGI que llama a la fábrica en la primera petición. Los demás atributos
+    (app_context, test_client, config...) se leen de la app ya creada.
+    """
+
+    def __init__(self, fabrica):
+        self._fabrica = fabrica
+        self._app = None
+        self._lock = threading.Lock()
+
+    def obtener(self):
+        if self._app is None:
+            with self._lock:
+                if self._app is None:
+                    self._app = self._fabrica()
+        return self._app
+
+    def __call__(self, environ, start_response):
+        return self.obtener()(environ, start_response)
+
+    def __getattr__(self, nombre):
+        return getattr(self.obtener(), nombre)
+
+
+app = AppPerezosa(crear_app) # La que usa Vercel (vercel.json) y la que importan los scripts
 
 
 # --- EJECUCIÓN DE LA APLICACIÓN ---
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5500, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5500, debug=True)
@@ -0,0 +1,120 @@
+# benchmark-arranque.py
+# Mide el arranque en frío: un proceso nuevo de Python importa la app y atiende su primera
+# petición (lo que paga Vercel en cada arranque). Con --antes REF mide lo mismo en otra versión
+# (un commit o rama, en un git worktree temporal) para comparar antes y después de un cambio.
+# Revisa además que importar la app y los modelos no cargue módulos que no hacen falta; termina
+# con código 1 si alguno se cuela, igual que benchmark-rutas.py con sus umbrales.
+#
+#   python benchmark-arranque.py --repeticiones 20
+#   python benchmark-arranque.py --antes HEAD~1 --guardar arranque.json
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+# Importación -> módulos que no debe cargar. Es el umbral estable: no depende de la máquina, y si
+# aparecen es que algo volvió a cargar de más al importar.
+PROHIBIDOS = {
+    'app': ['flask_migrate', 'alembic'], # las migraciones solo se cargan desde la CLI de Flask
+    'modelos': ['app', 'flask_migrate', 'alembic', 'flask_bcrypt'],
+}
+
+MEDIR_IMPORTACION = """
+import json, sys, time
+inicio = time.perf_counter()
+import {modulo}
+ms = (time.perf_counter() - inicio) * 1000
+print(json.dumps({{'ms': ms, 'modulos': sorted(m for m in sys.modules if '.' not in m)}}))
+"""
+
+# Importar y atender /consulta (página pública) con el cliente de pruebas: incluye crear la app,
+# el motor de la base de datos y la primera consulta
+MEDIR_PRIMERA_PETICION = """
+import json, time
+inicio = time.perf_counter()
+import app
+importacion = (time.perf_counter() - inicio) * 1000
+respuesta = app.app.test_client().get('/consulta')
+total = (time.perf_counter() - inicio) * 1000
+print(json.dumps({'importacion': importacion, 'total': total, 'codigo': respuesta.status_code}))
+"""
+
+
+def ejecutar(codigo, directorio):
+    """ Corre `codigo` en un proceso nuevo dentro de `directorio`; devuelve el JSON que imprime. """
+    salida = subprocess.run([sys.executable, '-c', codigo], capture_output=True, text=True, cwd=directorio)
+    if salida.returncode != 0:
+        sys.exit(f"Falló la medición en {directorio}:\n{salida.stderr}")
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def medir_arranque(directorio, repeticiones):
+    """ {'importacion': [ms], 'total': [ms]} de `repeticiones` arranques en frío. """
+    medidas = [ejecutar(MEDIR_PRIMERA_PETICION, directorio) for _ in range(repeticiones)]
+    if any(m['codigo'] >= 400 for m in medidas):
+        sys.exit(f"/consulta respondió {medidas[0]['codigo']} en {directorio}")
+    return {'importacion': [m['importacion'] for m in medidas], 'total': [m['total'] for m in medidas]}
+
+
+def copia_de_version(referencia):
+    """ Extrae `referencia` en un git worktree temporal; devuelve su directorio. """
+    destino = os.path.join(tempfile.mkdtemp(prefix='prestapp-'), 'arbol')
+    subprocess.run(['git', 'worktree', 'add', '--detach', destino, referencia], cwd=DIRECTORIO,
+                   check=True, capture_output=True)
+    return destino
+
+
+def borrar_version(destino):
+    subprocess.run(['git', 'worktree', 'remove', '--force', destino], cwd=DIRECTORIO, capture_output=True)
+    shutil.rmtree(os.path.dirname(destino), ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Tiempo de arranque en frío de PrestApp.")
+    parser.add_argument('--repeticiones', type=int, default=10)
+    parser.add_argument('--antes', help="Commit o rama contra el que comparar (ej. HEAD~1)")
+    parser.add_argument('--guardar', help="Guarda las medidas en un JSON para comparar entre versiones")
+    args = parser.parse_args()
+
+    versiones = {'actual': DIRECTORIO}
+    if args.antes:
+        versiones = {args.antes: copia_de_version(args.antes), 'actual': DIRECTORIO}
+    try:
+        resultados = {nombre: medir_arranque(directorio, args.repeticiones) for nombre, directorio in versiones.items()}
+    finally:
+        if args.antes:
+            borrar_version(versiones[args.antes])
+
+    print(f"{'versión':<14}{'n':>4}{'importar p50':>14}{'1ª petición p50':>17}{'máx ms':>9}")
+    for nombre, medidas in resultados.items():
+        print(f"{nombre:<14}{len(medidas['total']):>4}{percentil(medidas['importacion'], 50):>14.1f}"
+              f"{percentil(medidas['total'], 50):>17.1f}{max(medidas['total']):>9.1f}")
+    if args.antes:
+        antes, despues = resultados[args.antes], resultados['actual']
+        for medida, titulo in (('importacion', 'importar'), ('total', 'hasta la 1ª petición')):
+            diferencia = percentil(antes[medida], 50) - percentil(despues[medida], 50)
+            print(f"Diferencia {titulo}: {diferencia:+.1f} ms a favor de la versión actual")
+
+    fallas = 0
+    print(f"\n{'importación':<14}{'módulos':>9}  prohibidos")
+    for modulo, prohibidos in PROHIBIDOS.items():
+        cargados = ejecutar(MEDIR_IMPORTACION.format(modulo=modulo), DIRECTORIO)['modulos']
+        colados = [m for m in prohibidos if m in cargados]
+        fallas += bool(colados)
+        print(f"{modulo:<14}{len(cargados):>9}  {'FALLA (importa ' + ', '.join(colados) + ')' if colados else 'ok'}")
+        resultados.setdefault('modulos', {})[modulo] = cargados
+
+    if args.guardar:
+        with open(args.guardar, 'w') as archivo:
+            json.dump(resultados, archivo, indent=2)
+    sys.exit(1 if fallas else 0)
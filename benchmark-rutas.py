@@ -0,0 +1,187 @@
+# benchmark-rutas.py
+# Recorre las rutas principales con el cliente de pruebas de Flask contra la base configurada
+# en .env y reporta latencia (p50/p95) y número de consultas SQL por ruta. Termina con código 1
+# si alguna ruta supera su umbral, así sirve para detectar regresiones antes de desplegar.
+# Primero carga datos con: python generar-datos.py --clientes 2000
+#
+#   python benchmark-rutas.py --repeticiones 20
+#   python benchmark-rutas.py --umbrales mis-umbrales.json --guardar resultados.json
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import date
+
+# La consulta pública limita las peticiones por IP; en el benchmark todas vienen de la misma
+os.environ.setdefault('ESTADO_RAFAGA', '1000000')
+
+from sqlalchemy import event, delete
+from app import app, db, Usuario, Cliente, Prestamo, Cuota
+
+PASSWORD_POR_DEFECTO = 'bench123'
+
+# Ruta -> (p95 máximo en ms, consultas SQL máximas por petición). Las consultas son el umbral
+# estable: no dependen de la máquina, y si suben casi siempre es un N+1 nuevo.
+UMBRALES = {
+    'login': (1000, 2), # bcrypt domina el tiempo a propósito
+    'admin_dashboard': (600, 4),
+    'cobrador_dashboard': (300, 3),
+    'detalle_prestamo': (100, 3),
+    'api_cuotas_prestamo': (100, 3),
+    'gestion_clientes': (100, 2),
+    'gestion_clientes_busqueda': (100, 2),
+    'reporte_mora': (300, 2),
+    'exportar_cuotas_cobrador': (2000, 2),
+    'prestamo_para_cliente': (200, 8),
+    'pagar_cuota': (100, 8),
+    'revertir_pago': (100, 8),
+    'api_sync_inicial': (2000, 5), # descarga completa de la cartera del cobrador
+    'estado_publico': (100, 5),
+    'api_simulador': (50, 0), # no toca la base de datos
+}
+
+
+class ContadorConsultas:
+    """ Cuenta las sentencias que llegan al motor durante cada petición (sin el BEGIN explícito de SQLite). """
+
+    def __init__(self, motores):
+        self.total = 0
+        for motor in motores: # principal y réplica, si hay
+            event.listen(motor, 'before_cursor_execute', self._contar)
+
+    def _contar(self, conexion, cursor, sentencia, *args):
+        if not sentencia.startswith('BEGIN'):
+            self.total += 1
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def elegir_datos():
+    """ Un cobrador con préstamos activos, uno de sus préstamos, una cuota pendiente y un cliente. """
+    prestamo = Prestamo.query.join(Usuario, Prestamo.usuario_id == Usuario.id)\
+        .filter(Prestamo.estado == 'activo', Usuario.rol == 'cobrador', Usuario.username.like('bench_%'))\
+        .order_by(Prestamo.id).first()
+    if not prestamo:
+        sys.exit("No hay datos de prueba. Ejecuta primero: python generar-datos.py")
+    cuota = Cuota.query.filter_by(prestamo_id=prestamo.id, estado='pendiente').order_by(Cuota.fecha_vencimiento).first()
+    cliente = db.session.get(Cliente, prestamo.cliente_id)
+    return {'cobrador': db.session.get(Usuario, prestamo.usuario_id).username, 'cobrador_id': prestamo.usuario_id,
+            'prestamo_id': prestamo.id, 'cuota_id': cuota.id, 'cliente_id': cliente.id, 'cedula': cliente.cedula}
+
+
+def escenarios(datos):
+    """ (nombre, usuario, método, url, datos del formulario). Las rutas de escritura se deshacen entre sí. """
+    hoy = date.today().isoformat()
+    return [
+        ('admin_dashboard', 'admin', 'GET', '/admin/dashboard', None),
+        ('cobrador_dashboard', 'cobrador', 'GET', '/dashboard', None),
+        ('detalle_prestamo', 'admin', 'GET', f"/prestamo/{datos['prestamo_id']}", None),
+        ('api_cuotas_prestamo', 'admin', 'GET', f"/api/prestamo/{datos['prestamo_id']}/cuotas", None),
+        ('gestion_clientes', 'admin', 'GET', '/admin/clientes', None),
+        ('gestion_clientes_busqueda', 'admin', 'GET', '/admin/clientes?q=Cliente', None),
+        ('reporte_mora', 'admin', 'GET', '/admin/reportes/mora', None),
+        ('exportar_cuotas_cobrador', 'admin', 'GET', f"/admin/exportar?tabla=cuotas&cobrador_id={datos['cobrador_id']}", None),
+        ('prestamo_para_cliente', 'admin', 'POST', f"/prestamo/cliente/{datos['cliente_id']}",
+         {'monto': '500000', 'plazo': '2', 'interes': '20', 'frecuencia': 'diaria',
+          'cobrador_id': str(datos['cobrador_id']), 'fecha_inicio': hoy, 'cobrarSabado': 'on'}),
+        ('pagar_cuota', 'cobrador', 'POST', f"/cuota/{datos['cuota_id']}/pagar", {}),
+        ('revertir_pago', 'admin', 'POST', f"/cuota/{datos['cuota_id']}/revertir", {}),
+        ('api_sync_inicial', 'cobrador', 'GET', '/api/sync', None),
+        ('estado_publico', None, 'POST', '/estado', {'cedula': datos['cedula']}),
+        ('api_simulador', None, 'GET', f'/api/simulador?monto=500000&plazo=2&interes=20&frecuencia=diaria'
+                                       f'&fecha_inicio={hoy}&cobrarSabado=on&saltarFestivos=on', None),
+    ]
+
+
+def iniciar_sesion(cliente, username, password, contador):
+    inicio = time.perf_counter()
+    contador.total = 0
+    respuesta = cliente.post('/login', data={'username': username, 'password': password})
+    if respuesta.status_code != 302:
+        sys.exit(f"No se pudo iniciar sesión como {username}; ¿la contraseña es '{password}'?")
+    return (time.perf_counter() - inicio) * 1000, contador.total
+
+
+def medir(repeticiones, calentamiento, password):
+    with app.app_context():
+        contador = ContadorConsultas(db.engines.values())
+        datos = elegir_datos()
+        ultimo_prestamo = db.session.query(db.func.max(Prestamo.id)).scalar()
+        db.session.remove()
+
+    clientes = {None: app.test_client(), 'admin': app.test_client(), 'cobrador': app.test_client()}
+    resultados = {'login': {'ms': [], 'consultas': []}}
+    for rol, username in (('admin', 'bench_admin'), ('cobrador', datos['cobrador'])):
+        ms, consultas = iniciar_sesion(clientes[rol], username, password, contador)
+        resultados['login']['ms'].append(ms)
+        resultados['login']['consultas'].append(consultas)
+
+    for nombre, usuario, metodo, url, formulario in escenarios(datos):
+        resultados[nombre] = {'ms': [], 'consultas': []}
+    try:
+        # Las rutas se alternan dentro de cada vuelta para que pagar/revertir se compensen
+        for vuelta in range(calentamiento + repeticiones):
+            for nombre, usuario, metodo, url, formulario in escenarios(datos):
+                contador.total = 0
+                inicio = time.perf_counter()
+                respuesta = clientes[usuario].open(url, method=metodo, data=formulario)
+                respuesta.get_data() # Incluye el tiempo de generar respuestas en streaming (CSV)
+                ms = (time.perf_counter() - inicio) * 1000
+                if respuesta.status_code >= 400:
+                    sys.exit(f"{nombre}: {metodo} {url} respondió {respuesta.status_code}")
+                if vuelta >= calentamiento:
+                    resultados[nombre]['ms'].append(ms)
+                    resultados[nombre]['consultas'].append(contador.total)
+    finally:
+        # Borramos los préstamos que creó el benchmark (sus cuotas se borran en cascada)
+        with app.app_context():
+            db.session.execute(delete(Prestamo).where(Prestamo.id > (ultimo_prestamo or 0)))
+            db.session.commit()
+    return resultados
+
+
+def reportar(resultados, umbrales):
+    """ Imprime la tabla y devuelve cuántas rutas superaron su umbral. """
+    fallas = 0
+    print(f"{'ruta':<28}{'n':>4}{'p50 ms':>9}{'p95 ms':>9}{'máx ms':>9}{'consultas':>11}  umbral")
+    for nombre, medidas in resultados.items():
+        p50, p95 = percentil(medidas['ms'], 50), percentil(medidas['ms'], 95)
+        consultas = max(medidas['consultas'])
+        limite_ms, limite_consultas = umbrales.get(nombre, (None, None))
+        problemas = []
+        if limite_ms is not None and p95 > limite_ms:
+            problemas.append(f"p95 > {limite_ms}ms")
+        if limite_consultas is not None and consultas > limite_consultas:
+            problemas.append(f"consultas > {limite_consultas}")
+        fallas += bool(problemas)
+        estado = f"FALLA ({', '.join(problemas)})" if problemas else ('ok' if limite_ms is not None else 'sin umbral')
+        print(f"{nombre:<28}{len(medidas['ms']):>4}{p50:>9.1f}{p95:>9.1f}{max(medidas['ms']):>9.1f}{consultas:>11}  {estado}")
+    return fallas
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark de las rutas principales de PrestApp.")
+    parser.add_argument('--repeticiones', type=int, default=10)
+    parser.add_argument('--calentamiento', type=int, default=2, help="Vueltas sin medir (llenan las cachés)")
+    parser.add_argument('--password', default=PASSWORD_POR_DEFECTO, help="Contraseña de los usuarios bench_*")
+    parser.add_argument('--umbrales', help="JSON {ruta: [p95_ms, consultas]} que reemplaza los umbrales por defecto")
+    parser.add_argument('--guardar', help="Guarda las medidas en un JSON para comparar entre versiones")
+    args = parser.parse_args()
+
+    umbrales = dict(UMBRALES)
+    if args.umbrales:
+        with open(args.umbrales) as archivo:
+            umbrales.update({ruta: tuple(valor) for ruta, valor in json.load(archivo).items()})
+
+    resultados = medir(args.repeticiones, args.calentamiento, args.password)
+    fallas = reportar(resultados, umbrales)
+    if args.guardar:
+        with open(args.guardar, 'w') as archivo:
+            json.dump(resultados, archivo, indent=2)
+    if fallas:
+        print(f"\n{fallas} rutas superaron su umbral.")
+    sys.exit(1 if fallas else 0)
@@ -1,31 +1,11 @@
 # create_cobrador.py
-import os
-from dotenv import load_dotenv
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
+# Mismas tablas y misma conexión (.env) que app.py, sin cargar la app web
+from modelos import crear_app_datos, db, Usuario
 
-# Carga la configuración desde .env (mismas variables que app.py)
-load_dotenv()
-app = Flask(__name__)
-DB_USER = os.environ.get('DB_USER')
-DB_PASS = os.environ.get('DB_PASS')
-DB_HOST = os.environ.get('DB_HOST')
-DB_NAME = os.environ.get('DB_NAME')
-
-if not all([DB_USER, DB_PASS, DB_HOST, DB_NAME]):
-    raise ValueError("Faltan variables de entorno para la base de datos. Configura el archivo .env")
-
-app.config['SQLALCHEMY_DATABASE_URI'] = f"mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME}"
-db = SQLAlchemy(app)
+app = crear_app_datos()
 bcrypt = Bcrypt(app)
 
-class Usuario(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
-    rol = db.Column(db.String(50), nullable=False, default='cobrador')
-
 # --- SCRIPT DE CREACIÓN ---
 def crear_usuario():
     with app.app_context():
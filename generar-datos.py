@@ -0,0 +1,138 @@
+# generar-datos.py
+# Llena la base configurada en .env con datos sintéticos para pruebas y para benchmark-rutas.py:
+# cobradores, clientes y préstamos de todas las frecuencias con historial de pagos realista
+# (buenos pagadores, pagos tardíos y clientes en mora).
+# NO lo ejecutes contra la base de producción.
+#
+#   python generar-datos.py --clientes 2000 --cobradores 5 --semilla 42
+import argparse
+import random
+from datetime import datetime, date, timedelta
+from sqlalchemy import insert
+from app import app, db, bcrypt, Usuario, Cliente, Prestamo, Cuota, planificar_cuotas, reconstruir_resumenes
+
+PREFIJO_USUARIO = 'bench_'
+PASSWORD_POR_DEFECTO = 'bench123'
+CLIENTES_POR_LOTE = 500
+
+# (frecuencia, peso): la mayoría de la cartera real es de cobro diario
+FRECUENCIAS = [('diaria', 50), ('semanal', 25), ('quincenal', 15), ('mensual', 10)]
+# (probabilidad de pagar a tiempo, probabilidad de pagar tarde, peso); el resto queda pendiente (mora)
+PERFILES_PAGO = [(0.95, 0.05, 60), (0.70, 0.20, 25), (0.30, 0.20, 15)]
+
+
+def crear_usuarios(cobradores, password):
+    """ Crea bench_admin y bench_cobrador_N si no existen. Devuelve los ids de los cobradores. """
+    password_hash = bcrypt.generate_password_hash(password).decode('utf-8') # bcrypt es lento: un solo hash
+    nombres = [(f'{PREFIJO_USUARIO}admin', 'admin')] + \
+              [(f'{PREFIJO_USUARIO}cobrador_{i}', 'cobrador') for i in range(1, cobradores + 1)]
+    existentes = {u.username: u for u in Usuario.query.filter(Usuario.username.in_([n for n, _ in nombres]))}
+    for username, rol in nombres:
+        if username not in existentes:
+            existentes[username] = Usuario(username=username, password_hash=password_hash, rol=rol)
+            db.session.add(existentes[username])
+    db.session.commit()
+    return [existentes[username].id for username, _ in nombres]
+
+
+def historial_de_pagos(cronograma, hoy, perfil):
+    """ Estado y fecha de pago de cada cuota vencida según el perfil del cliente. """
+    a_tiempo, tarde, _ = perfil
+    cuotas = []
+    for fecha, monto in cronograma:
+        fila = {'monto_cuota': monto, 'fecha_vencimiento': fecha, 'estado': 'pendiente', 'fecha_de_pago': None}
+        if fecha < hoy:
+            azar = random.random()
+            if azar < a_tiempo:
+                fila['estado'] = 'pagada'
+                fila['fecha_de_pago'] = datetime.combine(fecha, datetime.min.time()) + timedelta(hours=random.randint(8, 18))
+            elif azar < a_tiempo + tarde:
+                atraso = min(random.randint(1, 15), (hoy - fecha).days)
+                fila['estado'] = 'pagada_tarde'
+                fila['fecha_de_pago'] = datetime.combine(fecha + timedelta(days=atraso), datetime.min.time())
+        cuotas.append(fila)
+    return cuotas
+
+
+def nuevo_prestamo(cliente_id, cobrador_id, hoy, historico=False):
+    """ (Prestamo, cuotas) con montos, plazos y fechas al azar; los históricos ya terminaron. """
+    frecuencia = random.choices([f for f, _ in FRECUENCIAS], weights=[p for _, p in FRECUENCIAS])[0]
+    plazo = random.randint(1, 6)
+    monto = random.randint(2, 40) * 50000
+    interes = random.choice([10, 15, 20])
+    dias_atras = random.randint(plazo * 30 + 10, plazo * 30 + 400) if historico else random.randint(0, plazo * 30 + 60)
+    fecha_inicio = hoy - timedelta(days=dias_atras)
+    cobrar_sabado, cobrar_domingo = random.random() < 0.8, random.random() < 0.1
+    saltar_festivos = random.random() < 0.7
+    total_a_pagar = monto * (1 + (interes / 100) * plazo)
+
+    cronograma = planificar_cuotas(total_a_pagar, plazo, frecuencia, fecha_inicio, cobrar_sabado, cobrar_domingo,
+                                   saltar_festivos=saltar_festivos)
+    perfil = (1.0, 0.0, 0) if historico else random.choices(PERFILES_PAGO, weights=[p[2] for p in PERFILES_PAGO])[0]
+    cuotas = historial_de_pagos(cronograma, hoy, perfil)
+    pagado = all(c['estado'] != 'pendiente' for c in cuotas)
+
+    prestamo = Prestamo(
+        valor_articulo=monto, abono_inicial=0, monto_prestado=monto, tasa_interes_mensual=interes,
+        plazo_meses=plazo, monto_total_a_pagar=total_a_pagar, frecuencia=frecuencia,
+        cobrar_sabado=cobrar_sabado, cobrar_domingo=cobrar_domingo, saltar_festivos=saltar_festivos, estado='pagado' if pagado else 'activo',
+        cliente_id=cliente_id, usuario_id=cobrador_id,
+        fecha_inicio=datetime.combine(fecha_inicio, datetime.min.time()),
+    )
+    return prestamo, cuotas
+
+
+def generar(clientes, cobradores, password, hoy):
+    cobradores_ids = crear_usuarios(cobradores, password)[1:]
+    # Continuamos la numeración si ya se generaron datos antes
+    base = db.session.query(Cliente).filter(Cliente.nombre_completo.like('Cliente Sintético %')).count()
+    totales = {'clientes': 0, 'prestamos': 0, 'cuotas': 0}
+
+    for desde in range(0, clientes, CLIENTES_POR_LOTE):
+        numeros = range(base + desde, base + min(desde + CLIENTES_POR_LOTE, clientes))
+        filas = [{'cedula': f'8{n:09d}', 'nombre_completo': f'Cliente Sintético {n}',
+                  'telefono': f'57300{n:07d}', 'direccion': f'Calle {n % 200} # {n % 97}-{n % 31}'} for n in numeros]
+        db.session.execute(insert(Cliente), filas)
+        ids = [cliente_id for (cliente_id,) in db.session.query(Cliente.id)
+               .filter(Cliente.cedula.in_([f['cedula'] for f in filas]))]
+
+        # Un préstamo vigente por cliente y, para algunos, uno anterior ya pagado
+        prestamos = []
+        for cliente_id in ids:
+            cobrador_id = random.choice(cobradores_ids)
+            if random.random() < 0.3:
+                prestamos.append(nuevo_prestamo(cliente_id, cobrador_id, hoy, historico=True))
+            prestamos.append(nuevo_prestamo(cliente_id, cobrador_id, hoy))
+        db.session.add_all([prestamo for prestamo, _ in prestamos])
+        db.session.flush()
+
+        cuotas = [dict(cuota, prestamo_id=prestamo.id) for prestamo, lista in prestamos for cuota in lista]
+        if cuotas:
+            db.session.execute(insert(Cuota), cuotas)
+        db.session.commit()
+        totales['clientes'] += len(ids)
+        totales['prestamos'] += len(prestamos)
+        totales['cuotas'] += len(cuotas)
+        print(f"  {totales['clientes']}/{clientes} clientes...")
+
+    reconstruir_resumenes()
+    db.session.commit()
+    return totales
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Genera datos sintéticos de PrestApp.")
+    parser.add_argument('--clientes', type=int, default=1000)
+    parser.add_argument('--cobradores', type=int, default=5)
+    parser.add_argument('--password', default=PASSWORD_POR_DEFECTO, help="Contraseña de los usuarios bench_*")
+    parser.add_argument('--semilla', type=int, default=42, help="Misma semilla, mismos datos")
+    args = parser.parse_args()
+
+    random.seed(args.semilla)
+    with app.app_context():
+        inicio = datetime.now()
+        totales = generar(args.clientes, args.cobradores, args.password, date.today())
+        segundos = (datetime.now() - inicio).total_seconds()
+    print(f"Listo en {segundos:.1f}s: {totales['clientes']} clientes, {totales['prestamos']} préstamos "
+          f"y {totales['cuotas']} cuotas. Usuarios: {PREFIJO_USUARIO}admin / {PREFIJO_USUARIO}cobrador_N "
+          f"(contraseña '{args.password}').")
@@ -97,14 +97,25 @@ def run_migrations_online():
     connectable = get_engine()
 
     with connectable.connect() as connection:
+        # En SQLite, batch_alter_table recrea las tablas (copiar, borrar, renombrar); con las
+        # llaves foráneas activas, borrar 'prestamo' borraría en cascada o rechazaría sus cuotas.
+        # El PRAGMA no tiene efecto dentro de una transacción, así que va antes de abrirla.
+        sqlite = connection.dialect.name == 'sqlite'
+        if sqlite:
+            connection.connection.cursor().execute("PRAGMA foreign_keys=OFF")
+
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
             **conf_args
         )
 
-        with context.begin_transaction():
-            context.run_migrations()
+        try:
+            with context.begin_transaction():
+                context.run_migrations()
+        finally:
+            if sqlite:
+                connection.connection.cursor().execute("PRAGMA foreign_keys=ON")
 
 
 if context.is_offline_mode():
@@ -0,0 +1,27 @@
+"""Añade saltar_festivos a prestamo
+
+Revision ID: d3f8a2c61b90
+Revises: b58e1c4a7f03
+Create Date: 2026-10-17 18:42:10.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f8a2c61b90'
+down_revision = 'b58e1c4a7f03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Los préstamos existentes conservan su cronograma: no saltan festivos
+    with op.batch_alter_table('prestamo', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('saltar_festivos', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('prestamo', schema=None) as batch_op:
+        batch_op.drop_column('saltar_festivos')
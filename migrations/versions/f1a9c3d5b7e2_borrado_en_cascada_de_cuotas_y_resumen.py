@@ -0,0 +1,50 @@
+"""ON DELETE CASCADE de cuota y resumen_prestamo hacia prestamo
+
+Revision ID: f1a9c3d5b7e2
+Revises: d3f8a2c61b90
+Create Date: 2026-10-17 20:16:54.902617
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a9c3d5b7e2'
+down_revision = 'd3f8a2c61b90'
+branch_labels = None
+depends_on = None
+
+# Las llaves foráneas originales no tienen nombre: en MySQL se llaman cuota_ibfk_N y en SQLite
+# no tienen ninguno. Con esta convención batch_alter_table les da uno al reflejar la tabla en SQLite.
+CONVENCION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+TABLAS = ('cuota', 'resumen_prestamo')
+
+
+def _nombre_fk(tabla):
+    """ Nombre de la llave foránea tabla.prestamo_id -> prestamo.id, o el de la convención si no tiene. """
+    for fk in sa.inspect(op.get_bind()).get_foreign_keys(tabla):
+        if fk['referred_table'] == 'prestamo' and fk['constrained_columns'] == ['prestamo_id']:
+            return fk['name'] or CONVENCION['fk'] % {'table_name': tabla, 'column_0_name': 'prestamo_id',
+                                                     'referred_table_name': 'prestamo'}
+    return None
+
+
+def _cambiar_fk(tabla, ondelete):
+    nombre = _nombre_fk(tabla)
+    with op.batch_alter_table(tabla, schema=None, naming_convention=CONVENCION) as batch_op:
+        if nombre:
+            batch_op.drop_constraint(nombre, type_='foreignkey')
+        batch_op.create_foreign_key(f'fk_{tabla}_prestamo_id_prestamo', 'prestamo', ['prestamo_id'], ['id'],
+                                    ondelete=ondelete)
+
+
+def upgrade():
+    # Borrar un préstamo pasa a ser un solo DELETE: la base de datos borra sus cuotas y su resumen
+    for tabla in TABLAS:
+        _cambiar_fk(tabla, 'CASCADE')
+
+
+def downgrade():
+    for tabla in TABLAS:
+        _cambiar_fk(tabla, None)
@@ -0,0 +1,9 @@
+# modelos: base de datos y tablas de PrestApp, sin la capa web (rutas, login, migraciones).
+# scheduler.py y los scripts de consola importan desde aquí; app.py también.
+from dotenv import load_dotenv
+
+load_dotenv() # Antes de importar .tablas: config_cache lee su TTL del entorno
+
+from .base import db, configurar_base, crear_app_datos, SesionConReplica
+from .tablas import (Usuario, Cliente, Prestamo, Cuota, ResumenPrestamo, Recordatorio, Configuracion,
+                     CacheConfiguracion, config_cache)
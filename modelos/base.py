@@ -0,0 +1,130 @@
+# modelos/base.py
+# Conexión a la base de datos. No depende de la app web: configurar_base(app) deja `db` lista
+# en cualquier app Flask (la de app.py, o la mínima de crear_app_datos para scheduler.py y scripts).
+import os
+from flask import Flask, request, has_request_context, g
+from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as SesionFlaskSQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+
+
+class SesionConReplica(SesionFlaskSQLAlchemy):
+    """
+    Sesión que envía los SELECT a la réplica cuando la petición lo permite (g.leer_de_replica).
+    Los flush, los INSERT/UPDATE/DELETE y los SELECT ... FOR UPDATE siempre van a la principal.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and isinstance(clause, Select) and clause._for_update_arg is None
+                and has_request_context() and g.get('leer_de_replica')):
+            return self._db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': SesionConReplica})
+
+
+# --- AJUSTES DE SQLITE ---
+# WAL deja leer mientras otra conexión escribe; synchronous=NORMAL es seguro con WAL y evita un
+# fsync por commit; foreign_keys hace cumplir las llaves foráneas como MySQL (SQLite no lo hace
+# por defecto). pysqlite abre las transacciones a su manera, así que las abrimos nosotros
+# para que los commits, rollbacks y savepoints de SQLAlchemy funcionen como se espera.
+PRAGMAS_SQLITE = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'foreign_keys': 'ON',
+    'busy_timeout': 15000, # ms, igual que el timeout de la conexión
+    'cache_size': -64000, # 64 MB de caché de páginas por conexión
+    'temp_store': 'MEMORY',
+    'mmap_size': 268435456, # lecturas mapeadas en memoria (256 MB)
+}
+
+
+def _configurar_conexion_sqlite(conexion_dbapi, registro):
+    conexion_dbapi.isolation_level = None # sin BEGIN implícitos de pysqlite
+    cursor = conexion_dbapi.cursor()
+    for pragma, valor in PRAGMAS_SQLITE.items():
+        cursor.execute(f"PRAGMA {pragma}={valor}")
+    cursor.close()
+
+
+def _iniciar_transaccion_sqlite(conexion):
+    # Una transacción que lee y luego escribe no puede esperar el bloqueo de escritura (SQLite
+    # falla de inmediato con "database is locked"), así que las que pueden escribir lo toman al
+    # empezar con BEGIN IMMEDIATE. Las peticiones GET solo leen y no bloquean a nadie.
+    solo_lectura = has_request_context() and request.method in ('GET', 'HEAD', 'OPTIONS')
+    conexion.exec_driver_sql("BEGIN" if solo_lectura else "BEGIN IMMEDIATE")
+
+
+# --- CONEXIÓN ---
+# DB_ENGINE=mysql (por defecto) usa el MySQL de Hostinger con las variables DB_*.
+# DB_ENGINE=sqlite guarda todo en un archivo local (DB_SQLITE_PATH): pensado para una sola
+# oficina, para pruebas y para benchmark-rutas.py. No sirve en Vercel (el disco no persiste).
+#
+# Réplica de lectura (opcional): los reportes GET marcados con @leer_de_replica leen de ella
+# para no competir con el registro de pagos. MySQL: DB_REPLICA_HOST con el mismo usuario, clave
+# y base que la principal. SQLite: DB_REPLICA_SQLITE_PATH, un segundo archivo que se actualiza
+# con "flask copiar-replica" (sirve para probar el enrutamiento en local). Sin réplica todo va
+# a la base principal.
+
+def configurar_base(app, **opciones_motor):
+    """
+    Lee la conexión del entorno (.env) e inicializa `db` en la app. `opciones_motor` se suman
+    a SQLALCHEMY_ENGINE_OPTIONS (la app web las usa para medir la espera del pool).
+    """
+    motor = os.environ.get('DB_ENGINE', 'mysql').lower()
+    app.config['DB_ENGINE'] = motor
+
+    if motor == 'sqlite':
+        ruta = os.path.abspath(os.environ.get('DB_SQLITE_PATH', os.path.join(app.instance_path, 'prestapp.db')))
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        app.config['DB_SQLITE_PATH'] = ruta
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{ruta}"
+        # Conexiones compartidas entre los hilos del servidor (una por petición, desde el pool);
+        # timeout: segundos que una escritura espera a que otra termine antes de fallar con "database is locked"
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'connect_args': {'check_same_thread': False, 'timeout': 15},
+        }
+        if os.environ.get('DB_REPLICA_SQLITE_PATH'):
+            app.config['DB_REPLICA_SQLITE_PATH'] = os.path.abspath(os.environ['DB_REPLICA_SQLITE_PATH'])
+            app.config['SQLALCHEMY_BINDS'] = {'replica': f"sqlite:///{app.config['DB_REPLICA_SQLITE_PATH']}"}
+    else:
+        # --- Conexión a la Base de Datos de Hostinger ---
+        usuario = os.environ.get('DB_USER')
+        clave = os.environ.get('DB_PASS')
+        host = os.environ.get('DB_HOST')
+        nombre = os.environ.get('DB_NAME')
+
+        # Construimos la cadena de conexión solo si todas las variables existen
+        if not all([usuario, clave, host, nombre]):
+            raise ValueError("Faltan variables de entorno para la base de datos. Asegúrate de configurar el archivo .env")
+
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"mysql+pymysql://{usuario}:{clave}@{host}/{nombre}"
+
+        # Evita el "MySQL server has gone away" (Internal Server Error que se soluciona al refrescar):
+        # pool_pre_ping verifica la conexión antes de usarla y reconecta si el servidor la cerró;
+        # pool_recycle la renueva antes de que Hostinger la cierre por inactividad.
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'pool_pre_ping': True,
+            'pool_recycle': 280,
+        }
+        if os.environ.get('DB_REPLICA_HOST'):
+            app.config['SQLALCHEMY_BINDS'] = {
+                'replica': f"mysql+pymysql://{usuario}:{clave}@{os.environ['DB_REPLICA_HOST']}/{nombre}"}
+
+    app.config['DB_REPLICA_CONFIGURADA'] = 'replica' in (app.config.get('SQLALCHEMY_BINDS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'].update(opciones_motor)
+    db.init_app(app)
+
+    if motor == 'sqlite':
+        with app.app_context():
+            for motor_sqlite in db.engines.values(): # principal y réplica
+                event.listen(motor_sqlite, 'connect', _configurar_conexion_sqlite)
+                event.listen(motor_sqlite, 'begin', _iniciar_transaccion_sqlite)
+    return app
+
+
+def crear_app_datos():
+    """ App Flask mínima, solo con la base de datos: para scheduler.py y los scripts de consola. """
+    return configurar_base(Flask(__name__))
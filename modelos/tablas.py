@@ -0,0 +1,199 @@
+# modelos/tablas.py
+# Tablas de PrestApp. Se importan sin la app web (scheduler.py, scripts de consola).
+import os
+import time
+import uuid
+import threading
+from datetime import datetime
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session as SessionBase
+from .base import db
+
+
+# --- MODELOS DE BASE DE DATOS ---
+class Usuario(db.Model, UserMixin):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    password_hash = db.Column(db.String(128), nullable=False)
+    rol = db.Column(db.String(50), nullable=False, default='cobrador')
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1') # Sube con cada cambio (ver CacheUsuarios)
+    
+    prestamos_asignados = db.relationship('Prestamo', backref='cobrador', lazy=True)
+
+
+class Cliente(db.Model):
+    # (nombre, id) sostiene el orden y la paginación por llave de gestion_clientes;
+    # cédula (única) y teléfono sostienen la búsqueda por prefijo.
+    __table_args__ = (
+        db.Index('ix_cliente_nombre_id', 'nombre_completo', 'id'),
+        db.Index('ix_cliente_telefono', 'telefono'),
+        db.Index('ix_cliente_fecha_actualizacion', 'fecha_actualizacion'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    cedula = db.Column(db.String(20), unique=True, nullable=False)
+    nombre_completo = db.Column(db.String(120), nullable=False)
+    direccion = db.Column(db.String(200), nullable=True)
+    telefono = db.Column(db.String(20), nullable=True)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow) # Para /api/sync
+    prestamos = db.relationship('Prestamo', backref='cliente', lazy=True)
+
+class Prestamo(db.Model):
+    # Préstamos por cobrador y por cliente, casi siempre filtrados por estado
+    __table_args__ = (
+        db.Index('ix_prestamo_usuario_estado', 'usuario_id', 'estado'),
+        db.Index('ix_prestamo_cliente_estado', 'cliente_id', 'estado'),
+        db.Index('ix_prestamo_usuario_actualizacion', 'usuario_id', 'fecha_actualizacion'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    monto_prestado = db.Column(db.Float, nullable=False)
+    tasa_interes_mensual = db.Column(db.Float, nullable=False)
+    plazo_meses = db.Column(db.Integer, nullable=False)
+    monto_total_a_pagar = db.Column(db.Float, nullable=False)
+    frecuencia = db.Column(db.String(20), default='diaria', nullable=False)
+    fecha_inicio = db.Column(db.DateTime, default=datetime.utcnow)
+    estado = db.Column(db.String(20), default='activo')
+    cobrar_sabado = db.Column(db.Boolean, default=True)
+    cobrar_domingo = db.Column(db.Boolean, default=False)
+    saltar_festivos = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False) # No cobrar en festivos
+    cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id'), nullable=False)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow) # Para /api/sync
+    # La base de datos borra cuotas y resumen (ON DELETE CASCADE); passive_deletes evita que el ORM
+    # los cargue para borrarlos uno por uno
+    cuotas = db.relationship('Cuota', backref='prestamo', lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+    resumen = db.relationship('ResumenPrestamo', backref='prestamo', uselist=False, lazy=True,
+                              cascade="all, delete-orphan", passive_deletes=True)
+
+    valor_articulo = db.Column(db.Float, nullable=True) # El valor total del bien
+    abono_inicial = db.Column(db.Float, nullable=True, default=0) # El downpayment
+    monto_prestado = db.Column(db.Float, nullable=False) # Este será el monto a financiar
+
+
+class Cuota(db.Model):
+    # (prestamo_id, estado, fecha): cuotas de un préstamo por estado y orden de vencimiento (editar_cuota, resúmenes)
+    # (estado, fecha): cuotas pendientes por rango de vencimiento (scheduler.py)
+    __table_args__ = (
+        db.Index('ix_cuota_prestamo_estado_vencimiento', 'prestamo_id', 'estado', 'fecha_vencimiento'),
+        db.Index('ix_cuota_estado_vencimiento', 'estado', 'fecha_vencimiento'),
+        db.Index('ix_cuota_fecha_actualizacion', 'fecha_actualizacion'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    monto_cuota = db.Column(db.Float, nullable=False)
+    fecha_vencimiento = db.Column(db.Date, nullable=False)
+    estado = db.Column(db.String(20), default='pendiente')
+    fecha_de_pago = db.Column(db.DateTime, nullable=True)
+    notas = db.Column(db.Text, nullable=True)
+    prestamo_id = db.Column(db.Integer, db.ForeignKey('prestamo.id', ondelete='CASCADE'), nullable=False)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow) # Para /api/sync
+
+class ResumenPrestamo(db.Model):
+    """ Totales de un préstamo, mantenidos en la misma transacción que modifica sus cuotas. """
+    prestamo_id = db.Column(db.Integer, db.ForeignKey('prestamo.id', ondelete='CASCADE'), primary_key=True)
+    total_pagado = db.Column(db.Float, nullable=False, default=0)
+    saldo_pendiente = db.Column(db.Float, nullable=False, default=0)
+    cuotas_pagadas = db.Column(db.Integer, nullable=False, default=0)
+    cuotas_pendientes = db.Column(db.Integer, nullable=False, default=0)
+    proxima_fecha_vencimiento = db.Column(db.Date, nullable=True) # Próxima cuota pendiente
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Recordatorio(db.Model):
+    """ Bandeja de salida de recordatorios: una fila por cuota y día, con su estado de envío y reintentos. """
+    __table_args__ = (
+        db.UniqueConstraint('cuota_id', 'fecha', name='uq_recordatorio_cuota_fecha'),
+        db.Index('ix_recordatorio_estado', 'estado', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # ON DELETE CASCADE: borrar o reestructurar cuotas no debe quedar bloqueado por sus recordatorios
+    cuota_id = db.Column(db.Integer, db.ForeignKey('cuota.id', ondelete='CASCADE'), nullable=False)
+    fecha = db.Column(db.Date, nullable=False) # Día en que se encoló el recordatorio
+    telefono = db.Column(db.String(20), nullable=False)
+    mensaje = db.Column(db.Text, nullable=False)
+    estado = db.Column(db.String(20), nullable=False, default='pendiente') # pendiente, enviado, fallido, descartado
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    ultimo_error = db.Column(db.Text, nullable=True)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_envio = db.Column(db.DateTime, nullable=True)
+
+class Configuracion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    clave = db.Column(db.String(50), unique=True, nullable=False)
+    valor = db.Column(db.Text, nullable=True)
+
+
+# --- CACHÉ DE CONFIGURACIÓN ---
+# La tabla Configuracion casi nunca cambia, pero inject_logo la leía en cada render.
+# Cada proceso guarda una copia completa; al vencer el TTL solo consulta la fila
+# 'config_version' y recarga todo si otro proceso la cambió con invalidar(). La copia local se
+# descarta al hacer commit: si se descartara antes, otra petición podría recargar el valor viejo
+# y quedarse con él todo el TTL.
+
+class CacheConfiguracion:
+    CLAVE_VERSION = 'config_version'
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._valores = None
+        self._version = None
+        self._vence = 0
+        self._lock = threading.Lock()
+
+    def _cargar(self):
+        self._valores = dict(db.session.query(Configuracion.clave, Configuracion.valor).all())
+        self._version = self._valores.get(self.CLAVE_VERSION)
+
+    def _refrescar(self):
+        if self._valores is None:
+            self._cargar()
+        else:
+            version = db.session.query(Configuracion.valor).filter_by(clave=self.CLAVE_VERSION).scalar()
+            if version != self._version:
+                self._cargar()
+        self._vence = time.monotonic() + self.ttl
+
+    def obtener(self, clave, default=None, tipo=str):
+        """ Valor de `clave` convertido a `tipo`, o `default` si no existe o está vacío. """
+        with self._lock:
+            if self._valores is None or time.monotonic() >= self._vence:
+                self._refrescar()
+            valor = self._valores.get(clave)
+        if valor is None or valor == '':
+            return default
+        try:
+            return tipo(valor)
+        except (TypeError, ValueError):
+            return default
+
+    def invalidar(self):
+        """ Cambia la versión compartida en la transacción actual; la copia local se descarta al hacer commit. """
+        version = Configuracion.query.filter_by(clave=self.CLAVE_VERSION).first()
+        if not version:
+            version = Configuracion(clave=self.CLAVE_VERSION)
+            db.session.add(version)
+        version.valor = uuid.uuid4().hex
+        db.session.info['configuracion_modificada'] = True
+
+    def descartar(self):
+        with self._lock:
+            self._valores = None
+
+
+# Segundos que cada proceso confía en su copia de la tabla Configuracion antes de revisar
+# si otro proceso (otro worker, scheduler.py) la cambió.
+config_cache = CacheConfiguracion(int(os.environ.get('CONFIG_CACHE_TTL', 60)))
+
+
+@event.listens_for(SessionBase, 'after_commit')
+def _descartar_configuracion_tras_commit(session):
+    if session.info.pop('configuracion_modificada', None):
+        config_cache.descartar()
+
+
+@event.listens_for(SessionBase, 'after_soft_rollback')
+def _olvidar_configuracion_tras_rollback(session, previous_transaction):
+    session.info.pop('configuracion_modificada', None)
@@ -1,56 +1,266 @@
-import pywhatkit
+import os
+import sys
+import time
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, timedelta
-from apscheduler.schedulers.blocking import BlockingScheduler
-from app import app, db, Cuota, Cliente, Configuracion # Importamos desde nuestra app
+from sqlalchemy import insert
+from sqlalchemy.orm import joinedload
+# Solo las tablas y la conexión: el scheduler no necesita las rutas ni el login de la app web
+from modelos import crear_app_datos, db, Cuota, Prestamo, Configuracion, Recordatorio, config_cache
 
-def enviar_recordatorios():
+app = crear_app_datos()
+
+# Cuántos recordatorios actualizamos por cada commit al terminar de enviar
+TAMANO_LOTE_COMMIT = 100
+# Intentos de envío antes de dar un recordatorio por 'fallido'
+MAX_INTENTOS = 3
+# Fila de Configuracion con la última fecha de vencimiento ya revisada (marca de agua)
+CLAVE_MARCA_AGUA = 'recordatorios_marca_agua'
+
+
+# --- TRANSPORTES ---
+# Un transporte sabe enviar UN mensaje. Declara cuántos envíos simultáneos soporta
+# y cuántos por minuto permite el proveedor; el despachador respeta ambos límites.
+
+class Transporte(ABC):
+    nombre = 'base'
+    max_concurrencia = 1
+    mensajes_por_minuto = 60
+
+    @abstractmethod
+    def enviar(self, telefono, mensaje):
+        """ Envía un mensaje; lanza una excepción si no se pudo (el despachador la registra). """
+
+
+class TransporteWhatsApp(Transporte):
+    """ WhatsApp Web vía pywhatkit. Maneja el navegador, así que solo admite un envío a la vez. """
+    nombre = 'whatsapp'
+    max_concurrencia = 1
+    mensajes_por_minuto = 4 # wait_time=15 + cierre de pestaña
+
+    def enviar(self, telefono, mensaje):
+        import pywhatkit # Importación perezosa: pywhatkit revisa la conexión al importarse
+        # Nota: El teléfono debe tener el código del país, ej: +573001234567
+        pywhatkit.sendwhatmsg_instantly(f"+{telefono}", mensaje, wait_time=15, tab_close=True)
+
+
+class TransporteFalso(Transporte):
+    """ No envía nada: guarda los mensajes y simula la latencia del proveedor. Para pruebas sin conexión. """
+    nombre = 'falso'
+
+    def __init__(self, latencia=0.05, max_concurrencia=20, mensajes_por_minuto=6000, fallar_cada=0):
+        self.latencia = latencia
+        self.max_concurrencia = max_concurrencia
+        self.mensajes_por_minuto = mensajes_por_minuto
+        self.fallar_cada = fallar_cada
+        self.enviados = []
+        self._lock = threading.Lock()
+
+    def enviar(self, telefono, mensaje):
+        time.sleep(self.latencia)
+        with self._lock:
+            self.enviados.append((telefono, mensaje))
+            if self.fallar_cada and len(self.enviados) % self.fallar_cada == 0:
+                raise RuntimeError("Fallo simulado del transporte")
+
+
+TRANSPORTES = {'whatsapp': TransporteWhatsApp, 'falso': TransporteFalso}
+
+
+class LimitadorTasa:
+    """ Cubeta de fichas: permite ráfagas cortas y como máximo `por_minuto` envíos sostenidos. """
+
+    def __init__(self, por_minuto, rafaga=None):
+        self.tasa = por_minuto / 60.0
+        self.capacidad = rafaga or max(1, por_minuto // 60)
+        self.fichas = self.capacidad
+        self.ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self.fichas = min(self.capacidad, self.fichas + (ahora - self.ultimo) * self.tasa)
+                self.ultimo = ahora
+                if self.fichas >= 1:
+                    self.fichas -= 1
+                    return
+                espera = (1 - self.fichas) / self.tasa
+            time.sleep(espera)
+
+
+# --- DESPACHADOR ---
+
+def despachar(mensajes, transporte, hilos=8):
+    """
+    Envía [(id, telefono, mensaje), ...] con un pool acotado de hilos y el límite de
+    tasa del transporte. Los hilos no tocan la base de datos. Devuelve (enviados, errores)
+    con los ids enviados y los (id, error).
+    """
+    limitador = LimitadorTasa(transporte.mensajes_por_minuto)
+    enviados, errores = [], []
+    lock = threading.Lock()
+
+    def enviar_uno(mensaje_id, telefono, mensaje):
+        limitador.esperar()
+        try:
+            transporte.enviar(telefono, mensaje)
+            with lock:
+                enviados.append(mensaje_id)
+        except Exception as e:
+            with lock:
+                errores.append((mensaje_id, str(e)))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(hilos, transporte.max_concurrencia))) as pool:
+        for mensaje_id, telefono, mensaje in mensajes:
+            pool.submit(enviar_uno, mensaje_id, telefono, mensaje)
+    return enviados, errores
+
+
+def armar_mensaje(plantilla, cliente, cuota):
+    # Rellenamos la plantilla con los datos
+    mensaje = plantilla.replace('[cliente]', cliente.nombre_completo)
+    mensaje = mensaje.replace('[monto_cuota]', str(int(cuota.monto_cuota)))
+    return mensaje.replace('[fecha_vencimiento]', cuota.fecha_vencimiento.strftime('%d/%m/%Y'))
+
+
+# --- BANDEJA DE SALIDA ---
+# 1. encolar_recordatorios revisa las cuotas vencidas desde la marca de agua hasta ayer
+#    (así se pone al día si el job estuvo caído) y guarda un Recordatorio por cuota y día.
+#    La marca de agua avanza en la misma transacción, así que nada se encola dos veces.
+# 2. procesar_bandeja envía los recordatorios pendientes y registra envíos y reintentos.
+# Cuota.estado no se modifica.
+
+def leer_marca_agua():
+    valor = db.session.query(Configuracion.valor).filter_by(clave=CLAVE_MARCA_AGUA).scalar()
+    return date.fromisoformat(valor) if valor else None
+
+
+def guardar_marca_agua(fecha):
+    fila = Configuracion.query.filter_by(clave=CLAVE_MARCA_AGUA).first()
+    if not fila:
+        fila = Configuracion(clave=CLAVE_MARCA_AGUA)
+        db.session.add(fila)
+    fila.valor = fecha.isoformat()
+
+
+def encolar_recordatorios(hoy=None):
+    """ Encola un recordatorio por cada cuota pendiente vencida después de la marca de agua. Devuelve cuántos. """
+    hoy = hoy or date.today()
+    fecha_ayer = hoy - timedelta(days=1)
+    # Sin marca (primera ejecución) revisamos solo lo que venció ayer, como antes
+    marca = leer_marca_agua() or fecha_ayer - timedelta(days=1)
+    if marca >= fecha_ayer:
+        print("No hay fechas nuevas por revisar.")
+        return 0
+
+    plantilla = config_cache.obtener('whatsapp_template')
+    if not plantilla:
+        # No movemos la marca: cuando haya plantilla se revisará todo el rango pendiente
+        print("No hay plantilla de WhatsApp configurada. Abortando.")
+        return 0
+
+    # Rango indexado por (estado, fecha_vencimiento), con préstamo y cliente en la misma consulta
+    cuotas_atrasadas = Cuota.query.filter(
+        Cuota.estado == 'pendiente',
+        Cuota.fecha_vencimiento > marca,
+        Cuota.fecha_vencimiento <= fecha_ayer,
+    ).options(joinedload(Cuota.prestamo).joinedload(Prestamo.cliente)).order_by(Cuota.fecha_vencimiento).all()
+
+    ya_encolados = {cuota_id for (cuota_id,) in db.session.query(Recordatorio.cuota_id).filter(
+        Recordatorio.fecha == hoy, Recordatorio.cuota_id.in_([c.id for c in cuotas_atrasadas]))}
+
+    nuevos = []
+    for cuota in cuotas_atrasadas:
+        cliente = cuota.prestamo.cliente
+        if cuota.id in ya_encolados:
+            continue
+        if cliente.telefono:
+            nuevos.append({'cuota_id': cuota.id, 'fecha': hoy, 'telefono': cliente.telefono,
+                           'mensaje': armar_mensaje(plantilla, cliente, cuota),
+                           'estado': 'pendiente', 'intentos': 0, 'fecha_creacion': datetime.utcnow()})
+        else:
+            print(f"Cliente {cliente.nombre_completo} no tiene teléfono registrado.")
+
+    if nuevos:
+        db.session.execute(insert(Recordatorio), nuevos)
+    guardar_marca_agua(fecha_ayer)
+    db.session.commit()
+    print(f"Revisadas las fechas {marca + timedelta(days=1)} a {fecha_ayer}: {len(nuevos)} recordatorios encolados.")
+    return len(nuevos)
+
+
+def procesar_bandeja(transporte, hilos):
+    """ Envía los recordatorios pendientes (nuevos y reintentos). Devuelve (enviados, errores). """
+    # Si la cuota ya se pagó (o se reestructuró) mientras esperaba, el recordatorio ya no aplica.
+    # Partimos de la bandeja (ix_recordatorio_estado) y no de las cuotas pagadas, que solo crecen.
+    descartados = [rid for (rid,) in db.session.query(Recordatorio.id).join(Cuota, Recordatorio.cuota_id == Cuota.id)
+                   .filter(Recordatorio.estado == 'pendiente', Cuota.estado != 'pendiente')]
+    if descartados:
+        Recordatorio.query.filter(Recordatorio.id.in_(descartados))\
+            .update({'estado': 'descartado'}, synchronize_session=False)
+    db.session.commit()
+
+    pendientes = Recordatorio.query.filter_by(estado='pendiente').order_by(Recordatorio.id).all()
+    if not pendientes:
+        print("No hay recordatorios pendientes en la bandeja.")
+        return [], []
+
+    print(f"Se encontraron {len(pendientes)} recordatorios para enviar.")
+    inicio = time.monotonic()
+    enviados, errores = despachar([(r.id, r.telefono, r.mensaje) for r in pendientes], transporte, hilos)
+    duracion = time.monotonic() - inicio
+    print(f"Enviados {len(enviados)} de {len(pendientes)} mensajes por '{transporte.nombre}' "
+          f"en {duracion:.1f}s ({len(enviados) / duracion if duracion else 0:.1f} msg/s).")
+
+    # Registramos el resultado en lotes: un UPDATE para los enviados y un commit por lote
+    for desde in range(0, len(enviados), TAMANO_LOTE_COMMIT):
+        lote = enviados[desde:desde + TAMANO_LOTE_COMMIT]
+        Recordatorio.query.filter(Recordatorio.id.in_(lote)).update({
+            'estado': 'enviado', 'fecha_envio': datetime.utcnow(), 'intentos': Recordatorio.intentos + 1,
+        }, synchronize_session=False)
+        db.session.commit()
+
+    por_id = {r.id: r for r in pendientes}
+    for numero, (recordatorio_id, error) in enumerate(errores, start=1):
+        print(f"Error enviando el recordatorio {recordatorio_id}: {error}")
+        recordatorio = por_id[recordatorio_id]
+        recordatorio.intentos += 1
+        recordatorio.ultimo_error = error
+        if recordatorio.intentos >= MAX_INTENTOS:
+            recordatorio.estado = 'fallido'
+        if numero % TAMANO_LOTE_COMMIT == 0:
+            db.session.commit()
+    db.session.commit()
+    return enviados, errores
+
+
+def enviar_recordatorios(transporte=None, hilos=None):
     print(f"[{datetime.now()}] --- Ejecutando tarea de recordatorios ---")
+    transporte = transporte or TRANSPORTES[os.environ.get('RECORDATORIOS_TRANSPORTE', 'whatsapp')]()
+    hilos = hilos or int(os.environ.get('RECORDATORIOS_HILOS', 8))
     with app.app_context():
-        # Buscamos cuotas que vencieron AYER y siguen pendientes
-        fecha_ayer = date.today() - timedelta(days=1)
-        cuotas_atrasadas = Cuota.query.filter_by(estado='pendiente', fecha_vencimiento=fecha_ayer).all()
-
-        if not cuotas_atrasadas:
-            print("No se encontraron cuotas atrasadas para notificar.")
-            return
-
-        template_obj = Configuracion.query.filter_by(clave='whatsapp_template').first()
-        if not template_obj or not template_obj.valor:
-            print("No hay plantilla de WhatsApp configurada. Abortando.")
-            return
-
-        plantilla = template_obj.valor
-        print(f"Se encontraron {len(cuotas_atrasadas)} cuotas para notificar.")
-
-        for cuota in cuotas_atrasadas:
-            cliente = cuota.prestamo.cliente
-            if cliente.telefono:
-                try:
-                    # Rellenamos la plantilla con los datos
-                    mensaje = plantilla.replace('[cliente]', cliente.nombre_completo)
-                    mensaje = mensaje.replace('[monto_cuota]', str(int(cuota.monto_cuota)))
-                    mensaje = mensaje.replace('[fecha_vencimiento]', cuota.fecha_vencimiento.strftime('%d/%m/%Y'))
-
-                    # ¡Enviamos el mensaje!
-                    # Nota: El teléfono debe tener el código del país, ej: +573001234567
-                    pywhatkit.sendwhatmsg_instantly(f"+{cliente.telefono}", mensaje, wait_time=15)
-
-                    print(f"Mensaje enviado a {cliente.nombre_completo} ({cliente.telefono})")
-
-                    # Opcional: Marcar la cuota como 'atrasada' para no notificar de nuevo
-                    cuota.estado = 'atrasada'
-                    db.session.commit()
-                except Exception as e:
-                    print(f"Error enviando mensaje a {cliente.nombre_completo}: {e}")
-            else:
-                print(f"Cliente {cliente.nombre_completo} no tiene teléfono registrado.")
-
-# Programamos la tarea para que se ejecute todos los días a las 9:00 AM
-scheduler = BlockingScheduler(timezone="America/Bogota")
-scheduler.add_job(enviar_recordatorios, 'cron', hour=9, minute=0)
-
-print("Scheduler iniciado. Presiona Ctrl+C para detener.")
-try:
-    scheduler.start()
-except (KeyboardInterrupt, SystemExit):
-    pass
\ No newline at end of file
+        encolar_recordatorios()
+        procesar_bandeja(transporte, hilos)
+
+
+if __name__ == '__main__':
+    from apscheduler.schedulers.blocking import BlockingScheduler
+
+    # 'python scheduler.py --ahora' ejecuta la tarea una sola vez (útil con RECORDATORIOS_TRANSPORTE=falso)
+    if '--ahora' in sys.argv:
+        enviar_recordatorios()
+        sys.exit(0)
+
+    # Programamos la tarea para que se ejecute todos los días a las 9:00 AM
+    scheduler = BlockingScheduler(timezone="America/Bogota")
+    scheduler.add_job(enviar_recordatorios, 'cron', hour=9, minute=0)
+
+    print("Scheduler iniciado. Presiona Ctrl+C para detener.")
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
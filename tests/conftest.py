@@ -0,0 +1,57 @@
+# tests/conftest.py
+# Las pruebas corren contra una base SQLite temporal llena con generar-datos.py, nunca contra
+# la base del .env. La app se crea una sola vez por sesión (app.app se arma en su primer uso).
+#
+#   pip install -r requirements-dev.txt
+#   python -m pytest -q
+import os
+import sys
+import random
+import importlib.util
+from datetime import date
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+CLIENTES_DE_PRUEBA = 60
+PASSWORD_DE_PRUEBA = 'bench123' # la de los usuarios bench_* de generar-datos.py
+
+
+def cargar_script(nombre):
+    """ Importa un script de la raíz cuyo nombre lleva guion (generar-datos.py, benchmark-rutas.py). """
+    spec = importlib.util.spec_from_file_location(nombre.replace('-', '_'), os.path.join(RAIZ, f'{nombre}.py'))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def iniciar_sesion(app, username):
+    """ Cliente de pruebas con la sesión de `username` ya iniciada. """
+    cliente = app.test_client()
+    respuesta = cliente.post('/login', data={'username': username, 'password': PASSWORD_DE_PRUEBA})
+    assert respuesta.status_code == 302
+    return cliente
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """ La app de PrestApp sobre una base SQLite nueva con datos sintéticos (usuarios bench_*). """
+    directorio = tmp_path_factory.mktemp('base')
+    os.environ.update({
+        'DB_ENGINE': 'sqlite',
+        'DB_SQLITE_PATH': str(directorio / 'prestapp.db'),
+        'SECRET_KEY': 'pruebas',
+        'ESTADO_RAFAGA': '1000000', # todas las peticiones vienen de la misma IP
+    })
+    os.environ.pop('DB_REPLICA_SQLITE_PATH', None)
+
+    import app as modulo_app
+    generar_datos = cargar_script('generar-datos')
+    with modulo_app.app.app_context():
+        modulo_app.db.create_all()
+        random.seed(42)
+        generar_datos.generar(CLIENTES_DE_PRUEBA, 2, PASSWORD_DE_PRUEBA, date.today())
+        modulo_app.db.session.remove()
+    return modulo_app.app
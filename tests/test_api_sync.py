@@ -0,0 +1,41 @@
+# tests/test_api_sync.py
+# /api/sync con cursor: cada préstamo que viene en la respuesta trae todas sus cuotas, porque el
+# teléfono reemplaza las que tiene.
+from datetime import datetime
+
+from conftest import iniciar_sesion
+from app import db, Usuario, Prestamo, Cuota
+
+
+def elegir_cuota_pendiente(app):
+    with app.app_context():
+        cuota, username = db.session.query(Cuota, Usuario.username).join(Prestamo, Cuota.prestamo_id == Prestamo.id)\
+            .join(Usuario, Prestamo.usuario_id == Usuario.id)\
+            .filter(Cuota.estado == 'pendiente', Usuario.rol == 'cobrador').order_by(Cuota.id).first()
+        total = Cuota.query.filter_by(prestamo_id=cuota.prestamo_id).count()
+        datos = cuota.id, cuota.prestamo_id, total, username
+        db.session.remove()
+    return datos
+
+
+def test_pago_reenvia_el_prestamo_con_todas_sus_cuotas(app):
+    cuota_id, prestamo_id, total_cuotas, username = elegir_cuota_pendiente(app)
+    cliente = iniciar_sesion(app, username)
+    cursor = datetime.utcnow().isoformat()
+
+    respuesta = cliente.post('/api/sync', json={'cursor': cursor, 'pagos': [{'cuota_id': cuota_id}]})
+    assert respuesta.status_code == 200
+    delta = respuesta.get_json()
+    assert delta['pagos'][0]['ok']
+    assert [p['id'] for p in delta['prestamos']] == [prestamo_id]
+    assert len(delta['cuotas']) == total_cuotas > 1
+    assert {c['prestamo_id'] for c in delta['cuotas']} == {prestamo_id}
+
+
+def test_cursor_con_zona_horaria(app):
+    _, _, _, username = elegir_cuota_pendiente(app)
+    cliente = iniciar_sesion(app, username)
+    futuro = cliente.get('/api/sync', query_string={'cursor': '2999-01-01T05:00:00+05:00'})
+    assert futuro.status_code == 200
+    assert futuro.get_json()['cursor'] == '2999-01-01T00:00:00' # convertido a UTC sin zona
+    assert futuro.get_json()['prestamos'] == []
@@ -0,0 +1,15 @@
+# tests/test_benchmark_rutas.py
+# Corre benchmark-rutas.py sobre la base de prueba y exige sus umbrales de consultas SQL. Los de
+# latencia dependen de la máquina y se quedan en el script.
+from conftest import cargar_script
+
+benchmark_rutas = cargar_script('benchmark-rutas')
+
+
+def test_consultas_por_ruta_dentro_de_los_umbrales(app):
+    resultados = benchmark_rutas.medir(repeticiones=2, calentamiento=1, password=benchmark_rutas.PASSWORD_POR_DEFECTO)
+    assert set(resultados) == set(benchmark_rutas.UMBRALES)
+    excedidas = {ruta: (max(medidas['consultas']), benchmark_rutas.UMBRALES[ruta][1])
+                 for ruta, medidas in resultados.items()
+                 if max(medidas['consultas']) > benchmark_rutas.UMBRALES[ruta][1]}
+    assert not excedidas, f"ruta: (consultas, umbral) {excedidas}"
@@ -0,0 +1,31 @@
+# tests/test_cache_usuarios.py
+# La copia en caché de un usuario se descarta al hacer commit de su cambio, no antes: si no, otra
+# petición en la misma ventana recargaría la fila vieja (rol, contraseña) y la serviría todo el TTL.
+import pytest
+
+from app import db, Usuario, usuarios_cache
+
+
+@pytest.fixture
+def usuario(app, monkeypatch):
+    monkeypatch.setattr(usuarios_cache, 'ttl', 300)
+    with app.app_context():
+        usuario_id = db.session.query(Usuario.id).filter_by(username='bench_admin').scalar()
+        usuarios_cache.descartar(usuario_id)
+        usuarios_cache.obtener(usuario_id) # la copia en caché queda fuera de la sesión
+        yield db.session.get(Usuario, usuario_id)
+        db.session.remove()
+
+
+def test_invalidar_descarta_la_copia_al_hacer_commit(usuario):
+    usuarios_cache.invalidar(usuario)
+    assert usuario.id in usuarios_cache._usuarios # todavía no se confirmó el cambio
+    db.session.commit()
+    assert usuario.id not in usuarios_cache._usuarios
+
+
+def test_rollback_conserva_la_copia(usuario):
+    usuarios_cache.invalidar(usuario)
+    db.session.rollback()
+    db.session.commit()
+    assert usuario.id in usuarios_cache._usuarios
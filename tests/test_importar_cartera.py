@@ -0,0 +1,22 @@
+# tests/test_importar_cartera.py
+# Actualizar clientes con el CSV usa un UPDATE masivo, que no pasa por el ORM: la página de
+# /estado en caché se descarta igual al hacer commit.
+import io
+
+from conftest import iniciar_sesion
+from app import db, Cliente, Prestamo
+
+
+def test_importar_actualiza_la_pagina_de_estado(app):
+    with app.app_context():
+        cedula = db.session.query(Cliente.cedula).join(Prestamo, Prestamo.cliente_id == Cliente.id)\
+            .filter(Prestamo.estado == 'activo').order_by(Cliente.id.desc()).first()[0]
+        db.session.remove()
+    publico = app.test_client()
+    assert 'Nombre Importado' not in publico.post('/estado', data={'cedula': cedula}).get_data(as_text=True)
+
+    archivo = io.BytesIO(f"cedula,nombre_completo\n{cedula},Nombre Importado\n".encode())
+    respuesta = iniciar_sesion(app, 'bench_admin').post('/admin/importar', data={'archivo': (archivo, 'clientes.csv')})
+    assert respuesta.status_code == 200
+
+    assert 'Nombre Importado' in publico.post('/estado', data={'cedula': cedula}).get_data(as_text=True)
@@ -0,0 +1,51 @@
+# tests/test_pagos_lote.py
+# /api/cuotas/pagar: los pagos de otro monto compensan la diferencia en la última cuota pendiente
+# de su préstamo, con las cuotas de ajuste cargadas en una sola consulta para todo el lote.
+from sqlalchemy import func
+
+from conftest import iniciar_sesion
+from app import db, Cuota
+
+
+def prestamos_con_pendientes(app, cantidad, minimo=3):
+    """ {prestamo_id: ids de sus cuotas pendientes por vencimiento} de `cantidad` préstamos. """
+    with app.app_context():
+        prestamo_ids = [pid for (pid,) in db.session.query(Cuota.prestamo_id).filter(Cuota.estado == 'pendiente')
+                        .group_by(Cuota.prestamo_id).having(func.count() >= minimo).order_by(Cuota.prestamo_id.desc())
+                        .limit(cantidad)]
+        pendientes = {pid: [c.id for c in Cuota.query.filter_by(prestamo_id=pid, estado='pendiente')
+                            .order_by(Cuota.fecha_vencimiento, Cuota.id)] for pid in prestamo_ids}
+        db.session.remove()
+    return pendientes
+
+
+def montos(app, ids):
+    with app.app_context():
+        valores = dict(db.session.query(Cuota.id, Cuota.monto_cuota).filter(Cuota.id.in_(ids)))
+        db.session.remove()
+    return valores
+
+
+def test_booleanos_no_son_ids_de_cuota(app):
+    respuesta = iniciar_sesion(app, 'bench_admin').post('/api/cuotas/pagar', json={'pagos': [{'cuota_id': True}]})
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()['resultados'][0] == {"cuota_id": True, "ok": False, "error": "Cuota no encontrada."}
+
+
+def test_pagos_de_otro_monto_ajustan_la_ultima_pendiente(app):
+    pendientes = prestamos_con_pendientes(app, 3)
+    a, b, c = pendientes.values()
+    antes = montos(app, a + b + c)
+    pagos = [
+        {'cuota_id': a[0], 'monto': antes[a[0]] + 1000}, # la diferencia se descuenta de la última
+        {'cuota_id': b[-1], 'monto': antes[b[-1]] + 500}, # paga la última: compensa la anterior
+        {'cuota_id': b[0], 'monto': antes[b[0]] - 200}, # la última ya está pagada: compensa la penúltima
+        {'cuota_id': c[0]}, # sin monto no se ajusta nada
+    ]
+    respuesta = iniciar_sesion(app, 'bench_admin').post('/api/cuotas/pagar', json={'pagos': pagos})
+    assert [r['ok'] for r in respuesta.get_json()['resultados']] == [True] * 4
+
+    despues = montos(app, a + b + c)
+    assert despues[a[-1]] == antes[a[-1]] - 1000
+    assert despues[b[-2]] == antes[b[-2]] - 500 + 200
+    assert [despues[i] for i in c] == [antes[i] for i in c]
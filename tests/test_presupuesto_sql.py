@@ -0,0 +1,57 @@
+# tests/test_presupuesto_sql.py
+# Con SQL_MODO_ESTRICTO una ruta que pasa su presupuesto de consultas (o repite una sentencia,
+# posible N+1) falla con PresupuestoConsultasExcedido en lugar de solo avisar en el log.
+import pytest
+
+from conftest import cargar_script, iniciar_sesion
+from app import db, PRESUPUESTO_CONSULTAS, PresupuestoConsultasExcedido
+
+benchmark_rutas = cargar_script('benchmark-rutas')
+
+
+@pytest.fixture
+def estricto(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'SQL_MODO_ESTRICTO', True)
+    monkeypatch.setitem(app.config, 'TESTING', True) # la excepción llega a la prueba en vez de un 500
+    return app
+
+
+@pytest.fixture
+def datos(app):
+    with app.app_context():
+        datos = benchmark_rutas.elegir_datos()
+        db.session.remove()
+    return datos
+
+
+def test_rutas_principales_dentro_del_presupuesto(estricto, datos):
+    clientes = {None: estricto.test_client(), 'admin': iniciar_sesion(estricto, 'bench_admin'),
+                'cobrador': iniciar_sesion(estricto, datos['cobrador'])}
+    for nombre, usuario, metodo, url, formulario in benchmark_rutas.escenarios(datos):
+        respuesta = clientes[usuario].open(url, method=metodo, data=formulario)
+        respuesta.get_data()
+        assert respuesta.status_code < 400, nombre
+
+
+def test_ruta_que_pasa_su_presupuesto_falla(estricto, datos, monkeypatch):
+    cliente = iniciar_sesion(estricto, 'bench_admin')
+    monkeypatch.setitem(PRESUPUESTO_CONSULTAS, 'detalle_prestamo', 1)
+    with pytest.raises(PresupuestoConsultasExcedido, match=r'detalle_prestamo.*presupuesto 1'):
+        cliente.get(f"/prestamo/{datos['prestamo_id']}")
+    # Las demás rutas siguen con su presupuesto
+    assert cliente.get(f"/api/prestamo/{datos['prestamo_id']}/cuotas").status_code == 200
+
+
+def test_sentencia_repetida_falla(estricto, datos, monkeypatch):
+    cliente = iniciar_sesion(estricto, 'bench_admin')
+    monkeypatch.setitem(estricto.config, 'SQL_MAX_REPETICIONES', 0)
+    with pytest.raises(PresupuestoConsultasExcedido, match='posible N\\+1'):
+        cliente.get('/admin/clientes')
+
+
+def test_sin_modo_estricto_solo_avisa(app, datos, monkeypatch, caplog):
+    cliente = iniciar_sesion(app, 'bench_admin')
+    monkeypatch.setitem(PRESUPUESTO_CONSULTAS, 'detalle_prestamo', 1)
+    respuesta = cliente.get(f"/prestamo/{datos['prestamo_id']}")
+    assert respuesta.status_code == 200
+    assert 'presupuesto 1' in caplog.text
@@ -0,0 +1,22 @@
+# tests/test_recordatorios.py
+# procesar_bandeja descarta los recordatorios pendientes de cuotas que ya no están pendientes.
+from datetime import date
+
+from app import db, Cuota, Recordatorio
+
+
+def test_descarta_los_de_cuotas_pagadas(app):
+    import scheduler # crea su app de datos al importarse: después de configurar la base de prueba
+    with app.app_context():
+        pagada = Cuota.query.filter(Cuota.estado != 'pendiente').order_by(Cuota.id).first()
+        pendiente = Cuota.query.filter_by(estado='pendiente').order_by(Cuota.id.desc()).first()
+        recordatorios = [Recordatorio(cuota_id=cuota.id, fecha=date(2000, 1, 1), telefono='573000000000', mensaje='x')
+                         for cuota in (pagada, pendiente)]
+        db.session.add_all(recordatorios)
+        db.session.commit()
+
+        transporte = scheduler.TransporteFalso(latencia=0)
+        scheduler.procesar_bandeja(transporte, hilos=1)
+        assert [db.session.get(Recordatorio, r.id).estado for r in recordatorios] == ['descartado', 'enviado']
+        assert len(transporte.enviados) == 1
+        db.session.remove()
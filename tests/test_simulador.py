@@ -0,0 +1,24 @@
+# tests/test_simulador.py
+# /api/simulador es público: los números que no son finitos o que desbordan el total se
+# rechazan antes de cotizar.
+import pytest
+
+from app import cotizar_prestamo
+
+BASE = '/api/simulador?plazo=2&frecuencia=diaria&fecha_inicio=2026-01-05'
+
+
+@pytest.mark.parametrize('parametros', ['monto=nan&interes=20', 'monto=500000&interes=nan', 'monto=inf&interes=20',
+                                        'monto=1e308&interes=20', 'monto=500000&interes=1e308',
+                                        'monto=500000&interes=20&cuota_manual=nan'])
+def test_numeros_invalidos_responden_400(app, parametros):
+    cotizar_prestamo.cache_clear()
+    respuesta = app.test_client().get(f'{BASE}&{parametros}')
+    assert respuesta.status_code == 400
+    assert cotizar_prestamo.cache_info().currsize == 0
+
+
+def test_cotizacion_valida(app):
+    respuesta = app.test_client().get(f'{BASE}&monto=500000&interes=20')
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()['total_a_pagar'] == 700000
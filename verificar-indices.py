@@ -0,0 +1,57 @@
+# verificar-indices.py
+# Revisa con EXPLAIN que las consultas más usadas de cuotas y préstamos usen índices.
+# Termina con código 1 si alguna hace un recorrido completo de la tabla.
+# Ejecútalo contra una base con datos reales (con tablas vacías MySQL puede preferir un full scan).
+import sys
+from datetime import date, timedelta
+from sqlalchemy import text
+from modelos import crear_app_datos, db, Cuota, Prestamo
+
+
+def consultas_criticas():
+    """ (nombre, consulta) de las rutas calientes; los valores son de ejemplo, lo que importa es el plan. """
+    ayer = date.today() - timedelta(days=1)
+    return [
+        ("editar_cuota: cuotas pendientes de un préstamo por vencimiento",
+         Cuota.query.filter(Cuota.prestamo_id == 1, Cuota.estado == 'pendiente')
+                    .order_by(Cuota.fecha_vencimiento.desc())),
+        ("scheduler: cuotas pendientes por fecha de vencimiento",
+         Cuota.query.filter(Cuota.estado == 'pendiente', Cuota.fecha_vencimiento <= ayer)),
+        ("dashboard: préstamos activos de un cobrador",
+         Prestamo.query.filter_by(usuario_id=1, estado='activo')),
+        ("estado: préstamo activo de un cliente",
+         Prestamo.query.filter_by(cliente_id=1, estado='activo')),
+    ]
+
+
+def _sql(consulta):
+    return str(consulta.statement.compile(dialect=db.engine.dialect, compile_kwargs={"literal_binds": True}))
+
+
+def plan_sin_indice(sql):
+    """ Devuelve las líneas del plan que recorren una tabla completa (lista vacía si todo usa índices). """
+    if db.engine.dialect.name == 'sqlite':
+        filas = db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+        # 'SCAN cuota' es un recorrido completo; 'SEARCH ... USING INDEX' o 'SCAN ... USING INDEX' no
+        return [fila[-1] for fila in filas if fila[-1].startswith('SCAN') and 'INDEX' not in fila[-1]]
+
+    filas = db.session.execute(text(f"EXPLAIN {sql}")).mappings().all()
+    # En MySQL type='ALL' significa full table scan
+    return [f"{fila['table']}: type=ALL" for fila in filas if fila['type'] == 'ALL']
+
+
+def verificar_indices():
+    with crear_app_datos().app_context():
+        fallas = 0
+        for nombre, consulta in consultas_criticas():
+            problemas = plan_sin_indice(_sql(consulta))
+            if problemas:
+                fallas += 1
+                print(f"[FALLA] {nombre}: {'; '.join(problemas)}")
+            else:
+                print(f"[OK]    {nombre}")
+        return fallas
+
+
+if __name__ == '__main__':
+    sys.exit(1 if verificar_indices() else 0)